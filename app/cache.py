@@ -0,0 +1,128 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict
+from typing import Any, Awaitable, Callable
+import threading
+import time
+
+
+class CacheBackend(ABC):
+    """Storage of a ResponseCache, subclass it to keep the entries elsewhere, e.g. in Redis.
+
+    Values are JSON-compatible data, so backends outside the process can
+    serialize them. get returns None for a missing or expired key.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Any | None:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        ...
+
+    @abstractmethod
+    def delete_prefix(self, prefix: str) -> None:
+        ...
+
+    def size(self) -> int | None:
+        return None
+
+
+class LRUCacheBackend(CacheBackend):
+    """In-process backend that evicts the least recently used entry beyond max_entries."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        # Key -> (expires at, value), least recently used first
+        self.entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete_prefix(self, prefix: str) -> None:
+        with self._lock:
+            for key in [key for key in self.entries if key.startswith(prefix)]:
+                del self.entries[key]
+
+    def size(self) -> int | None:
+        return len(self.entries)
+
+
+class ResponseCache:
+    """Read-through cache of endpoint responses, grouped in namespaces that are invalidated as a whole."""
+
+    def __init__(self, backend: CacheBackend | None = None, ttl: float = 300):
+        self.backend = backend or LRUCacheBackend()
+        self.ttl = ttl
+        self.hits: defaultdict[str, int] = defaultdict(int)
+        self.misses: defaultdict[str, int] = defaultdict(int)
+        # Bumped by invalidate, so a load that raced an invalidation is not cached
+        self._generations: defaultdict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def get_or_load(self, namespace: str, key: str, load: Callable[[], Any]) -> Any:
+        """Return the cached value of key, or load, cache and return it. Nothing is cached if load raises."""
+        cache_key = f"{namespace}:{key}"
+        value, generation = self._lookup(namespace, cache_key)
+        if generation is None:
+            return value
+        value = load()
+        self._store(namespace, cache_key, value, generation)
+        return value
+
+    async def get_or_load_async(self, namespace: str, key: str, load: Callable[[], Awaitable[Any]]) -> Any:
+        """get_or_load with a coroutine function as load."""
+        cache_key = f"{namespace}:{key}"
+        value, generation = self._lookup(namespace, cache_key)
+        if generation is None:
+            return value
+        value = await load()
+        self._store(namespace, cache_key, value, generation)
+        return value
+
+    def _lookup(self, namespace: str, cache_key: str) -> tuple[Any, int | None]:
+        """Return (value, None) on a hit, else (None, generation of the namespace) to store the loaded value with."""
+        value = self.backend.get(cache_key)
+        with self._lock:
+            if value is not None:
+                self.hits[namespace] += 1
+                return value, None
+            self.misses[namespace] += 1
+            return None, self._generations[namespace]
+
+    def _store(self, namespace: str, cache_key: str, value: Any, generation: int) -> None:
+        with self._lock:
+            if generation == self._generations[namespace]:
+                self.backend.set(cache_key, value, self.ttl)
+
+    def invalidate(self, *namespaces: str) -> None:
+        for namespace in namespaces:
+            with self._lock:
+                self._generations[namespace] += 1
+                self.backend.delete_prefix(f"{namespace}:")
+
+    def stats(self) -> dict:
+        with self._lock:
+            namespaces = sorted(set(self.hits) | set(self.misses))
+            return {
+                "backend": type(self.backend).__name__,
+                "ttl": self.ttl,
+                "entries": self.backend.size(),
+                "namespaces": {namespace: {"hits": self.hits[namespace], "misses": self.misses[namespace]} for namespace in namespaces},
+            }
@@ -0,0 +1,85 @@
+import argparse
+import logging
+import sys
+from manage_data.archive import ArchiveError, ingest_archive
+from manage_data.watcher import CpFolderWatcher
+from manage_data.orm import SessionLocal, rebuild_summaries, upgrade_schema
+from fastapi import HTTPException
+
+
+def ingest_archive_command(args: argparse.Namespace) -> int:
+    db = SessionLocal()
+    try:
+        with open(args.archive, "rb") as archive:
+            summary = ingest_archive(db, args.championship_id, archive, max_workers=args.workers)
+    except (ArchiveError, OSError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    except HTTPException as e:
+        print(f"error: {e.detail}", file=sys.stderr)
+        return 2
+    finally:
+        db.close()
+
+    for result in summary["files"]:
+        if result["state"] == "succeeded":
+            print(f"ok      {result['file_name']}: {result['actions_count']} actions, {result['action_lines_count']} action lines")
+        else:
+            print(f"failed  {result['file_name']}: {result['error']}")
+    print(f"{summary['succeeded']} succeeded, {summary['failed']} failed in {summary['elapsed_ms'] / 1000:.2f}s")
+    return 1 if summary["failed"] else 0
+
+
+def watch_command(args: argparse.Namespace) -> int:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    watcher = CpFolderWatcher(SessionLocal, args.championship_id, args.directory,
+                              interval=args.interval, debounce=args.debounce, max_delay=args.max_delay)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def upgrade_schema_command(args: argparse.Namespace) -> int:
+    upgrade_schema()
+    print("Schema is up to date")
+    return 0
+
+
+def rebuild_summaries_command(args: argparse.Namespace) -> int:
+    rebuild_summaries()
+    print("Standings and leaders rebuilt")
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="IHF championship data management commands.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = commands.add_parser("ingest-archive", help="Ingest a zip or tar archive of CP files into a championship.")
+    ingest.add_argument("championship_id", type=int)
+    ingest.add_argument("archive", help="Path of the .zip, .tar or .tar.gz archive.")
+    ingest.add_argument("--workers", type=int, default=None, help="Parser processes, defaults to one per CPU.")
+    ingest.set_defaults(func=ingest_archive_command)
+
+    watch = commands.add_parser("watch", help="Apply the CP files of a directory to a championship as they grow.")
+    watch.add_argument("championship_id", type=int)
+    watch.add_argument("directory")
+    watch.add_argument("--interval", type=float, default=0.1, help="Seconds between polls of the directory.")
+    watch.add_argument("--debounce", type=float, default=0.2, help="Seconds a file must stay unchanged before it is applied.")
+    watch.add_argument("--max-delay", type=float, default=0.7, help="Seconds after which a file that keeps changing is applied anyway.")
+    watch.set_defaults(func=watch_command)
+
+    upgrade = commands.add_parser("upgrade-schema", help="Add the columns, indexes and summary tables of this version to an existing database.")
+    upgrade.set_defaults(func=upgrade_schema_command)
+
+    rebuild = commands.add_parser("rebuild-summaries", help="Recompute the standings and leaders from the finished matches stored.")
+    rebuild.set_defaults(func=rebuild_summaries_command)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from fastapi import HTTPException
+import contextvars
+import threading
+import uuid
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+class IngestJobQueue:
+    """Runs ingest jobs on a bounded thread pool and keeps their status for polling.
+
+    Jobs with the same key (one CP feed, i.e. one match) run one after another in
+    submission order, jobs with different keys run in parallel. Jobs and their
+    ordering are per process: other workers neither see them nor wait for them.
+    """
+
+    def __init__(self, max_workers: int = 4, max_pending: int = 100, max_finished: int = 1000):
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        self.jobs: OrderedDict[str, dict] = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._lock = threading.Lock()
+        # Key -> jobs waiting for the running job of that key, the key is present while one runs
+        self._waiting: dict[tuple, deque] = {}
+
+    def submit(self, key: tuple, func, *args, **fields) -> dict:
+        """Queue func(job, *args), its returned dict is merged into the job when it succeeds."""
+        return self._submit(key, func, args, fields)
+
+    def run(self, key: tuple, func, *args, **fields) -> dict:
+        """Queue func(job, *args) like submit and wait for it, returning its result or raising its exception.
+
+        The job runs in the caller's context, so e.g. its queries count for the calling request.
+        """
+        future = Future()
+        context = contextvars.copy_context()
+        self._submit(key, lambda job, *args: context.run(func, job, *args), args, fields, future)
+        return future.result()
+
+    def _submit(self, key: tuple, func, args: tuple, fields: dict, future: Future | None = None) -> dict:
+        job = {
+            "id": uuid.uuid4().hex,
+            "state": "queued",
+            "created_at": datetime.now(timezone.utc),
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+            **fields,
+        }
+        with self._lock:
+            pending = sum(1 for queued in self.jobs.values() if queued["state"] == "queued")
+            if pending >= self.max_pending:
+                raise QueueFullError(f"{pending} ingest jobs are already waiting.")
+
+            self.jobs[job["id"]] = job
+            self._trim()
+            if key in self._waiting:
+                self._waiting[key].append((job, func, args, future))
+            else:
+                self._waiting[key] = deque()
+                self._executor.submit(self._run, key, job, func, args, future)
+        return job
+
+    def get(self, job_id: str) -> dict | None:
+        return self.jobs.get(job_id)
+
+    def _run(self, key: tuple, job: dict, func, args, future: Future | None = None) -> None:
+        job["state"] = "running"
+        job["started_at"] = datetime.now(timezone.utc)
+        try:
+            result = func(job, *args) or {}
+            job.update(result)
+            job["state"] = "succeeded"
+            if future:
+                future.set_result(result)
+        except Exception as e:
+            job["state"] = "failed"
+            job["error"] = str(e.detail) if isinstance(e, HTTPException) else str(e)
+            if future:
+                future.set_exception(e)
+        finally:
+            job["finished_at"] = datetime.now(timezone.utc)
+            # Start the next job of the same key, or release the key
+            with self._lock:
+                waiting = self._waiting[key]
+                if waiting:
+                    self._executor.submit(self._run, key, *waiting.popleft())
+                else:
+                    del self._waiting[key]
+
+    def _trim(self) -> None:
+        """Forget the oldest finished jobs beyond max_finished."""
+        finished = [job_id for job_id, job in self.jobs.items() if job["finished_at"]]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job_id]
@@ -0,0 +1,85 @@
+from collections import OrderedDict, deque
+import asyncio
+import threading
+
+
+class LiveHub:
+    """In-process pub/sub of live match events, fanned out to SSE subscribers without the database.
+
+    Ingests publish from worker threads, subscribers are asyncio queues read by
+    the streaming responses. The latest score and the last actions of each
+    match are kept so that new and reconnecting subscribers can catch up.
+    """
+
+    def __init__(self, buffer_size: int = 1000, max_matches: int = 256, queue_size: int = 1000):
+        self.buffer_size = buffer_size
+        self.max_matches = max_matches
+        self.queue_size = queue_size
+        # Match id -> {"score": latest score event or None, "actions": deque of (pos, action)}, least recently published first
+        self.matches: OrderedDict[int, dict] = OrderedDict()
+        # Match id -> {queue: loop} of its subscribers
+        self.subscribers: dict[int, dict[asyncio.Queue, asyncio.AbstractEventLoop]] = {}
+        self._lock = threading.Lock()
+
+    def publish(self, match_id: int, score: dict | None = None, actions: list[dict] | None = None) -> None:
+        """Record a match's new score and new or changed actions, and send them to its subscribers. Thread-safe."""
+        events = []
+        if score is not None:
+            events.append(("score", None, score))
+        events.extend(("action", action["Pos"], action) for action in actions or [])
+        if not events:
+            return
+
+        with self._lock:
+            recent = self.matches.get(match_id)
+            if recent is None:
+                recent = self.matches[match_id] = {"score": None, "actions": deque(maxlen=self.buffer_size)}
+                while len(self.matches) > self.max_matches:
+                    self.matches.popitem(last=False)
+            else:
+                self.matches.move_to_end(match_id)
+
+            if score is not None:
+                recent["score"] = score
+            recent["actions"].extend((pos, action) for _, pos, action in events if pos is not None)
+            subscribers = list(self.subscribers.get(match_id, {}).items())
+
+        for queue, loop in subscribers:
+            for event in events:
+                loop.call_soon_threadsafe(self._deliver, queue, event)
+
+    def _deliver(self, queue: asyncio.Queue, event: tuple) -> None:
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too slow a reader, end its stream, it resumes from its last Pos when it reconnects
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+    def subscribe(self, match_id: int) -> asyncio.Queue:
+        """Return a queue of (event, pos, data) tuples for a match, None ends the stream. Call from the event loop."""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self.subscribers.setdefault(match_id, {})[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, match_id: int, queue: asyncio.Queue) -> None:
+        with self._lock:
+            subscribers = self.subscribers.get(match_id, {})
+            subscribers.pop(queue, None)
+            if not subscribers:
+                self.subscribers.pop(match_id, None)
+
+    def latest_score(self, match_id: int) -> dict | None:
+        with self._lock:
+            recent = self.matches.get(match_id)
+            return recent["score"] if recent else None
+
+    def actions_after(self, match_id: int, pos: int) -> list[dict] | None:
+        """Return the buffered actions published after the one at pos, or None if the buffer does not reach back to it."""
+        with self._lock:
+            recent = self.matches.get(match_id)
+            if not recent or not recent["actions"] or pos < recent["actions"][0][0]:
+                return None
+            return [action for action_pos, action in recent["actions"] if action_pos > pos]
@@ -1,16 +1,120 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, Query, Header, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
 import schemas
 import utils
 import auth
-from manage_data.parser import CpFileParser
+from cache import LRUCacheBackend, ResponseCache
+from jobs import IngestJobQueue, QueueFullError
+from live import LiveHub
+from metrics import PoolCollector, QueryCountMiddleware, RequestMetricsMiddleware
+from profiling import ProfileStore
+from manage_data.archive import ArchiveError, ingest_archive
+from manage_data.watcher import CpFolderWatcher
+from manage_data.parser import CpFileParser, CpContinuityError, CpIncompleteLineError
 from manage_data.data_orm import Champ
-from manage_data.orm import SessionLocal, Team, Championship, Match, Player, RefereeInMatch, PlayerStats , TeamInChamp, User, Action
-from sqlalchemy.orm import Session , joinedload
+from manage_data.stats_query import aggregate_stats_query
+from manage_data.db_pool import pool_status
+from manage_data.query_counter import count_queries
+from manage_data.orm import AsyncSessionLocal, SessionLocal, async_engine, engine, FINISHED_MATCH_STATUSES, STATEMENT_TIMEOUT_MS, INGEST_STATEMENT_TIMEOUT_MS, Team, Championship, Match, Player, RefereeInMatch, PlayerStats , TeamInChamp, User, Action, TeamStanding, PlayerLeader
+from sqlalchemy import func, or_, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session , joinedload, selectinload
+from pydantic import TypeAdapter
+from contextlib import asynccontextmanager
+from datetime import date
+import asyncio
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+# SQL statements a request or an ingest job may run before it is logged, 0 for no limit
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "0"))
+INGEST_QUERY_BUDGET = int(os.getenv("INGEST_QUERY_BUDGET", "0"))
+# Debug mode sends the query count and database time of every request in X-DB-Queries and X-DB-Time-Ms
+DEBUG = os.getenv("DEBUG", "false").lower() in ("1", "true", "yes")
+# Watch folder applied by this process, so its changes reach the live streams and the response cache
+WATCH_DIR = os.getenv("WATCH_DIR")
+WATCH_CHAMPIONSHIP_ID = os.getenv("WATCH_CHAMPIONSHIP_ID")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run the watcher of WATCH_DIR in a thread for the lifetime of the app."""
+    stop = threading.Event()
+    watcher_thread = None
+    if WATCH_DIR:
+        if not WATCH_CHAMPIONSHIP_ID:
+            raise RuntimeError("Missing WATCH_CHAMPIONSHIP_ID in .env")
+        watcher = CpFolderWatcher(SessionLocal, int(WATCH_CHAMPIONSHIP_ID), WATCH_DIR, parser=parser,
+                                  interval=float(os.getenv("WATCH_INTERVAL", "0.1")), debounce=float(os.getenv("WATCH_DEBOUNCE", "0.2")),
+                                  max_delay=float(os.getenv("WATCH_MAX_DELAY", "0.7")), hub=live_hub, cache=response_cache)
+        watcher_thread = threading.Thread(target=watcher.run, args=(stop,), name="cp-watcher", daemon=True)
+        watcher_thread.start()
+    yield
+    stop.set()
+    if watcher_thread:
+        watcher_thread.join()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(RequestMetricsMiddleware)
+app.add_middleware(QueryCountMiddleware, headers=DEBUG, budget=QUERY_BUDGET)
+parser = CpFileParser(max_feeds=int(os.getenv("CP_PARSER_MAX_FEEDS", "64")))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Uploads larger than this are spooled to disk until their ingest job runs
+UPLOAD_SPOOL_SIZE = 4 * 1024 * 1024
+ingest_jobs = IngestJobQueue(max_workers=int(os.getenv("INGEST_WORKERS", "4")), max_pending=int(os.getenv("INGEST_MAX_PENDING", "100")))
+# Catalog responses (championships, teams, players), invalidated by the handlers and ingests that change them
+response_cache = ResponseCache(LRUCacheBackend(max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "1024"))), ttl=float(os.getenv("CACHE_TTL", "300")))
+# Live actions and scores of the matches ingested by this process
+live_hub = LiveHub()
+# Seconds between SSE keep-alive comments of an idle live stream
+LIVE_KEEPALIVE = 15
+# cProfile captures of uploads sent with X-Profile: true, or sampled at PROFILE_SAMPLE_RATE, kept in a ring buffer on disk
+profile_store = ProfileStore(os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "cp-profiles")),
+                             max_profiles=int(os.getenv("PROFILE_MAX", "20")), sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")))
+# Processes parsing the files of an archive upload, defaults to one per CPU
+ARCHIVE_PARSE_WORKERS = int(os.getenv("ARCHIVE_PARSE_WORKERS", "0")) or None
+
+
+async def cached_response(namespace: str, key: str, model, load):
+    """Serve a response from response_cache, on a miss await load and store its result serialized with its response model."""
+    async def load_serialized():
+        return jsonable_encoder(TypeAdapter(model).validate_python(await load(), from_attributes=True))
+    return await response_cache.get_or_load_async(namespace, key, load_serialized)
+
+async def keyset_page(db: AsyncSession, statement, column, limit: int, cursor: str | None) -> dict:
+    """Return the rows of statement after cursor in the order of a unique integer column, with the cursor of the next page."""
+    if cursor:
+        key = utils.decode_cursor(cursor)
+        if not key or len(key) != 1 or not isinstance(key[0], int):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        statement = statement.where(column > key[0])
+    # One extra row tells whether there is a next page
+    rows = (await db.scalars(statement.order_by(column).limit(limit + 1))).all()
+    next_cursor = utils.encode_cursor([getattr(rows[limit - 1], column.key)]) if len(rows) > limit else None
+    return {"items": rows[:limit], "next": next_cursor}
+
+def page_items(page: dict, response: Response) -> list:
+    """Return the items of a page and send the cursor of the next one in the X-Next-Cursor header."""
+    if page["next"]:
+        response.headers["X-Next-Cursor"] = page["next"]
+    return page["items"]
 
-app = FastAPI()
-parser = CpFileParser()
 # Dependency to get a DB session
-def get_db():
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Dependency to get a synchronous DB session, for the ingestion endpoints that run Champ in the threadpool
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
@@ -19,12 +123,13 @@ def get_db():
 
 # --- REGISTER ---
 @app.post("/auth/register", status_code=201, response_model=schemas.UserOut)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(User).filter(User.username == user.username).first()
+async def register(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
+    existing_user = await db.scalar(select(User).where(User.username == user.username))
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already exists")
 
-    hashed_pw = utils.hash_password(user.password)
+    # bcrypt is slow on purpose, keep it off the event loop
+    hashed_pw = await run_in_threadpool(utils.hash_password, user.password)
 
     new_user = User(
         first_name=user.first_name,
@@ -34,17 +139,17 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     )
 
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
 
     return new_user
 
 
 # --- LOGIN ---
 @app.post("/auth/login", response_model=schemas.Token)
-def login(login_data: schemas.UserLogin, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == login_data.username).first()
-    if not user or not utils.verify_password(login_data.password, user.password):
+async def login(login_data: schemas.UserLogin, db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(select(User).where(User.username == login_data.username))
+    if not user or not await run_in_threadpool(utils.verify_password, login_data.password, user.password):
         raise HTTPException(status_code=400, detail="Invalid username or password")
 
     token = auth.create_access_token(data={"sub": user.username})
@@ -52,64 +157,226 @@ def login(login_data: schemas.UserLogin, db: Session = Depends(get_db)):
 
 
 # --- UPLOAD CP FILE ---
-@app.post("/championships/{championship_id}/upload-cp-file/")
-async def upload_cp_file(championship_id: int, file: UploadFile = File(...), current_user: schemas.UserOut = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+def ingest_cp_file(job: dict, championship_id: int, file_name: str, spooled, profile: bool = False) -> dict:
+    """Ingest job: stream a spooled CP upload into the database with its own session."""
+    db = SessionLocal()
+    try:
+        with count_queries() as queries, profile_store.capture(profile, championship_id=championship_id, file_name=file_name, job_id=job["id"]) as captured:
+            champ = Champ(id=championship_id, session=db, hub=live_hub, cache=response_cache)
+            # Stream the upload, rows are stored while later sections are still being read
+            checkpoint = champ.load_checkpoint(file_name)
+            chunks = iter(lambda: spooled.read(UPLOAD_CHUNK_SIZE), b"")
+            rows, checkpoint = parser.parse_stream(chunks,file_name,championship_id,checkpoint)
+            try:
+                actions_count = champ.process_stream(rows, file_name, checkpoint)
+            except Exception:
+                # Release the feed before dropping its state, the next upload is parsed in full
+                rows.close()
+                parser.forget(championship_id, file_name)
+                raise
+
+        if INGEST_QUERY_BUDGET and queries.count > INGEST_QUERY_BUDGET:
+            logger.warning("Ingest of %s ran %d queries in %.1f ms, over the budget of %d",
+                           file_name, queries.count, queries.duration * 1000, INGEST_QUERY_BUDGET)
+        return {
+            "actions_count": actions_count,
+            "action_lines_count": checkpoint.get("action_lines_count", 0),
+            "timings": champ.stage_timings,
+            "skipped_stages": champ.stage_errors,
+            "rows": champ.row_counts,
+            "queries": queries.summary(),
+            "profile_id": captured["id"],
+        }
+    finally:
+        db.close()
+        spooled.close()
+
+
+@app.post("/championships/{championship_id}/upload-cp-file/", status_code=202, response_model=schemas.IngestJobOut)
+def upload_cp_file(championship_id: int, file: UploadFile = File(...), x_profile: bool = Header(False), current_user: schemas.UserOut = Depends(auth.get_current_user), db: Session = Depends(get_sync_db)):
+    championship = db.query(Championship).filter(Championship.id == championship_id).first()
+    if not championship:
+        raise HTTPException(status_code=404, detail=f"Championship '{championship_id}' not found.")
+
+    # Keep the upload once the request is over, the job reads it later
+    spooled = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_SIZE)
+    shutil.copyfileobj(file.file, spooled, UPLOAD_CHUNK_SIZE)
+    spooled.seek(0)
+
+    # Uploads of the same file (one match) are applied in order, other matches in parallel
+    try:
+        return ingest_jobs.submit((championship_id, file.filename), ingest_cp_file, championship_id, file.filename, spooled,
+                                  profile_store.should_profile(x_profile), championship_id=championship_id, file_name=file.filename)
+    except QueueFullError as e:
+        spooled.close()
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@app.get("/ingest-jobs/{job_id}", response_model=schemas.IngestJobOut)
+def get_ingest_job(job_id: str, current_user: schemas.UserOut = Depends(auth.get_current_user)):
+    job = ingest_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    return job
+
+
+# --- UPLOAD CP ARCHIVE ---
+@app.post("/championships/{championship_id}/upload-cp-archive/", response_model=schemas.ArchiveIngestOut)
+def upload_cp_archive(championship_id: int, file: UploadFile = File(...), current_user: schemas.UserOut = Depends(auth.get_current_user), db: Session = Depends(get_sync_db)):
     try:
-        champ = Champ(id=championship_id, session=db)
-        
+        return ingest_archive(db, championship_id, file.file, max_workers=ARCHIVE_PARSE_WORKERS, hub=live_hub, cache=response_cache)
+    except ArchiveError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# --- ADMIN ---
+@app.get("/admin/cache")
+def get_cache_stats(current_user: schemas.UserOut = Depends(auth.get_current_user)):
+    return response_cache.stats()
+
+@app.delete("/admin/cache")
+def clear_cache(current_user: schemas.UserOut = Depends(auth.get_current_user)):
+    response_cache.invalidate("championships", "teams", "players", "match_full")
+    return {"message": "Cache cleared"}
+
+@app.get("/admin/db-pool")
+def get_db_pool_stats(current_user: schemas.UserOut = Depends(auth.get_current_user)):
+    # The API's async engine and the ingestion's synchronous one each have their own pool
+    return {
+        "api": {**pool_status(async_engine.sync_engine), "statement_timeout_ms": STATEMENT_TIMEOUT_MS},
+        "ingest": {**pool_status(engine), "statement_timeout_ms": INGEST_STATEMENT_TIMEOUT_MS},
+    }
+
+@app.get("/admin/profiling")
+def get_profiling(current_user: schemas.UserOut = Depends(auth.get_current_user)):
+    return {"sample_rate": profile_store.sample_rate, "max_profiles": profile_store.max_profiles, "profiles": profile_store.list()}
+
+@app.put("/admin/profiling")
+def set_profiling(settings: schemas.ProfilingSettings, current_user: schemas.UserOut = Depends(auth.get_current_user)):
+    # Per process, each worker samples on its own
+    profile_store.sample_rate = settings.sample_rate
+    return {"sample_rate": profile_store.sample_rate, "max_profiles": profile_store.max_profiles}
+
+@app.get("/admin/profiles/{profile_id}")
+def get_profile(profile_id: str, format: str = Query("prof", pattern="^(prof|text)$"), limit: int = Query(50, ge=1, le=1000), current_user: schemas.UserOut = Depends(auth.get_current_user)):
+    path = profile_store.path(profile_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "text":
+        return PlainTextResponse(profile_store.summary(profile_id, limit))
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
+
+REGISTRY.register(PoolCollector({"api": async_engine.sync_engine, "ingest": engine}))
+
+@app.get("/metrics")
+def get_metrics():
+    # Prometheus text format: request latency per route, ingest stages, parser phases and the database pools
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+# --- UPLOAD CP FILE DELTA ---
+def ingest_cp_delta(job: dict, championship_id: int, file_name: str, since: int, actions_content: bytes, header_content: bytes | None, profile: bool) -> dict:
+    """Ingest job: apply the action lines appended to a CP file with its own session."""
+    db = SessionLocal()
+    try:
+        champ = Champ(id=championship_id, session=db, hub=live_hub, cache=response_cache)
+
         if not champ.champ_exists:
             raise HTTPException(status_code=404, detail=f"Championship '{championship_id}' not found.")
-        file_content = await file.read()
-        parsed_data = parser.parse(file_content,file.filename)
-        champ.process_data(parsed_data)
-        
-        return {"message": f"File uploaded and processed for championship '{championship_id}' successfully. , new actions count: {len(parsed_data['actions'])}"}
+        checkpoint = champ.load_checkpoint(file_name)
+        with profile_store.capture(profile, championship_id=championship_id, file_name=file_name, job_id=job["id"]) as captured:
+            try:
+                parsed_data, checkpoint = parser.parse_delta(actions_content, file_name, championship_id, since, checkpoint, header_content)
+            except CpContinuityError as e:
+                raise HTTPException(status_code=409, detail={"message": str(e), "expected_since": e.expected})
+            except CpIncompleteLineError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            try:
+                champ.process_data(parsed_data, file_name, checkpoint)
+            except Exception:
+                parser.forget(championship_id, file_name)
+                raise
+
+        return {
+            "message": f"Delta processed for '{file_name}' in championship '{championship_id}' successfully. , new actions count: {len(parsed_data['actions'])}",
+            "action_lines_count": checkpoint["action_lines_count"],
+            "timings": champ.stage_timings,
+            "skipped_stages": champ.stage_errors,
+            "profile_id": captured["id"],
+        }
     except HTTPException:
         raise
     except Exception as e:
         db.rollback()
-        raise HTTPException(status_code=500, detail=f"An error occurred while processing the file: {e}")
+        raise HTTPException(status_code=500, detail=f"An error occurred while processing the delta: {e}")
+    finally:
+        db.close()
+
+
+@app.post("/championships/{championship_id}/upload-cp-file/delta")
+def upload_cp_file_delta(championship_id: int, file_name: str = Form(...), since: int = Form(...), actions: UploadFile = File(...), header: UploadFile | None = File(None), x_profile: bool = Header(False), current_user: schemas.UserOut = Depends(auth.get_current_user)):
+    header_content = header.file.read() if header else None
+    actions_content = actions.file.read()
+    # Queued behind the full uploads of the same file in this process, and applied within the request
+    try:
+        return ingest_jobs.run((championship_id, file_name), ingest_cp_delta, championship_id, file_name, since, actions_content, header_content,
+                                profile_store.should_profile(x_profile), championship_id=championship_id, file_name=file_name)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
 
 # --- Championship Routes ---
 @app.get("/championships", response_model=list[schemas.ChampionshipOut])
-def get_championships(db: Session = Depends(get_db)):
-    return db.query(Championship).all()
+async def get_championships(response: Response, limit: int = Query(100, ge=1, le=1000), cursor: str | None = None,
+                            date_from: date | None = None, date_to: date | None = None, db: AsyncSession = Depends(get_db)):
+    async def load():
+        # Championships that overlap the date range
+        statement = select(Championship)
+        if date_from:
+            statement = statement.where(Championship.end_date >= date_from)
+        if date_to:
+            statement = statement.where(Championship.start_date <= date_to)
+        return await keyset_page(db, statement, Championship.id, limit, cursor)
+    page = await cached_response("championships", f"list:{limit}:{cursor}:{date_from}:{date_to}", schemas.Page[schemas.ChampionshipOut], load)
+    return page_items(page, response)
 
 @app.get("/championships/{championship_id}", response_model=schemas.ChampionshipOut)
-def get_championship_by_id(championship_id: int, db: Session = Depends(get_db)):
-    championship = db.query(Championship).filter(Championship.id == championship_id).first()
+async def get_championship_by_id(championship_id: int, db: AsyncSession = Depends(get_db)):
+    championship = await db.get(Championship, championship_id)
     if not championship:
         raise HTTPException(status_code=404, detail="Championship not found")
     return championship
 
 @app.get("/championships/name/{championship_name}", response_model=schemas.ChampionshipOut)
-def get_championship_by_name(championship_name: str, db: Session = Depends(get_db)):
-    championship = db.query(Championship).filter(Championship.name == championship_name).first()
-    if not championship:
-        raise HTTPException(status_code=404, detail="Championship not found")
-    return championship
+async def get_championship_by_name(championship_name: str, db: AsyncSession = Depends(get_db)):
+    async def load():
+        championship = await db.scalar(select(Championship).where(Championship.name == championship_name).limit(1))
+        if not championship:
+            raise HTTPException(status_code=404, detail="Championship not found")
+        return championship
+    return await cached_response("championships", f"name:{championship_name}", schemas.ChampionshipOut, load)
 
 @app.post("/championships", response_model=schemas.ChampionshipOut)
-def create_championship(championship: schemas.ChampionshipCreate, current_user: schemas.UserOut = Depends(auth.get_current_user), db: Session = Depends(get_db)):
-    existing = db.query(Championship).filter(Championship.name.ilike(championship.name)).first()
+async def create_championship(championship: schemas.ChampionshipCreate, current_user: schemas.UserOut = Depends(auth.get_current_user), db: AsyncSession = Depends(get_db)):
+    existing = await db.scalar(select(Championship).where(Championship.name.ilike(championship.name)).limit(1))
     if existing:
         raise HTTPException(status_code=400,detail=f"Championship '{championship.name}' already exists.")
     new_championship = Championship(**championship.dict())
     db.add(new_championship)
-    db.commit()
-    db.refresh(new_championship)
+    await db.commit()
+    response_cache.invalidate("championships")
+    await db.refresh(new_championship)
     return new_championship
 
 @app.put("/championships/{champ_id}", response_model=schemas.ChampionshipOut)
-def update_championship(champ_id: int,updated_champ: schemas.ChampionshipUpdate,current_user: schemas.UserOut = Depends(auth.get_current_user),db: Session = Depends(get_db)):
+async def update_championship(champ_id: int,updated_champ: schemas.ChampionshipUpdate,current_user: schemas.UserOut = Depends(auth.get_current_user),db: AsyncSession = Depends(get_db)):
     # Find the championship
-    champ = db.query(Championship).filter(Championship.id == champ_id).first()
+    champ = await db.get(Championship, champ_id)
     if not champ:
         raise HTTPException(status_code=404, detail="Championship not found.")
     # If updating name, check for conflicts
     if updated_champ.name:
-        conflict = db.query(Championship).filter(Championship.name.ilike(updated_champ.name),Championship.id != champ_id).first()
+        conflict = await db.scalar(select(Championship).where(Championship.name.ilike(updated_champ.name),Championship.id != champ_id).limit(1))
         if conflict:
             raise HTTPException(status_code=400,detail=f"Another championship with name '{updated_champ.name}' already exists.")
 
@@ -118,140 +385,310 @@ def update_championship(champ_id: int,updated_champ: schemas.ChampionshipUpdate,
         setattr(champ, field, value)
 
     # Save changes
-    db.commit()
-    db.refresh(champ)
+    await db.commit()
+    response_cache.invalidate("championships")
+    await db.refresh(champ)
     return champ
 
 
 @app.post("/championships/{champ_id}/teams",response_model=schemas.championshipout_linked,)
-def link_teams_to_championship(champ_id: int,team_ids: schemas.TeamIDs,current_user: schemas.UserOut = Depends(auth.get_current_user),db: Session = Depends(get_db)):
-    champ = db.query(Championship).filter(Championship.id == champ_id).first()
+async def link_teams_to_championship(champ_id: int,team_ids: schemas.TeamIDs,current_user: schemas.UserOut = Depends(auth.get_current_user),db: AsyncSession = Depends(get_db)):
+    champ = await db.get(Championship, champ_id)
     if not champ:
         raise HTTPException(status_code=404, detail="Championship not found.")
     for team_id in team_ids.team_ids:
-        team = db.query(Team).filter(Team.id == team_id).first()
+        team = await db.get(Team, team_id)
         if not team:
             raise HTTPException(status_code=404, detail=f"Team {team_id} not found.")
-        
+
         # Prevent duplicate links
-        exists = db.query(TeamInChamp).filter_by(
-            team_id=team_id, championship_id=champ_id
-        ).first()
+        exists = await db.get(TeamInChamp, (team_id, champ_id))
         if not exists:
             db.add(TeamInChamp(team_id=team_id, championship_id=champ_id))
 
-    champ= db.query(Championship).options(joinedload(Championship.teams)).filter(Championship.id == champ_id).first()
+    champ = await db.scalar(select(Championship).options(selectinload(Championship.teams)).where(Championship.id == champ_id).execution_options(populate_existing=True))
 
-    db.commit()
+    await db.commit()
+    response_cache.invalidate("teams")
     return champ
 
 @app.delete("/championships/{champ_id}")
-async def delete_championship(champ_id: int,current_user: schemas.UserOut = Depends(auth.get_current_user),db: Session = Depends(get_db)):
-    champ = db.query(Championship).filter(Championship.id == champ_id).first()
+async def delete_championship(champ_id: int,current_user: schemas.UserOut = Depends(auth.get_current_user),db: AsyncSession = Depends(get_db)):
+    champ = await db.get(Championship, champ_id)
     if not champ:
         raise HTTPException(status_code=404, detail="Championship not found.")
 
-    db.delete(champ)
-    db.commit()
+    # The ORM cascades load the matches and links to delete, which needs run_sync
+    await db.run_sync(lambda session: session.delete(champ))
+    await db.commit()
+    response_cache.invalidate("championships", "teams")
 
     return {"message": "Championship deleted successfully"}
 
 
+@app.get("/championships/{championship_id}/standings", response_model=list[schemas.StandingOut])
+async def get_standings(championship_id: int, db: AsyncSession = Depends(get_db)):
+    championship = await db.get(Championship, championship_id)
+    if not championship:
+        raise HTTPException(status_code=404, detail="Championship not found")
+
+    goal_difference = TeamStanding.goals_for - TeamStanding.goals_against
+    standings = (await db.scalars(
+        select(TeamStanding).options(joinedload(TeamStanding.team))
+        .where(TeamStanding.championship_id == championship_id, TeamStanding.played > 0)
+        .order_by(TeamStanding.points.desc(), goal_difference.desc(), TeamStanding.goals_for.desc())
+    )).all()
+    return [
+        {**{field: getattr(standing, field) for field in ("team", "played", "won", "drawn", "lost", "goals_for", "goals_against", "points")},
+         "goal_difference": standing.goals_for - standing.goals_against}
+        for standing in standings
+    ]
+
+@app.get("/championships/{championship_id}/leaders", response_model=list[schemas.LeaderOut])
+async def get_leaders(championship_id: int, stat: str = Query("goals", pattern="^(goals|efficiency|suspensions)$"), limit: int = Query(10, ge=1, le=100), min_matches: int = Query(1, ge=1), db: AsyncSession = Depends(get_db)):
+    championship = await db.get(Championship, championship_id)
+    if not championship:
+        raise HTTPException(status_code=404, detail="Championship not found")
+
+    efficiency = PlayerLeader.efficiency_sum / func.nullif(PlayerLeader.efficiency_matches, 0)
+    order_by = {
+        "goals": PlayerLeader.goals.desc(),
+        "efficiency": efficiency.desc().nulls_last(),
+        "suspensions": PlayerLeader.suspensions.desc(),
+    }[stat]
+    leaders = (await db.execute(
+        select(PlayerLeader, efficiency).options(joinedload(PlayerLeader.player))
+        .where(PlayerLeader.championship_id == championship_id, PlayerLeader.matches >= min_matches)
+        .order_by(order_by, PlayerLeader.player_id)
+        .limit(limit)
+    )).all()
+    return [
+        {"player_id": leader.player_id, "first_name": leader.player.first_name, "last_name": leader.player.last_name,
+         "team_id": leader.team_id, "matches": leader.matches, "goals": leader.goals,
+         "efficiency": round(player_efficiency, 2) if player_efficiency is not None else None, "suspensions": leader.suspensions}
+        for leader, player_efficiency in leaders
+    ]
+
+
+# --- Stats Routes ---
+@app.get("/stats/aggregate", response_model=list[schemas.StatAggregateOut])
+async def get_stats_aggregate(
+    stat: str,
+    source: str = Query("player", pattern="^(player|team)$"),
+    agg: str = Query("sum", pattern="^(sum|avg|max|min)$"),
+    group_by: str = Query("player", pattern="^(player|team|championship)$"),
+    filter: list[str] = Query([]),
+    championship_id: int | None = None,
+    team_id: int | None = None,
+    limit: int = Query(50, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+):
+    query = aggregate_stats_query(source, stat, agg, group_by, filter, championship_id=championship_id, team_id=team_id, limit=limit)
+    return [dict(row._mapping) for row in await db.execute(query)]
+
 
 # --- Team Routes ---
 @app.get("/teams", response_model=list[schemas.TeamOut])
-def get_teams(db: Session = Depends(get_db)):
-    return db.query(Team).all()
+async def get_teams(response: Response, limit: int = Query(100, ge=1, le=1000), cursor: str | None = None,
+                    championship_id: int | None = None, db: AsyncSession = Depends(get_db)):
+    async def load():
+        statement = select(Team)
+        if championship_id is not None:
+            statement = statement.join(TeamInChamp, TeamInChamp.team_id == Team.id).where(TeamInChamp.championship_id == championship_id)
+        return await keyset_page(db, statement, Team.id, limit, cursor)
+    page = await cached_response("teams", f"list:{limit}:{cursor}:{championship_id}", schemas.Page[schemas.TeamOut], load)
+    return page_items(page, response)
 
 @app.get("/teams/{team_id}", response_model=schemas.TeamOut)
-def get_team_by_id(team_id: int, db: Session = Depends(get_db)):
-    team = db.query(Team).filter(Team.id == team_id).first()
+async def get_team_by_id(team_id: int, db: AsyncSession = Depends(get_db)):
+    team = await db.get(Team, team_id)
     if not team:
         raise HTTPException(status_code=404, detail="Team not found")
     return team
 
 @app.get("/teams/abbreviation/{abbreviation}", response_model=schemas.TeamOut)
-def get_team_by_abbreviation(abbreviation: str, db: Session = Depends(get_db)):
-    team = db.query(Team).filter(Team.abbreviation == abbreviation).first()
-    if not team:
-        raise HTTPException(status_code=404, detail="Team not found")
-    return team
+async def get_team_by_abbreviation(abbreviation: str, db: AsyncSession = Depends(get_db)):
+    async def load():
+        team = await db.scalar(select(Team).where(Team.abbreviation == abbreviation))
+        if not team:
+            raise HTTPException(status_code=404, detail="Team not found")
+        return team
+    return await cached_response("teams", f"abbreviation:{abbreviation}", schemas.TeamOut, load)
 
 @app.post("/teams", response_model=schemas.TeamOut)
-def create_team(team: schemas.TeamCreate, current_user: schemas.UserOut = Depends(auth.get_current_user), db: Session = Depends(get_db)):
-    existing_team = db.query(Team).filter((Team.name.ilike(team.name)) | (Team.abbreviation.ilike(team.abbreviation))).first()
+async def create_team(team: schemas.TeamCreate, current_user: schemas.UserOut = Depends(auth.get_current_user), db: AsyncSession = Depends(get_db)):
+    existing_team = await db.scalar(select(Team).where((Team.name.ilike(team.name)) | (Team.abbreviation.ilike(team.abbreviation))).limit(1))
 
     if existing_team:
         raise HTTPException(status_code=400,detail=f"Team with name '{team.name}' or abbreviation '{team.abbreviation}' already exists.")
     new_team = Team(**team.dict())
     db.add(new_team)
-    db.commit()
-    db.refresh(new_team)
+    await db.commit()
+    response_cache.invalidate("teams")
+    await db.refresh(new_team)
     return new_team
 
+async def touch_team_matches(db: AsyncSession, team_id: int) -> None:
+    """Bump the version of the team's matches, whose responses embed its name and abbreviation."""
+    await db.execute(update(Match).where(or_(Match.team_a_id == team_id, Match.team_b_id == team_id)).values(version=Match.version + 1))
+
 @app.put("/teams/{team_id}", response_model=schemas.TeamOut)
-def update_team(team_id: int,updated_team: schemas.TeamUpdate,current_user: schemas.UserOut = Depends(auth.get_current_user),db: Session = Depends(get_db)):
+async def update_team(team_id: int,updated_team: schemas.TeamUpdate,current_user: schemas.UserOut = Depends(auth.get_current_user),db: AsyncSession = Depends(get_db)):
     # Fetch team by ID
-    team = db.query(Team).filter(Team.id == team_id).first()
+    team = await db.get(Team, team_id)
     if not team:
         raise HTTPException(status_code=404, detail="Team not found.")
 
     # If updating name or abbreviation, check for conflicts
     if updated_team.name or updated_team.abbreviation:
-        conflict = db.query(Team).filter(((Team.name.ilike(updated_team.name)) if updated_team.name else False) |
-            ((Team.abbreviation.ilike(updated_team.abbreviation)) if updated_team.abbreviation else False),Team.id != team_id).first()
+        conflict = await db.scalar(select(Team).where(((Team.name.ilike(updated_team.name)) if updated_team.name else False) |
+            ((Team.abbreviation.ilike(updated_team.abbreviation)) if updated_team.abbreviation else False),Team.id != team_id).limit(1))
         if conflict:
             raise HTTPException(status_code=400,detail="Another team already exists with that name or abbreviation.")
     # Apply updates
     for field, value in updated_team.dict(exclude_unset=True).items():
         setattr(team, field, value)
 
-    db.commit()
-    db.refresh(team)
+    await touch_team_matches(db, team_id)
+    await db.commit()
+    response_cache.invalidate("teams")
+    await db.refresh(team)
     return team
 
 @app.delete("/teams/{team_id}",response_model=schemas.TeamOut)
-def delete_team(team_id: int ,current_user: schemas.UserOut = Depends(auth.get_current_user),db: Session = Depends(get_db)):
-    team = db.query(Team).filter(Team.id == team_id).first()
+async def delete_team(team_id: int ,current_user: schemas.UserOut = Depends(auth.get_current_user),db: AsyncSession = Depends(get_db)):
+    team = await db.get(Team, team_id)
 
     if not team:
         raise HTTPException(status_code=404, detail="Team not found.")
 
-    db.delete(team)
-    db.commit()
+    await touch_team_matches(db, team_id)
+    # The ORM cascades load the players and links to delete, which needs run_sync
+    await db.run_sync(lambda session: session.delete(team))
+    await db.commit()
+    # Its players went with it
+    response_cache.invalidate("teams", "players")
     return team
 
 
 # --- Match Routes ---
 
 @app.get("/championships/{championship_id}/matches", response_model=list[schemas.MatchBaseOut])
-def get_matches_in_championship(championship_id: int, db: Session = Depends(get_db)):
+async def get_matches_in_championship(championship_id: int, response: Response, limit: int = Query(100, ge=1, le=1000), cursor: str | None = None,
+                                      status: str | None = None, team_id: int | None = None, db: AsyncSession = Depends(get_db)):
     # First, check if the championship exists to provide a clear error message
-    championship = db.query(Championship).filter(Championship.id == championship_id).first()
+    championship = await db.get(Championship, championship_id)
     if not championship:
         raise HTTPException(status_code=404, detail=f"Championship with id {championship_id} not found.")
 
-    # Query for all matches that have the given championship_id
-    matches = db.query(Match).filter(Match.championship_id == championship_id).all()
-    
-    return matches
-@app.get("/matches/{match_id}/score", response_model=schemas.MatchScoreOut)
-def get_match_score(match_id: int, db: Session = Depends(get_db)):
-    match = db.query(Match).filter(Match.id == match_id).first()
+    # Query for the matches that have the given championship_id, with both teams in the same query
+    statement = select(Match).options(joinedload(Match.team_a), joinedload(Match.team_b)).where(Match.championship_id == championship_id)
+    if status is not None:
+        statement = statement.where(Match.status == status)
+    if team_id is not None:
+        statement = statement.where((Match.team_a_id == team_id) | (Match.team_b_id == team_id))
+
+    return page_items(await keyset_page(db, statement, Match.id, limit, cursor), response)
+
+
+async def match_etag(match_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_db)) -> None:
+    """Answer If-None-Match from the match's version alone, before the endpoint loads anything.
+
+    The version and status are kept in request.state.match_version for the endpoint.
+    """
+    current = request.state.match_version = (await db.execute(select(Match.version, Match.status).where(Match.id == match_id))).first()
+    if current is None:
+        # The endpoint reports the missing match
+        return
+    etag = f'"{match_id}-{current.version}"'
+    client_etags = [tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")]
+    if etag in client_etags or "*" in client_etags:
+        raise HTTPException(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    # Cached copies are revalidated on every use
+    response.headers["Cache-Control"] = "no-cache"
+
+def match_with_teams(match_id: int):
+    return select(Match).options(joinedload(Match.team_a), joinedload(Match.team_b)).where(Match.id == match_id)
+
+@app.get("/matches/{match_id}/score", response_model=schemas.MatchScoreOut, dependencies=[Depends(match_etag)])
+async def get_match_score(match_id: int, db: AsyncSession = Depends(get_db)):
+    match = await db.scalar(match_with_teams(match_id))
     if not match:
         raise HTTPException(status_code=404, detail="Match not found")
     return match
 
-@app.get("/matches/{match_id}/stats", response_model=schemas.MatchStatesOut)
-def get_stats_in_match(match_id: int, db: Session = Depends(get_db)):
-    match = db.query(Match).filter(Match.id == match_id).first()
+def sse_event(event: str, data: dict, event_id: int | None = None) -> str:
+    id_line = f"id: {event_id}\n" if event_id is not None else ""
+    return f"event: {event}\n{id_line}data: {json.dumps(data)}\n\n"
+
+async def load_live_state(match_id: int, since_pos: int | None, need_score: bool) -> tuple[dict | None, list[dict]]:
+    """Read the score and the actions after since_pos of a match, for subscribers the hub cannot serve."""
+    async with AsyncSessionLocal() as db:
+        match = await db.get(Match, match_id)
+        if not match:
+            return None, []
+        score = {"match_id": match.id, "team_a_score": match.team_a_score, "team_b_score": match.team_b_score, "status": match.status} if need_score else {}
+        actions = []
+        if since_pos is not None:
+            rows = await db.scalars(select(Action).where(Action.match_id == match_id, Action.pos > since_pos).order_by(Action.pos))
+            actions = [action_out(action).dict() for action in rows]
+        return score, actions
+
+@app.get("/matches/{match_id}/live")
+async def live_match(match_id: int, request: Request, since_pos: int | None = None, last_event_id: str | None = Header(None)):
+    # A reconnecting EventSource sends the Pos of the last action it received
+    if last_event_id and last_event_id.isdigit():
+        since_pos = int(last_event_id)
+
+    # Subscribe before catching up, so nothing published in between is missed
+    queue = live_hub.subscribe(match_id)
+    score = live_hub.latest_score(match_id)
+    backlog = live_hub.actions_after(match_id, since_pos) if since_pos is not None else []
+    if score is None or backlog is None:
+        db_score, db_backlog = await load_live_state(match_id, since_pos if backlog is None else None, score is None)
+        if db_score is None:
+            live_hub.unsubscribe(match_id, queue)
+            raise HTTPException(status_code=404, detail="Match not found")
+        score = score or db_score
+        backlog = db_backlog if backlog is None else backlog
+
+    async def stream():
+        try:
+            yield sse_event("score", score)
+            sent = {}
+            for action in backlog:
+                sent[action["Pos"]] = action
+                yield sse_event("action", action, action["Pos"])
+
+            while not await request.is_disconnected():
+                try:
+                    item = await asyncio.wait_for(queue.get(), LIVE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if item is None:
+                    break
+                event, pos, data = item
+                # Already sent while catching up
+                if pos is not None and sent.pop(pos, None) == data:
+                    continue
+                yield sse_event(event, data, pos)
+        finally:
+            live_hub.unsubscribe(match_id, queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/matches/{match_id}/stats", response_model=schemas.MatchStatesOut, dependencies=[Depends(match_etag)])
+async def get_stats_in_match(match_id: int, db: AsyncSession = Depends(get_db)):
+    match = await db.scalar(match_with_teams(match_id))
     if not match:
         raise HTTPException(status_code=404, detail="Match not found ")
     return match
 
-@app.get("/matches/{match_id}/referees", response_model=list[schemas.RefereeWithRoleOut])
-def get_referees_in_match(match_id: int, db: Session = Depends(get_db)):
-    referees_in_match = db.query(RefereeInMatch).filter(RefereeInMatch.match_id == match_id).all()
+@app.get("/matches/{match_id}/referees", response_model=list[schemas.RefereeWithRoleOut], dependencies=[Depends(match_etag)])
+async def get_referees_in_match(match_id: int, db: AsyncSession = Depends(get_db)):
+    referees_in_match = (await db.scalars(select(RefereeInMatch).options(joinedload(RefereeInMatch.referee)).where(RefereeInMatch.match_id == match_id))).all()
     if not referees_in_match:
         raise HTTPException(status_code=404, detail="Referees not found for this match")
 
@@ -269,42 +706,132 @@ def get_referees_in_match(match_id: int, db: Session = Depends(get_db)):
 
 # --- Player Routes ---
 @app.get("/teams/{team_id}/players", response_model=list[schemas.PlayerOut])
-def get_players_by_team(team_id: int, db: Session = Depends(get_db)):
-    players = db.query(Player).filter(Player.team_id == team_id).all()
-    if not players:
-        raise HTTPException(status_code=404, detail="Players not found for this team")
-    return players
-
-@app.get("/matches/{match_id}/teams/{team_id}/players/stats", response_model=list[schemas.PlayerStatsOut])
-def get_players_stats_in_match_for_team(match_id: int, team_id: int, db: Session = Depends(get_db)):
-    player_stats = db.query(PlayerStats).filter(PlayerStats.match_id == match_id, PlayerStats.team_id == team_id).all()
+async def get_players_by_team(team_id: int, response: Response, limit: int = Query(100, ge=1, le=1000), cursor: str | None = None, db: AsyncSession = Depends(get_db)):
+    async def load():
+        page = await keyset_page(db, select(Player).where(Player.team_id == team_id), Player.id, limit, cursor)
+        if not page["items"] and not cursor:
+            raise HTTPException(status_code=404, detail="Players not found for this team")
+        return page
+    page = await cached_response("players", f"team:{team_id}:{limit}:{cursor}", schemas.Page[schemas.PlayerOut], load)
+    return page_items(page, response)
+
+@app.get("/matches/{match_id}/teams/{team_id}/players/stats", response_model=list[schemas.PlayerStatsOut], dependencies=[Depends(match_etag)])
+async def get_players_stats_in_match_for_team(match_id: int, team_id: int, db: AsyncSession = Depends(get_db)):
+    player_stats = (await db.scalars(select(PlayerStats).where(PlayerStats.match_id == match_id, PlayerStats.team_id == team_id))).all()
     if not player_stats:
         raise HTTPException(status_code=404, detail="Player stats not found for this team in this match")
     return player_stats
 
-@app.get("/matches/{match_id}/players/stats", response_model=list[schemas.PlayerStatsOut])
-def get_all_player_stats_in_match(match_id: int, db: Session = Depends(get_db)):
-    player_stats = db.query(PlayerStats).filter(PlayerStats.match_id == match_id).all()
+@app.get("/matches/{match_id}/players/stats", response_model=list[schemas.PlayerStatsOut], dependencies=[Depends(match_etag)])
+async def get_all_player_stats_in_match(match_id: int, db: AsyncSession = Depends(get_db)):
+    player_stats = (await db.scalars(select(PlayerStats).where(PlayerStats.match_id == match_id))).all()
     if not player_stats:
         raise HTTPException(status_code=404, detail="Player stats not found for this match")
     return player_stats
 
-@app.get("/matches/{match_id}/teams/{team_id}/players/{player_id}/stats", response_model=schemas.PlayerStatsOut)
-def get_player_stats_in_match(match_id: int, team_id: int, player_id: int, db: Session = Depends(get_db)):
-    player_stats = db.query(PlayerStats).filter(
-        PlayerStats.match_id == match_id, 
-        PlayerStats.team_id == team_id, 
+@app.get("/matches/{match_id}/teams/{team_id}/players/{player_id}/stats", response_model=schemas.PlayerStatsOut, dependencies=[Depends(match_etag)])
+async def get_player_stats_in_match(match_id: int, team_id: int, player_id: int, db: AsyncSession = Depends(get_db)):
+    player_stats = await db.scalar(select(PlayerStats).where(
+        PlayerStats.match_id == match_id,
+        PlayerStats.team_id == team_id,
         PlayerStats.player_id == player_id
-    ).first()
+    ))
     if not player_stats:
         raise HTTPException(status_code=404, detail="Player stats not found for this player in this match")
     return player_stats
 
+def action_out(action: Action) -> schemas.ActionOut:
+    return schemas.ActionOut(**action.data, Team=action.team_code or "", Nr=action.shirt_number or "",
+                             NoAct=action.action_type, Pos=action.pos, Time=action.time_sec)
+
 @app.get("/matches/{match_id}/actions/page/{page_no}", response_model= list[schemas.ActionOut])
-def get_actions (match_id:int, page_no: int,db: Session = Depends(get_db)):
-    match = db.query(Match).filter(Match.id == match_id).first()
+async def get_actions (match_id:int, page_no: int, page_size: int = Query(5, ge=1, le=100), db: AsyncSession = Depends(get_db)):
+    match = await db.scalar(select(Match.id).where(Match.id == match_id))
+    if not match:
+        raise HTTPException(status_code=404, detail="Match not found")
+    skip_count = (page_no - 1) * page_size
+    actions = await db.scalars(select(Action).where(Action.match_id == match_id).order_by(Action.time_sec.desc(), Action.pos.desc()).offset(skip_count).limit(page_size))
+    return [action_out(action) for action in actions]
+
+@app.get("/matches/{match_id}/actions", response_model=schemas.ActionPageOut)
+async def get_actions_page(match_id: int, limit: int = Query(50, ge=1, le=500), cursor: str | None = None, order: str = Query("asc", pattern="^(asc|desc)$"), db: AsyncSession = Depends(get_db)):
+    match = await db.scalar(select(Match.id).where(Match.id == match_id))
     if not match:
         raise HTTPException(status_code=404, detail="Match not found")
-    skip_count = (page_no - 1) * 5
-    actions = db.query(Action).filter(Action.match_id == match_id).order_by(Action.data["Time"].desc()).offset(skip_count).limit(5).all()
-    return [schemas.ActionOut(**action.data) for action in actions]
+
+    statement = select(Action).where(Action.match_id == match_id)
+    if cursor:
+        key = utils.decode_cursor(cursor)
+        if not key or len(key) != 2 or not all(isinstance(value, int) for value in key):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        # Seek past the last row of the previous page instead of counting rows with OFFSET
+        sort_key = tuple_(Action.time_sec, Action.pos)
+        statement = statement.where(sort_key > tuple_(*key) if order == "asc" else sort_key < tuple_(*key))
+
+    if order == "asc":
+        statement = statement.order_by(Action.time_sec, Action.pos)
+    else:
+        statement = statement.order_by(Action.time_sec.desc(), Action.pos.desc())
+
+    # One extra row tells whether there is a next page
+    actions = (await db.scalars(statement.limit(limit + 1))).all()
+    next_cursor = utils.encode_cursor([actions[limit - 1].time_sec, actions[limit - 1].pos]) if len(actions) > limit else None
+    return {"items": [action_out(action) for action in actions[:limit]], "next": next_cursor}
+
+MATCH_SECTIONS = ("score", "stats", "referees", "players", "actions")
+
+@app.get("/matches/{match_id}/full", response_model=schemas.MatchFullOut, dependencies=[Depends(match_etag)])
+async def get_match_full(match_id: int, request: Request, include: str | None = None, actions_limit: int = Query(50, ge=0, le=500), db: AsyncSession = Depends(get_db)):
+    sections = [section.strip() for section in include.split(",") if section.strip()] if include else list(MATCH_SECTIONS)
+    unknown = set(sections) - set(MATCH_SECTIONS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown sections: {', '.join(sorted(unknown))}. Expected some of {', '.join(MATCH_SECTIONS)}.")
+
+    # Read by match_etag
+    current = request.state.match_version
+    if not current:
+        raise HTTPException(status_code=404, detail="Match not found")
+
+    async def load():
+        # The match with its teams, then one query per included collection
+        options = [joinedload(Match.team_a), joinedload(Match.team_b)]
+        if "referees" in sections:
+            options.append(selectinload(Match.referees).joinedload(RefereeInMatch.referee))
+        if "players" in sections:
+            options.append(selectinload(Match.player_stats))
+        match = await db.scalar(select(Match).options(*options).where(Match.id == match_id))
+        if not match:
+            raise HTTPException(status_code=404, detail="Match not found")
+
+        full = schemas.MatchFullOut(
+            id=match.id, game_code=match.game_code, championship_id=match.championship_id,
+            team_a_id=match.team_a_id, team_b_id=match.team_b_id,
+            team_a=match.team_a and schemas.TeamOut(id=match.team_a.id, name=match.team_a.name, abbreviation=match.team_a.abbreviation),
+            team_b=match.team_b and schemas.TeamOut(id=match.team_b.id, name=match.team_b.name, abbreviation=match.team_b.abbreviation),
+            status=match.status, version=match.version,
+        )
+        if "score" in sections:
+            full.team_a_score, full.team_b_score = match.team_a_score, match.team_b_score
+        if "stats" in sections:
+            full.team_a_stats, full.team_b_stats = match.team_a_stats, match.team_b_stats
+        if "referees" in sections:
+            full.referees = [
+                schemas.RefereeWithRoleOut(id=ref_in_match.referee.id, name=ref_in_match.referee.name, country=ref_in_match.referee.country, role=ref_in_match.role)
+                for ref_in_match in match.referees
+            ]
+        if "players" in sections:
+            full.player_stats = [
+                schemas.PlayerStatsOut(match_id=stats.match_id, player_id=stats.player_id, team_id=stats.team_id, stats=stats.stats)
+                for stats in sorted(match.player_stats, key=lambda stats: (stats.team_id, stats.player_id))
+            ]
+        if "actions" in sections:
+            # The latest actions, as on the first page of /actions/page
+            actions = await db.scalars(select(Action).where(Action.match_id == match_id).order_by(Action.time_sec.desc(), Action.pos.desc()).limit(actions_limit))
+            full.actions = [action_out(action) for action in actions]
+        return full
+
+    if current.status not in FINISHED_MATCH_STATUSES:
+        return await load()
+    # A new ingest bumps the version, so stale payloads are never served and are left to expire
+    key = f"{match_id}:{current.version}:{','.join(sorted(set(sections)))}:{actions_limit}"
+    return await cached_response("match_full", key, schemas.MatchFullOut, load)
@@ -0,0 +1,127 @@
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import BinaryIO, Iterator
+import multiprocessing
+import os
+import posixpath
+import tarfile
+import time
+import zipfile
+from sqlalchemy.orm import Session
+from fastapi import HTTPException
+from .data_orm import Champ
+from .parser import parse_cp_file
+
+
+class ArchiveError(ValueError):
+    """The uploaded file is not a zip or tar archive."""
+
+
+def _cp_file_name(path: str) -> str | None:
+    """Return the base name of an archive member that is a CP file, or None."""
+    name = posixpath.basename(path)
+    # Skip hidden files such as the ._ resource forks macOS adds to archives
+    if name.startswith(".") or not name.lower().endswith(".cp"):
+        return None
+    return name
+
+
+def iter_cp_files(archive: BinaryIO) -> Iterator[tuple[str, bytes]]:
+    """Yield (file name, content) for every CP file of a zip or tar archive, in archive order."""
+    if zipfile.is_zipfile(archive):
+        archive.seek(0)
+        with zipfile.ZipFile(archive) as zip_file:
+            for info in zip_file.infolist():
+                name = _cp_file_name(info.filename)
+                if name and not info.is_dir():
+                    yield name, zip_file.read(info)
+        return
+
+    archive.seek(0)
+    try:
+        tar_file = tarfile.open(fileobj=archive, mode="r:*")
+    except tarfile.TarError:
+        raise ArchiveError("Expected a zip or tar archive of CP files.")
+    with tar_file:
+        for member in tar_file:
+            name = _cp_file_name(member.name)
+            if name and member.isfile():
+                yield name, tar_file.extractfile(member).read()
+
+
+def _store_cp_file(session: Session, championship_id: int, file_name: str, parsed_data: dict, checkpoint: dict | None, hub=None, cache=None) -> dict:
+    """Store one parsed file in its own transaction and return its result."""
+    champ = Champ(id=championship_id, session=session, hub=hub, cache=cache)
+    try:
+        champ.process_data(parsed_data, file_name, checkpoint)
+    except Exception as e:
+        return {"file_name": file_name, "state": "failed", "error": str(e.detail) if isinstance(e, HTTPException) else str(e)}
+
+    return {
+        "file_name": file_name,
+        "state": "succeeded",
+        "actions_count": len(parsed_data.get("actions", [])),
+        "action_lines_count": checkpoint["action_lines_count"] if checkpoint else 0,
+        "timings": champ.stage_timings,
+        "skipped_stages": champ.stage_errors,
+        "rows": champ.row_counts,
+    }
+
+
+def ingest_archive(session: Session, championship_id: int, archive: BinaryIO, max_workers: int | None = None, hub=None, cache=None) -> dict:
+    """Parse the CP files of an archive in a process pool and store them as they finish.
+
+    Parsing is CPU-bound, so it runs in up to max_workers processes, while the
+    files already parsed are written here, one transaction per file, so that a
+    bad file only fails itself. Files stored before are resumed from their
+    checkpoint like a re-upload. Returns a summary with one result per CP file
+    in archive order.
+    """
+    start = time.perf_counter()
+    champ = Champ(id=championship_id, session=session)
+    if not champ.champ_exists:
+        raise HTTPException(status_code=404,detail=f"Championship '{championship_id}' not found.")
+
+    max_workers = max_workers or os.cpu_count() or 1
+    files: list[dict | None] = []
+    file_names = set()
+    # Parse future -> (position in files, file name)
+    in_flight = {}
+
+    def store_finished(return_when: str) -> None:
+        done, _ = wait(in_flight, return_when=return_when)
+        for future in done:
+            position, file_name = in_flight.pop(future)
+            try:
+                parsed_data, checkpoint = future.result()
+            except Exception as e:
+                files[position] = {"file_name": file_name, "state": "failed", "error": f"Parse failed: {e}"}
+                continue
+            files[position] = _store_cp_file(session, championship_id, file_name, parsed_data, checkpoint, hub, cache)
+
+    # Forking a threaded server copies locks other threads hold, e.g. the parser's and the metrics', spawned workers start clean
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        for file_name, content in iter_cp_files(archive):
+            # Checkpoints are kept per file name, so a second file with the same name cannot be told apart
+            if file_name in file_names:
+                files.append({"file_name": file_name, "state": "failed", "error": "Duplicate file name in archive."})
+                continue
+            file_names.add(file_name)
+            files.append(None)
+
+            checkpoint = champ.load_checkpoint(file_name)
+            in_flight[pool.submit(parse_cp_file, content, file_name, championship_id, checkpoint)] = (len(files) - 1, file_name)
+            # Bound the file contents held in memory to a couple per worker
+            if len(in_flight) >= 2 * max_workers:
+                store_finished(FIRST_COMPLETED)
+
+        if in_flight:
+            store_finished(ALL_COMPLETED)
+
+    succeeded = sum(1 for result in files if result["state"] == "succeeded")
+    return {
+        "championship_id": championship_id,
+        "succeeded": succeeded,
+        "failed": len(files) - succeeded,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 3),
+        "files": files,
+    }
@@ -1,19 +1,91 @@
-from .orm import Team, Championship, TeamInChamp, Player, Match, Referee, RefereeInMatch, PlayerStats, Action
+from collections import defaultdict
+from typing import Iterable
+import logging
+import time
+from .orm import Team, Championship, TeamInChamp, Player, Match, Referee, RefereeInMatch, PlayerStats, Action, ParseCheckpoint, TeamStanding, PlayerLeader, FINISHED_MATCH_STATUSES, POINTS_WIN, POINTS_DRAW
+from sqlalchemy import tuple_, update
 from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
 from fastapi import HTTPException
+from .ingest_metrics import INGEST_FAILURES, INGEST_ROWS, INGEST_STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Summary columns that Champ changes by difference
+STANDING_FIELDS = ("played", "won", "drawn", "lost", "goals_for", "goals_against", "points")
+LEADER_FIELDS = ("matches", "goals", "efficiency_sum", "efficiency_matches", "suspensions")
+# Action line fields stored in their own VARCHAR columns -> column and its length
+ACTION_CODE_COLUMNS = {field: (column, Action.__table__.c[column].type.length)
+                       for field, column in (("Team", "team_code"), ("Nr", "shirt_number"), ("NoAct", "action_type"))}
+
+# Stat key -> (CP column, type) of the stats stored per team in a match and per player in a match
+TEAM_STAT_FIELDS = {
+    "all_goals": ("AllG", int),
+    "all_shots": ("AllShots", int),
+    "all_efficiency": ("AllEff", float),
+    "goals_7m": ("P7mG", int),
+    "eff_7m": ("P7mEff", float),
+    "goals_9m": ("P9mG", int),
+    "eff_9m": ("P9mEff", float),
+    "goals_6m": ("P6mG", int),
+    "eff_6m": ("P6mEff", float),
+    "goals_near": ("NearG", int),
+    "eff_near": ("NearEff", float),
+    "goals_wing": ("WingG", int),
+    "eff_wing": ("WingEff", float),
+    "goals_fastbreak": ("FBG", int),
+    "eff_fastbreak": ("FBEff", float),
+    "yellow_cards": ("YC", int),
+    "red_cards": ("RC", int),
+    "blue_cards": ("EX", int),
+    "suspensions_2min": ("P2minT", int),
+    "total_7m_shots": ("P7mShots", int),
+}
+PLAYER_STAT_FIELDS = {
+    "all_goals": ("AllG", int),
+    "shots_efficiency": ("AllEff", float),
+    "yellow_cards": ("YC", int),
+    "red_cards": ("RC", int),
+    "blue_cards": ("EX", int),
+    "suspensions_2min": ("P2minT", int),
+}
 
 
 class Champ:
 
-    def __init__(self, id: int, session: Session):
+    def __init__(self, id: int, session: Session, hub=None, cache=None):
         self.id = id
         self.session = session
+        # LiveHub that committed actions and scores are published to, if any
+        self.hub = hub
+        # ResponseCache whose team and player lists are invalidated by new teams and players, if any
+        self.cache = cache
         existing = session.query(Championship).filter_by(id=id).first()
         self.champ_exists = False
         if existing:
             self.champ_exists = True
             self.championship=existing
 
+        # Per-upload lookups, filled once by _load_entities and kept current by the writers
+        self._matches: dict[str, Match | None] = {}
+        self._team_ids: dict[str, int] = {}
+        self._player_ids: dict[tuple[str, str, int], int] = {}
+        # Player id -> stored stats in the match, to update the leaderboards by the difference
+        self._player_stats: dict[int, dict] = {}
+        # Whether the match counted in the summaries before this ingest changed its status
+        self._counted_before: bool | None = None
+
+        # Filled by every process_data/process_stream run
+        self.stage_timings: dict[str, float] = {}
+        self.stage_errors: dict[str, str] = {}
+        self.row_counts: dict[str, int] = {}
+        # Pending standings and leaderboard changes, team or player id -> difference per summary column
+        self._standing_changes: dict[int, dict[str, int]] = {}
+        self._leader_changes: dict[int, dict[str, float]] = {}
+        # Score and actions of the match to publish once committed
+        self._live_score: dict | None = None
+        self._live_actions: list[dict] = []
+
     
     def _safe_int(self,value: int | str | None) -> int:
         try:
@@ -27,7 +99,55 @@ class Champ:
             return float(value)
         except (ValueError, TypeError):
             return -1.0
-        
+
+
+    def _load_entities(self, parsed_data: dict[str,dict[str, str]]) -> None:
+        """Load the match, its teams, their rosters and the existing player stats with a few IN queries."""
+        gameinfo = parsed_data.get("gameinfo", [])
+
+        abbreviations = {row.get("TID") for row in parsed_data.get("statind", [])}
+        abbreviations.update(row.get("Team") for row in parsed_data.get("statteam", []))
+        if gameinfo:
+            abbreviations.update((gameinfo[0].get("TIDA"), gameinfo[0].get("TIDB")))
+        abbreviations.discard(None)
+
+        if abbreviations:
+            teams = self.session.query(Team.id, Team.abbreviation).filter(Team.abbreviation.in_(abbreviations)).all()
+            self._team_ids.update({abbreviation: team_id for team_id, abbreviation in teams})
+
+        if self._team_ids:
+            players = self.session.query(Player.id, Player.first_name, Player.last_name, Player.team_id).filter(
+                Player.team_id.in_(self._team_ids.values())
+            ).all()
+            self._player_ids.update({(first_name, last_name, team_id): player_id for player_id, first_name, last_name, team_id in players})
+
+        match = self._get_match(gameinfo[0].get("Game")) if gameinfo else None
+        if match:
+            stats = self.session.query(PlayerStats.player_id, PlayerStats.stats).filter_by(match_id=match.id).all()
+            self._player_stats.update({player_id: player_stats or {} for player_id, player_stats in stats})
+
+
+    def _count_rows(self, table: str, count: int) -> None:
+        """Record rows inserted or updated in a table during this ingest."""
+        if count:
+            self.row_counts[table] = self.row_counts.get(table, 0) + count
+
+
+    def _get_match(self, game_code: str) -> Match | None:
+        """Return the match with this game code in the championship, querying it at most once.
+
+        The row stays locked until the ingest commits, so concurrent ingests of the
+        same match, from any worker or process, apply their summary differences in turn.
+        """
+        if game_code not in self._matches:
+            self._matches[game_code] = self.session.query(Match).filter_by(game_code=game_code, championship_id=self.id).with_for_update().first()
+        return self._matches[game_code]
+
+
+    def _counts_in_summaries(self, match: Match) -> bool:
+        """Whether a match counts in the standings and leaderboards, only finished ones do."""
+        return match.status in FINISHED_MATCH_STATUSES
+
 
     def _create_teams(self,parsed_data:dict[str,dict[str, str]], name=None, abbreviation=None) -> list[Team]:
         if (not name and abbreviation) or (name and not abbreviation):
@@ -55,34 +175,35 @@ class Champ:
 
         result_teams = []
         for team_data in teams_data:
-            existing_team = self.session.query(Team).filter_by(abbreviation=team_data["abbreviation"]).first()
-            if not existing_team:
+            if team_data["abbreviation"] not in self._team_ids:
                 team = Team(**team_data)
                 result_teams.append(team)
                 self.session.add(team)
 
-        self.session.commit()
+        self.session.flush()
+        self._team_ids.update({team.abbreviation: team.id for team in result_teams})
+        self._count_rows("teams", len(result_teams))
         return result_teams
 
 
     def _link_team_to_championship(self,team_abbr:str)-> None:
-        team = self.session.query(Team).filter_by(abbreviation=team_abbr).first()
-        if not team:
+        team_id = self._team_ids.get(team_abbr)
+        if not team_id:
             raise HTTPException(status_code=404,detail=f"Team with abbreviation '{team_abbr}' not found.")
 
-        existing_link = self.session.query(TeamInChamp).filter_by(team_id=team.id,championship_id=self.championship.id).first()
+        existing_link = self.session.query(TeamInChamp).filter_by(team_id=team_id,championship_id=self.id).first()
 
         if not existing_link:
-            link = TeamInChamp(team_id=team.id, championship_id=self.championship.id)
+            link = TeamInChamp(team_id=team_id, championship_id=self.id)
             self.session.add(link)
-            self.session.commit()
+            self._count_rows("team_in_champ", 1)
 
 
     def _add_match(self,parsed_data:dict[str,dict[str, str]]) -> Match:
         gameinfo = parsed_data["gameinfo"][0]
         game_code = gameinfo["Game"]
         # Check if match already exists
-        existing_match = self.session.query(Match).filter_by(game_code=game_code , championship_id =self.championship.id).first()
+        existing_match = self._get_match(game_code)
         if existing_match:
             return existing_match
 
@@ -107,27 +228,31 @@ class Champ:
         }
 
         # Find teams by abbreviation
-        team_a = self.session.query(Team).filter_by(abbreviation=team_a_abbr).first()
-        if not team_a:
-            raise HTTPException(status_code=404,etail=f"Team '{team_a_abbr}' not found.")
+        team_a_id = self._team_ids.get(team_a_abbr)
+        if not team_a_id:
+            raise HTTPException(status_code=404,detail=f"Team '{team_a_abbr}' not found.")
 
-        team_b = self.session.query(Team).filter_by(abbreviation=team_b_abbr).first()
-        if not team_b:
+        team_b_id = self._team_ids.get(team_b_abbr)
+        if not team_b_id:
             raise HTTPException(status_code=404,detail=f"Team '{team_b_abbr}' not found.")
 
         # Create match object
         match = Match(
             game_code=game_code,
-            championship_id=self.championship.id,
-            team_a_id=team_a.id,
-            team_b_id=team_b.id,
+            championship_id=self.id,
+            team_a_id=team_a_id,
+            team_b_id=team_b_id,
             team_a_score=team_a_score,
             team_b_score=team_b_score,
             status=status
         )
 
         self.session.add(match)
-        self.session.commit()
+        self.session.flush()
+        self._count_rows("matches", 1)
+        self._matches[game_code] = match
+        self._live_score = self._score_event(match)
+        self._add_standings(match, team_a_score, team_b_score)
         return match
 
 
@@ -136,9 +261,15 @@ class Champ:
         game_code = gameinfo["Game"]
 
         # Find the existing match
-        match = self.session.query(Match).filter_by(game_code=game_code,championship_id =self.championship.id).first()
+        match = self._get_match(game_code)
         if not match:
             return None
+        previous_score = self._score_event(match)
+        # Take the previous result out of the standings, the new one is added below
+        self._add_standings(match, match.team_a_score, match.team_b_score, sign=-1)
+        self._counted_before = self._counts_in_summaries(match)
+
+        match.status = gameinfo.get("GStatus", match.status)
 
         match.team_a_score = {
         "total": self._safe_int(gameinfo.get("RA")),
@@ -152,32 +283,27 @@ class Champ:
             "second_half": self._safe_int(gameinfo.get("RB2")),
         }
 
-        self.session.commit()
+        self._add_standings(match, match.team_a_score, match.team_b_score)
+        score = self._score_event(match)
+        # An identical re-upload leaves the match, and so its version, unchanged
+        if score != previous_score:
+            self._count_rows("matches", 1)
+            self._live_score = score
         return match
 
 
+    def _score_event(self, match: Match) -> dict:
+        return {"match_id": match.id, "team_a_score": match.team_a_score, "team_b_score": match.team_b_score, "status": match.status}
+
+
     def _clean_stats(self,row: dict[str,dict[str, str]]) -> dict[str, int | float]:
+        return self._clean_fields(row, TEAM_STAT_FIELDS)
+
+
+    def _clean_fields(self,row: dict[str, str],fields: dict[str, tuple[str, type]]) -> dict[str, int | float]:
         return {
-            "all_goals": self._safe_int(row.get("AllG")),
-            "all_shots": self._safe_int(row.get("AllShots")),
-            "all_efficiency": self._safe_float(row.get("AllEff")),
-            "goals_7m": self._safe_int(row.get("P7mG")),
-            "eff_7m": self._safe_float(row.get("P7mEff")),
-            "goals_9m": self._safe_int(row.get("P9mG")),
-            "eff_9m": self._safe_float(row.get("P9mEff")),
-            "goals_6m": self._safe_int(row.get("P6mG")),
-            "eff_6m": self._safe_float(row.get("P6mEff")),
-            "goals_near": self._safe_int(row.get("NearG")),
-            "eff_near": self._safe_float(row.get("NearEff")),
-            "goals_wing": self._safe_int(row.get("WingG")),
-            "eff_wing": self._safe_float(row.get("WingEff")),
-            "goals_fastbreak": self._safe_int(row.get("FBG")),
-            "eff_fastbreak": self._safe_float(row.get("FBEff")),
-            "yellow_cards": self._safe_int(row.get("YC")),
-            "red_cards": self._safe_int(row.get("RC")),
-            "blue_cards": self._safe_int(row.get("EX")),
-            "suspensions_2min": self._safe_int(row.get("P2minT")),
-            "total_7m_shots": self._safe_int(row.get("P7mShots")),
+            key: (self._safe_int if kind is int else self._safe_float)(row.get(column))
+            for key, (column, kind) in fields.items()
         }
 
 
@@ -187,7 +313,7 @@ class Champ:
             raise HTTPException(status_code=400,detail="Statteam data is incomplete or missing.")
         
         match_code = statteam[0].get("Game")
-        match = self.session.query(Match).filter_by(game_code=match_code,championship_id =self.championship.id).first()
+        match = self._get_match(match_code)
         if not match:
             raise HTTPException(status_code=404,detail=f"No match found with code '{match_code}'.")
 
@@ -198,21 +324,21 @@ class Champ:
             stats = self._clean_stats(row)
             team_code_to_stats[team_code] = stats
 
-        # Load actual teams from DB for this match
-        team_a = match.team_a
-        team_b = match.team_b
+        # Map the match's teams back to their codes from the loaded teams
+        team_id_to_code = {team_id: abbreviation for abbreviation, team_id in self._team_ids.items()}
+        team_a_abbr = team_id_to_code.get(match.team_a_id)
+        team_b_abbr = team_id_to_code.get(match.team_b_id)
 
-        # If teams don't exist (deleted or null), skip setting stats
-        if not team_a or not team_b:
-            return match
-        # Make sure the teams exist in parsed data
-        if team_a.abbreviation not in team_code_to_stats or team_b.abbreviation not in team_code_to_stats:
+        # If teams don't exist (deleted or null) or are missing from the parsed data, skip setting stats
+        if team_a_abbr not in team_code_to_stats or team_b_abbr not in team_code_to_stats:
             return match
         
-        match.team_a_stats = team_code_to_stats[team_a.abbreviation]
-        match.team_b_stats = team_code_to_stats[team_b.abbreviation]
+        if (match.team_a_stats, match.team_b_stats) == (team_code_to_stats[team_a_abbr], team_code_to_stats[team_b_abbr]):
+            return match
+        match.team_a_stats = team_code_to_stats[team_a_abbr]
+        match.team_b_stats = team_code_to_stats[team_b_abbr]
+        self._count_rows("matches", 1)
 
-        self.session.commit()
         return match
 
 
@@ -231,7 +357,7 @@ class Champ:
         # Try to get the match if linking is requested
         match = None
         if link_to_match:
-            match = self.session.query(Match).filter_by(game_code=game_code ,championship_id =self.championship.id).first()
+            match = self._get_match(game_code)
             if not match:
                 raise HTTPException(status_code=404,detail=f"No match found for game code '{game_code}'.")
 
@@ -264,6 +390,7 @@ class Champ:
                 referee = Referee(name=ref_info["name"],country=ref_info["country"])
                 self.session.add(referee)
                 self.session.flush()
+                self._count_rows("referees", 1)
 
             created_or_found_refs.append(referee)
 
@@ -271,7 +398,6 @@ class Champ:
             if link_to_match and match:
                 self._link_referees_to_match(self.session, match, referee, ref_info["role"])
 
-        self.session.commit()
         return created_or_found_refs
 
 
@@ -283,6 +409,7 @@ class Champ:
         if not existing_link:
             match_ref_link = RefereeInMatch(match_id=match.id,referee_id=referee.id,role=role)
             session.add(match_ref_link)
+            self._count_rows("referee_in_match", 1)
 
 
     def _insert_players(self,parsed_data:dict[str,dict[str, str]]) -> None :
@@ -291,6 +418,7 @@ class Champ:
         if not statind:
             raise HTTPException(status_code=400,detail="No player data found in [statind].")
 
+        new_players = {}
         for row in statind:
             first_name = row.get("FirstName")
             last_name = row.get("SurName")
@@ -301,33 +429,30 @@ class Champ:
                 continue
 
             # Find team
-            team = self.session.query(Team).filter_by(abbreviation=team_abbr).first()
-            if not team:
+            team_id = self._team_ids.get(team_abbr)
+            if not team_id:
                 continue
 
             # Check if player exists
-            existing_player = self.session.query(Player).filter_by(first_name=first_name,last_name=last_name,team_id=team.id).first()
+            key = (first_name, last_name, team_id)
+            if key not in self._player_ids and key not in new_players:
+                new_players[key] = {"first_name": first_name, "last_name": last_name, "number": self._safe_int(number), "team_id": team_id}
 
-            if not existing_player:
-                new_player = Player(first_name=first_name,last_name=last_name,number=self._safe_int(number) ,team_id=team.id)
-                self.session.add(new_player)
+        if new_players:
+            inserted = self.session.execute(
+                insert(Player).returning(Player.id, Player.first_name, Player.last_name, Player.team_id),
+                list(new_players.values()),
+            )
+            self._player_ids.update({(first_name, last_name, team_id): player_id for player_id, first_name, last_name, team_id in inserted})
+            self._count_rows("players", len(new_players))
 
-        self.session.commit()
 
+    def _clean_player_stats(self,row: dict[str, str]) -> dict[str, int | float]:
+        return self._clean_fields(row, PLAYER_STAT_FIELDS)
 
-    def _insert_player_stats(self,parsed_data:dict[str,dict[str, str]]) -> None:
-        statind = parsed_data.get("statind", [])
-        gameinfo = parsed_data.get("gameinfo", [])
-
-        if not statind or not gameinfo:
-            raise HTTPException(status_code=400,detail="Missing [statind] or [gameinfo] section.")
-
-        game_code = gameinfo[0]["Game"]
-        match = self.session.query(Match).filter_by(game_code=game_code,championship_id =self.championship.id).first()
-
-        if not match:
-            return
 
+    def _player_stats_rows(self,statind: list[dict[str, str]]):
+        """Yield (row, team_id, player_id) for every [statind] row whose team and player are known."""
         for row in statind:
             first_name = row.get("FirstName")
             last_name = row.get("SurName")
@@ -336,34 +461,45 @@ class Champ:
             if not (first_name and last_name and team_abbr):
                 continue
 
-            team = self.session.query(Team).filter_by(abbreviation=team_abbr).first()
-            if not team:
+            team_id = self._team_ids.get(team_abbr)
+            if not team_id:
                 continue
 
-            player = self.session.query(Player).filter_by(first_name=first_name,last_name=last_name,team_id=team.id).first()
-
-            if not player:
+            player_id = self._player_ids.get((first_name, last_name, team_id))
+            if not player_id:
                 continue
 
-            # Check if stats already exist
-            existing = self.session.query(PlayerStats).filter_by(match_id=match.id,player_id=player.id).first()
+            yield row, team_id, player_id
 
-            if existing:
-                continue
 
-            stats_json = {
-                "all_goals": self._safe_int(row.get("AllG")),
-                "shots_efficiency": self._safe_float(row.get("AllEff")),
-                "yellow_cards": self._safe_int(row.get("YC")),
-                "red_cards": self._safe_int(row.get("RC")),
-                "blue_cards": self._safe_int(row.get("EX")),
-                "suspensions_2min": self._safe_int(row.get("P2minT"))
-            }
+    def _insert_player_stats(self,parsed_data:dict[str,dict[str, str]]) -> None:
+        statind = parsed_data.get("statind", [])
+        gameinfo = parsed_data.get("gameinfo", [])
+
+        if not statind or not gameinfo:
+            raise HTTPException(status_code=400,detail="Missing [statind] or [gameinfo] section.")
+
+        game_code = gameinfo[0]["Game"]
+        match = self._get_match(game_code)
+
+        if not match:
+            return
+
+        new_stats = []
+        for row, team_id, player_id in self._player_stats_rows(statind):
+            # Check if stats already exist
+            if player_id in self._player_stats:
+                continue
 
-            player_stats = PlayerStats(match_id=match.id,player_id=player.id,team_id=team.id,stats=stats_json)
-            self.session.add(player_stats)
+            stats = self._clean_player_stats(row)
+            new_stats.append({"match_id": match.id, "player_id": player_id, "team_id": team_id, "stats": stats})
+            self._player_stats[player_id] = stats
+            if self._counts_in_summaries(match):
+                self._add_leaders(player_id, team_id, stats)
 
-        self.session.commit()
+        if new_stats:
+            self.session.execute(insert(PlayerStats), new_stats)
+            self._count_rows("player_stats", len(new_stats))
 
 
     def _update_player_stats(self,parsed_data: dict[str,dict[str, str]]) -> None:
@@ -374,44 +510,105 @@ class Champ:
             raise HTTPException(status_code=400,detail="Missing [statind] or [gameinfo] section.")
 
         game_code = gameinfo[0]["Game"]
-        match = self.session.query(Match).filter_by(game_code=game_code,championship_id =self.championship.id).first()
+        match = self._get_match(game_code)
 
         if not match:
             raise HTTPException(status_code=404,detail=f"Match {game_code} not found.")
 
-        for row in statind:
-            first_name = row.get("FirstName")
-            last_name = row.get("SurName")
-            team_abbr = row.get("TID")
+        # A match that just finished adds every player's stats to the leaderboards, unchanged or not
+        counted_before = self._counts_in_summaries(match) if self._counted_before is None else self._counted_before
+        counted = self._counts_in_summaries(match)
 
-            if not (first_name and last_name and team_abbr):
+        updated_stats = []
+        for row, team_id, player_id in self._player_stats_rows(statind):
+            if player_id not in self._player_stats:
                 continue
 
-            team = self.session.query(Team).filter_by(abbreviation=team_abbr).first()
-            if not team:
+            stats = self._clean_player_stats(row)
+            changed = stats != self._player_stats[player_id]
+            if not changed and counted_before == counted:
                 continue
+            if changed:
+                updated_stats.append({"match_id": match.id, "player_id": player_id, "stats": stats})
+            if counted_before:
+                self._add_leaders(player_id, team_id, self._player_stats[player_id], sign=-1)
+            if counted:
+                self._add_leaders(player_id, team_id, stats)
+            self._player_stats[player_id] = stats
+
+        # Update stats with one executemany keyed on the primary key
+        if updated_stats:
+            self.session.execute(update(PlayerStats), updated_stats)
+            self._count_rows("player_stats", len(updated_stats))
+
+
+    def _add_standings(self, match: Match, team_a_score: dict | None, team_b_score: dict | None, sign: int = 1) -> None:
+        """Add (or with sign=-1 take out) one match result to the pending standings changes.
+
+        Unknown scores and matches that are not finished, whose score is not a result yet, count for nothing.
+        """
+        goals_a = (team_a_score or {}).get("total", -1)
+        goals_b = (team_b_score or {}).get("total", -1)
+        if goals_a < 0 or goals_b < 0 or not self._counts_in_summaries(match):
+            return
 
-            player = self.session.query(Player).filter_by(first_name=first_name,last_name=last_name,team_id=team.id).first()
-
-            if not player:
-                continue
-
-            existing = self.session.query(PlayerStats).filter_by(match_id=match.id,player_id=player.id).first()
-
-            if not existing:
+        for team_id, scored, conceded in ((match.team_a_id, goals_a, goals_b), (match.team_b_id, goals_b, goals_a)):
+            if team_id is None:
                 continue
+            standing = self._standing_changes.setdefault(team_id, dict.fromkeys(STANDING_FIELDS, 0))
+            standing["played"] += sign
+            standing["won"] += sign * (scored > conceded)
+            standing["drawn"] += sign * (scored == conceded)
+            standing["lost"] += sign * (scored < conceded)
+            standing["goals_for"] += sign * scored
+            standing["goals_against"] += sign * conceded
+            standing["points"] += sign * (POINTS_WIN if scored > conceded else POINTS_DRAW if scored == conceded else 0)
+
+
+    def _add_leaders(self, player_id: int, team_id: int, stats: dict, sign: int = 1) -> None:
+        """Add (or with sign=-1 take out) one match's stats of a player to the pending leaderboard changes."""
+        leader = self._leader_changes.setdefault(player_id, dict.fromkeys(LEADER_FIELDS, 0))
+        leader["team_id"] = team_id
+        efficiency = stats.get("shots_efficiency", -1)
+        leader["matches"] += sign
+        leader["goals"] += sign * max(stats.get("all_goals", -1), 0)
+        leader["efficiency_sum"] += sign * max(efficiency, 0)
+        leader["efficiency_matches"] += sign * (efficiency >= 0)
+        leader["suspensions"] += sign * max(stats.get("suspensions_2min", -1), 0)
+
+
+    def _update_summaries(self) -> None:
+        """Apply the pending standings and leaderboard changes to the summary tables, a row per team or player."""
+        # In key order, so concurrent ingests of matches sharing teams or players lock their rows in the same order
+        standings = [
+            dict(changes, championship_id=self.id, team_id=team_id)
+            for team_id, changes in sorted(self._standing_changes.items()) if any(changes.values())
+        ]
+        if standings:
+            stmt = insert(TeamStanding).values(standings)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[TeamStanding.championship_id, TeamStanding.team_id],
+                set_={field: getattr(TeamStanding, field) + stmt.excluded[field] for field in STANDING_FIELDS},
+            )
+            self.session.execute(stmt)
+            self._count_rows("team_standings", len(standings))
+
+        leaders = [
+            dict(changes, championship_id=self.id, player_id=player_id)
+            for player_id, changes in sorted(self._leader_changes.items()) if any(changes[field] for field in LEADER_FIELDS)
+        ]
+        if leaders:
+            stmt = insert(PlayerLeader).values(leaders)
+            set_ = {field: getattr(PlayerLeader, field) + stmt.excluded[field] for field in LEADER_FIELDS}
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[PlayerLeader.championship_id, PlayerLeader.player_id],
+                set_=dict(set_, team_id=stmt.excluded.team_id),
+            )
+            self.session.execute(stmt)
+            self._count_rows("player_leaders", len(leaders))
 
-            # Update stats
-            existing.stats = {
-                "all_goals": self._safe_int(row.get("AllG")),
-                "shots_efficiency": self._safe_float(row.get("AllEff")),
-                "yellow_cards": self._safe_int(row.get("YC")),
-                "red_cards": self._safe_int(row.get("RC")),
-                "blue_cards": self._safe_int(row.get("EX")),
-                "suspensions_2min": self._safe_int(row.get("P2minT"))
-            }
-
-        self.session.commit()
+        self._standing_changes = {}
+        self._leader_changes = {}
 
 
     def _parsed_before(self, parsed_data: dict[str,dict[str, str]]) -> bool:
@@ -425,88 +622,288 @@ class Champ:
         game_code = gameinfo[0].get("Game")
         if not game_code:
             return False
-        existing_match = self.session.query(Match).filter_by(game_code=game_code, championship_id=self.championship.id).first()
-        return existing_match is not None
+        return self._get_match(game_code) is not None
+
 
+    def _run_stage(self, name: str, stage, *args, required: bool = True, savepoint: bool = True):
+        """Run one ingest stage inside a savepoint and record how long it took in milliseconds.
 
-    def _add_data(self, parsed_data: dict[str,dict[str, str]]) -> None:
-        """Main method to add parsed data to the database."""
+        A failing optional stage is rolled back to its savepoint and reported in
+        stage_errors, a failing required stage aborts the whole ingest.
+        """
+        start = time.perf_counter()
+        row_counts = dict(self.row_counts)
+        try:
+            if not savepoint:
+                return stage(*args)
+            with self.session.begin_nested():
+                return stage(*args)
+        except Exception as e:
+            if required:
+                INGEST_FAILURES.labels(name).inc()
+                raise
+            self.stage_errors[name] = e.detail if isinstance(e, HTTPException) else str(e)
+            # Nothing the stage wrote survived its savepoint
+            self.row_counts = row_counts
+        finally:
+            self._record_stage(name, time.perf_counter() - start)
+
+
+    def _record_stage(self, name: str, elapsed: float) -> None:
+        self.stage_timings[name] = round(self.stage_timings.get(name, 0) + elapsed * 1000, 3)
+        INGEST_STAGE_SECONDS.labels(name).observe(elapsed)
+
+
+    def _add_data(self, parsed_data: dict[str,dict[str, str]]) -> Match:
+        """Main method to add parsed data, except the actions, to the database."""
         # Create teams
-        self._create_teams(parsed_data)
+        self._run_stage("teams", self._create_teams, parsed_data)
 
         # Link teams to championship
         team_a= parsed_data["gameinfo"][0]["TIDA"]
         team_b= parsed_data["gameinfo"][0]["TIDB"]
 
-        self._link_team_to_championship(team_a)
-        self._link_team_to_championship(team_b)
+        self._run_stage("team_links", self._link_team_to_championship, team_a)
+        self._run_stage("team_links", self._link_team_to_championship, team_b)
 
         # Add match
-        match = self._add_match(parsed_data)
+        match = self._run_stage("match", self._add_match, parsed_data)
         
         # Insert referees
-        self._insert_referees(parsed_data)
+        self._run_stage("referees", self._insert_referees, parsed_data, required=False)
 
         # Insert players
-        self._insert_players(parsed_data)
+        self._run_stage("players", self._insert_players, parsed_data)
 
         # Insert player stats
-        self._insert_player_stats(parsed_data)
+        self._run_stage("player_stats", self._insert_player_stats, parsed_data)
 
         # add match stats
-        self._update_or_add_match_stats(parsed_data)
+        self._run_stage("match_stats", self._update_or_add_match_stats, parsed_data, required=False)
 
-        # Add actions
-        self.add_or_update_actions(parsed_data, match.id)
+        return match
     
 
-    def _update_data(self, parsed_data: dict[str,dict[str, str]]) -> None:
-        """Main method to update parsed data in the database."""
+    def _update_data(self, parsed_data: dict[str,dict[str, str]]) -> Match:
+        """Main method to update parsed data, except the actions, in the database."""
 
         # Update match score
-        match=self._update_match_score(parsed_data)
+        match = self._run_stage("match", self._update_match_score, parsed_data)
 
         # Update match stats
-        self._update_or_add_match_stats(parsed_data)
+        self._run_stage("match_stats", self._update_or_add_match_stats, parsed_data, required=False)
 
         # Update player stats
-        self._update_player_stats(parsed_data)
+        self._run_stage("player_stats", self._update_player_stats, parsed_data)
 
-        # Add or update actions
-        self.add_or_update_actions(parsed_data, match.id)
+        return match
 
-    def process_data(self, parsed_data: dict[str,dict[str, str]]) -> None:
-        """Process parsed data based on whether it has been processed before."""
-        if self._parsed_before(parsed_data):
-            self._update_data(parsed_data)
-        else:
-            self._add_data(parsed_data)
 
-    def add_or_update_actions(self, parsed_data: dict[str, dict[str, str]], match_id: int) -> None:
-   
-        actions_to_process = parsed_data["actions"]
+    def _reset_report(self) -> None:
+        self.stage_timings = {}
+        self.stage_errors = {}
+        self.row_counts = {}
+        self._live_score = None
+        self._live_actions = []
+        self._standing_changes = {}
+        self._leader_changes = {}
+        self._counted_before = None
 
-        # Define the list of fields to keep.
-        fields_to_store = [
-            'Game', 'Team', 'Name', 'Nr', 'Text', 'PLTime', 
-            'NoAct', 'Pos' ,'Time'                               
-        ]
 
-        for action_data in actions_to_process:
-            action_data["Time"] = self._pltime_to_sec(action_data["PLTime"])
-            filtered_data = {key: action_data.get(key, '') for key in fields_to_store}
+    def _apply_sections(self, parsed_data: dict[str,dict[str, str]]) -> Match:
+        """Add or update everything but the actions, depending on whether the match was processed before."""
+        # Lookups only read, so they run without a savepoint
+        parsed_before = self._run_stage("lookup", self._parsed_before, parsed_data, savepoint=False)
+        self._run_stage("lookup", self._load_entities, parsed_data, savepoint=False)
+
+        match = self._update_data(parsed_data) if parsed_before else self._add_data(parsed_data)
+        self._run_stage("summaries", self._update_summaries)
+        return match
+
+
+    def _bump_version(self, match: Match) -> None:
+        """Change the match's ETag, cached responses about it are stale now."""
+        self.session.execute(update(Match).where(Match.id == match.id).values(version=Match.version + 1))
 
-            existing = self.session.query(Action).filter(
-                Action.match_id == match_id,
-                Action.data['Pos'].astext == filtered_data['Pos']
-            ).first()
 
-            if existing:
-                existing.data = filtered_data
+    def _finish(self, match: Match | None, file_name: str | None, checkpoint: dict | None) -> None:
+        if match and any(table != "parse_checkpoints" for table in self.row_counts):
+            self._run_stage("version", self._bump_version, match)
+
+        if file_name and checkpoint:
+            self._run_stage("checkpoint", self._save_checkpoint, match, file_name, checkpoint)
+
+        # Read before the commit expires the match
+        match_id = match.id if match else None
+        self._run_stage("commit", self.session.commit, savepoint=False)
+        for table, count in self.row_counts.items():
+            INGEST_ROWS.labels(table).inc(count)
+
+        if self.cache:
+            changed = {"teams": ("teams", "team_in_champ"), "players": ("players",)}
+            self.cache.invalidate(*(namespace for namespace, tables in changed.items() if any(table in self.row_counts for table in tables)))
+
+        # Only what is committed is published
+        if self.hub and match_id and (self._live_score or self._live_actions):
+            self.hub.publish(match_id, self._live_score, self._live_actions)
+
+    def load_checkpoint(self, file_name: str) -> dict | None:
+        """Return the persisted parse checkpoint of a file in this championship, if any."""
+        checkpoint = self.session.get(ParseCheckpoint, (self.id, file_name))
+        if not checkpoint:
+            return None
+        return {
+            "definitions": checkpoint.definitions,
+            "actions_start_line": checkpoint.actions_start_line,
+            "action_lines_count": checkpoint.action_lines_count,
+            "prefix_hash": checkpoint.prefix_hash,
+            "encoding": checkpoint.encoding,
+        }
+
+
+    def _checkpoint_match(self, file_name: str) -> Match:
+        """Return the match a file's checkpoint belongs to, for deltas that carry no [GameInfo]."""
+        checkpoint = self.session.get(ParseCheckpoint, (self.id, file_name))
+        if not checkpoint or not checkpoint.match:
+            raise HTTPException(status_code=409,detail=f"No match is stored for '{file_name}' yet, upload the full file first.")
+        return checkpoint.match
+
+
+    def _save_checkpoint(self, match: Match | None, file_name: str, checkpoint: dict) -> None:
+        """Store the parse checkpoint next to its match, in the same transaction as the data it covers."""
+        values = dict(checkpoint, championship_id=self.id, file_name=file_name, match_id=match.id if match else None)
+        stmt = insert(ParseCheckpoint).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ParseCheckpoint.championship_id, ParseCheckpoint.file_name],
+            set_={key: stmt.excluded[key] for key in ("match_id", "definitions", "actions_start_line", "action_lines_count", "prefix_hash", "encoding")},
+        )
+        self.session.execute(stmt)
+        self._count_rows("parse_checkpoints", 1)
+
+
+    def process_data(self, parsed_data: dict[str,dict[str, str]], file_name: str | None = None, checkpoint: dict | None = None) -> None:
+        """Apply the parsed data in a single transaction with one commit, each stage in its own savepoint.
+
+        When a parse checkpoint is given it is saved in the same transaction, so
+        any worker can resume parsing the file from what is actually stored.
+        Data without a [GameInfo] section, such as a delta of new actions only,
+        is applied to the match of the file's checkpoint.
+        Per-stage timings in milliseconds are left in stage_timings, the errors
+        of skipped optional stages in stage_errors and the rows written per table
+        in row_counts.
+        """
+        self._reset_report()
+        try:
+            if parsed_data.get("gameinfo"):
+                match = self._apply_sections(parsed_data)
             else:
-                self.session.add(Action(match_id=match_id, data=filtered_data))
+                match = self._run_stage("lookup", self._checkpoint_match, file_name, savepoint=False)
+            self._run_stage("actions", self.add_or_update_actions, parsed_data, match.id)
+            self._finish(match, file_name, checkpoint)
+        except Exception:
+            self.session.rollback()
+            raise
+
+    def process_stream(self, rows: Iterable[tuple[str, dict[str, str]]], file_name: str | None = None, checkpoint: dict | None = None, batch_size: int = 500) -> int:
+        """Apply (section, row) pairs while they are still being parsed, in the same transaction as process_data.
+
+        The header sections are stored as soon as the first action arrives, and
+        the actions are then upserted in batches of batch_size, so memory stays
+        bounded by the header and one batch. The time spent reading and parsing
+        the rows is recorded as the "parse" stage. Returns the number of actions applied.
+        """
+        self._reset_report()
+        parsed_data = defaultdict(list)
+        match = None
+        batch = []
+        actions_count = 0
+        rows = iter(rows)
+        parse_time = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                section, row = next(rows, (None, None))
+                parse_time += time.perf_counter() - start
+                if section is None:
+                    break
+
+                if section != "actions":
+                    parsed_data[section].append(row)
+                    continue
+
+                if match is None:
+                    match = self._apply_sections(parsed_data)
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    self._run_stage("actions", self.add_or_update_actions, {"actions": batch}, match.id)
+                    actions_count += len(batch)
+                    batch = []
+
+            # A live update without new actions only refreshes the header sections
+            if match is None:
+                match = self._apply_sections(parsed_data)
+            if batch:
+                self._run_stage("actions", self.add_or_update_actions, {"actions": batch}, match.id)
+                actions_count += len(batch)
+
+            self._record_stage("parse", parse_time)
+            self._finish(match, file_name, checkpoint)
+        except Exception:
+            self.session.rollback()
+            raise
+        return actions_count
+
+    def add_or_update_actions(self, parsed_data: dict[str, dict[str, str]], match_id: int) -> None:
+        """Upsert every action of the upload with one statement, executed in pages of 1000 rows, keyed on (match, Pos)."""
+        actions_to_process = parsed_data["actions"]
+
+        # Fields kept in data, the others are stored in their own columns
+        fields_to_store = ['Game', 'Name', 'Text', 'PLTime']
 
-            self.session.commit()
+        # One row per Pos, a later line for the same Pos replaces the earlier one
+        rows = {}
+        for action_data in actions_to_process:
+            pos = self._safe_int(action_data.get("Pos"))
+            # Without a Pos the action cannot be told apart from the others
+            if pos < 0:
+                continue
+            row = {
+                "match_id": match_id,
+                "time_sec": self._pltime_to_sec(action_data.get("PLTime", "")),
+                "pos": pos,
+                "data": {key: action_data.get(key, '') for key in fields_to_store},
+            }
+            for field, (column, length) in ACTION_CODE_COLUMNS.items():
+                value = action_data.get(field, "")
+                if len(value) > length:
+                    # A longer value would fail the whole upload
+                    logger.warning("Action %s of match %s: %s %r cut to %s characters", pos, match_id, field, value, length)
+                    value = value[:length]
+                row[column] = value
+            rows[pos] = row
+
+        if not rows:
+            return
+
+        # Executed with a parameter list, the statement is compiled once and cached, psycopg2 sends the rows in pages
+        stmt = insert(Action).returning(Action.pos)
+        updated_columns = ["time_sec", "team_code", "shirt_number", "action_type", "data"]
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Action.match_id, Action.pos],
+            set_={column: stmt.excluded[column] for column in updated_columns},
+            # Skip rewriting rows that did not change since the last upload
+            where=tuple_(*(Action.__table__.c[column] for column in updated_columns)).is_distinct_from(
+                tuple_(*(stmt.excluded[column] for column in updated_columns))
+            ),
+        )
+        # Only inserted and changed rows are returned
+        changed = [rows[pos] for pos, in self.session.execute(stmt, list(rows.values()))]
+        self._count_rows("actions", len(changed))
+        if self.hub:
+            self._live_actions.extend(
+                dict(row["data"], Team=row["team_code"], Nr=row["shirt_number"], NoAct=row["action_type"], Pos=row["pos"], Time=row["time_sec"])
+                for row in changed
+            )
 
     def _pltime_to_sec(self, x: str) -> int:
         s = str(x).strip()
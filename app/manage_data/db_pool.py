@@ -0,0 +1,142 @@
+from collections import deque
+import os
+import statistics
+import threading
+import time
+from prometheus_client import Histogram
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# A free connection is handed out in microseconds, a saturated pool waits up to pool_timeout
+POOL_WAIT_SECONDS = Histogram(
+    "db_pool_checkout_wait_seconds", "Time to check a connection out of the pool, including timed out checkouts.",
+    ["pool"], buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+
+class PoolStats:
+    """Checkout counters of one engine's pool, reported by /admin/db-pool and /metrics."""
+
+    def __init__(self, name: str, max_overflow: int, recent_size: int = 1000):
+        self.name = name
+        self.max_overflow = max_overflow
+        self.checkouts = 0
+        self.timeouts = 0
+        # Connections opened beyond pool_size
+        self.overflow_connects = 0
+        self.connects = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.recent_waits: deque[float] = deque(maxlen=recent_size)
+        self._lock = threading.Lock()
+
+    def record_checkout(self, wait: float) -> None:
+        POOL_WAIT_SECONDS.labels(self.name).observe(wait)
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.recent_waits.append(wait)
+
+    def record_timeout(self, wait: float) -> None:
+        POOL_WAIT_SECONDS.labels(self.name).observe(wait)
+        with self._lock:
+            self.timeouts += 1
+
+    def record_connect(self, overflow: bool) -> None:
+        with self._lock:
+            self.connects += 1
+            self.overflow_connects += overflow
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            recent = sorted(self.recent_waits)
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "connects": self.connects,
+                "overflow_connects": self.overflow_connects,
+                "wait_ms": {
+                    "avg": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                    "max": round(self.wait_max * 1000, 3),
+                    # Over the last checkouts only
+                    "p50": round(statistics.median(recent) * 1000, 3) if recent else 0.0,
+                    "p95": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 3) if recent else 0.0,
+                },
+            }
+
+
+class _InstrumentedPool:
+    """Times every checkout, including the wait for a free connection, and counts pool timeouts."""
+
+    stats: PoolStats
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            self.stats.record_timeout(time.perf_counter() - start)
+            raise
+        self.stats.record_checkout(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        # Invalidation and dispose replace the pool, the counters carry over
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+class InstrumentedQueuePool(_InstrumentedPool, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPool, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_options() -> dict:
+    """create_engine keyword arguments of the pool, from the DB_POOL_* variables."""
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "-1")),
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "false").lower() in ("1", "true", "yes"),
+    }
+
+
+def statement_timeout_args(timeout_ms: int, async_engine: bool = False) -> dict:
+    """connect_args setting Postgres' statement_timeout on every connection, none for 0."""
+    if not timeout_ms:
+        return {}
+    if async_engine:
+        return {"server_settings": {"statement_timeout": str(timeout_ms)}}
+    return {"options": f"-c statement_timeout={timeout_ms}"}
+
+
+def instrument(engine, max_overflow: int, name: str) -> None:
+    """Attach a PoolStats, labelled name in /metrics, to a synchronous engine, or the sync_engine of an async one, built with an instrumented pool."""
+    engine.pool.stats = PoolStats(name, max_overflow)
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        # The pool already counts the new connection, beyond pool_size it is an overflow one
+        current = engine.pool
+        current.stats.record_connect(current.overflow() > 0)
+
+
+def pool_status(engine) -> dict:
+    """Current occupancy and counters of an instrumented engine's pool."""
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": pool.stats.max_overflow,
+        "timeout": pool.timeout(),
+        **pool.stats.snapshot(),
+    }
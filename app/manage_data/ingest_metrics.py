@@ -0,0 +1,21 @@
+from prometheus_client import Counter, Histogram
+
+# Milliseconds to tens of seconds, uploads range from a few live actions to whole archives
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+INGEST_STAGE_SECONDS = Histogram(
+    "cp_ingest_stage_seconds", "Time spent in each stage of Champ.process_data and process_stream.",
+    ["stage"], buckets=STAGE_BUCKETS,
+)
+INGEST_ROWS = Counter(
+    "cp_ingest_rows_total", "Rows inserted or updated by committed ingests, per table.",
+    ["table"],
+)
+INGEST_FAILURES = Counter(
+    "cp_ingest_failures_total", "Ingests aborted by a failing required stage.",
+    ["stage"],
+)
+PARSER_SECONDS = Histogram(
+    "cp_parser_seconds", "Time spent by CpFileParser, per phase: encoding detection, chardet, decoding and parsing.",
+    ["phase"], buckets=STAGE_BUCKETS,
+)
@@ -1,12 +1,15 @@
 from sqlalchemy import (
-    create_engine, Column, Integer, String, Text, Date,
-    ForeignKey, JSON, UniqueConstraint, Index , cast
+    create_engine, Column, Integer, Float, String, Text, Date,
+    ForeignKey, JSON, UniqueConstraint, Index , text, cast
 )
 from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 from dotenv import load_dotenv
 import os
+from .db_pool import InstrumentedAsyncQueuePool, InstrumentedQueuePool, instrument, pool_options, statement_timeout_args
+from .query_counter import track_queries
 
 # Load .env
 load_dotenv()
@@ -20,11 +23,39 @@ DB_NAME = os.getenv("DB_NAME")
 if not all([DB_USER, DB_PASS, DB_HOST, DB_NAME]):
     raise RuntimeError("Missing DB configuration in .env")
 
+# Per-statement timeouts in milliseconds, 0 for none. Each engine has its own pool of DB_POOL_SIZE + DB_MAX_OVERFLOW connections
+STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+INGEST_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_INGEST_STATEMENT_TIMEOUT_MS", "0"))
+
+POOL_OPTIONS = pool_options()
+
 DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASS}@{DB_HOST}:5432/{DB_NAME}"
-engine = create_engine(DATABASE_URL)
+engine = create_engine(DATABASE_URL, poolclass=InstrumentedQueuePool, **POOL_OPTIONS,
+                       connect_args=statement_timeout_args(INGEST_STATEMENT_TIMEOUT_MS))
+instrument(engine, POOL_OPTIONS["max_overflow"], "ingest")
+track_queries(engine)
 Base = declarative_base()
 SessionLocal = sessionmaker(bind=engine)
 
+# Sessions of the async request handlers, ingestion keeps the synchronous engine above
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:5432/{DB_NAME}"
+async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=InstrumentedAsyncQueuePool, **POOL_OPTIONS,
+                                   connect_args=statement_timeout_args(STATEMENT_TIMEOUT_MS, async_engine=True))
+instrument(async_engine.sync_engine, POOL_OPTIONS["max_overflow"], "api")
+track_queries(async_engine.sync_engine)
+# Loaded objects stay readable after commit, lazy loads are not possible outside run_sync
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+# Standings points per result, as in handball
+POINTS_WIN = 2
+POINTS_DRAW = 1
+# Match statuses (GStatus) of finished matches, comma separated. Only these count in the standings and leaderboards
+FINISHED_MATCH_STATUSES = {status.strip() for status in os.getenv("FINISHED_MATCH_STATUSES", "").split(",") if status.strip()}
+
+if not FINISHED_MATCH_STATUSES:
+    # The codes depend on the scoring software, without them no match would ever count
+    raise RuntimeError("Missing FINISHED_MATCH_STATUSES in .env")
+
 # --- Join Table: Team in Championship ---
 class TeamInChamp(Base):
     __tablename__ = "team_in_champ"
@@ -104,8 +135,10 @@ class Match(Base):
     team_a_score = Column(JSON)
     team_b_score = Column(JSON)
     status = Column(String(50))
-    team_a_stats = Column(JSON)
-    team_b_stats = Column(JSON)
+    team_a_stats = Column(JSONB)
+    team_b_stats = Column(JSONB)
+    # Bumped by every ingest that writes the match's data, served as its ETag
+    version = Column(Integer, nullable=False, default=0, server_default=text("0"))
 
     championship = relationship("Championship", back_populates="matches")
     team_a = relationship("Team", foreign_keys=[team_a_id])
@@ -114,6 +147,7 @@ class Match(Base):
     referees = relationship("RefereeInMatch", back_populates="match", cascade="all, delete-orphan")
     player_stats = relationship("PlayerStats", back_populates="match", cascade="all, delete-orphan")
     actions = relationship("Action", back_populates="match", cascade="all, delete-orphan")
+    parse_checkpoints = relationship("ParseCheckpoint", back_populates="match", cascade="all, delete-orphan")
 
     def __repr__(self):
         return f"<Match(id={self.id}, code='{self.game_code}', status='{self.status}')>"
@@ -153,12 +187,16 @@ class PlayerStats(Base):
     player_id = Column(Integer, ForeignKey("players.id", ondelete="CASCADE"), primary_key=True)
     team_id = Column(Integer, ForeignKey("teams.id", ondelete="CASCADE"))
 
-    stats = Column(JSON)
+    stats = Column(JSONB)
 
     match = relationship("Match", back_populates="player_stats")
     player = relationship("Player", back_populates="stats")
     team = relationship("Team")
 
+    # Containment filters on any stat, and range filters on goals, of the stats aggregate query
+    __table_args__ = (Index("ix_player_stats_stats", stats, postgresql_using="gin", postgresql_ops={"stats": "jsonb_path_ops"}),
+                      Index("ix_player_stats_all_goals", cast(stats["all_goals"].astext, Integer)))
+
     def __repr__(self):
         return f"<PlayerStats(match_id={self.match_id}, player_id={self.player_id})>"
 
@@ -179,16 +217,205 @@ class Action(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     match_id = Column(Integer, ForeignKey("matches.id", ondelete="CASCADE"), nullable=False, index=True)
+    time_sec = Column(Integer)
+    pos = Column(Integer)
+    # As wide as the other codes of the CP file, longer values are cut by Champ.add_or_update_actions
+    team_code = Column(String(50))
+    shirt_number = Column(String(50))
+    action_type = Column(String(50))
+    # The remaining fields of the CP action line
     data = Column(JSONB, nullable=False)
 
     match = relationship("Match", back_populates="actions")
 
-    __table_args__ = (Index("ix_actions_data_time",cast(data["Time"].astext, Integer)),
-                      Index("ix_actions_data_pos", data["Pos"].astext))
+    __table_args__ = (# Conflict target for the bulk upsert in Champ.add_or_update_actions
+                      Index("uq_actions_match_position", match_id, pos, unique=True),
+                      # Keyset pagination of a match's actions in (time, Pos) order
+                      Index("ix_actions_match_time_sec_pos", match_id, time_sec, pos),
+                      Index("ix_actions_match_team_shirt", match_id, team_code, shirt_number),
+                      Index("ix_actions_match_action_type", match_id, action_type))
 
     def __repr__(self):
         return f"<Action(id={self.id}, match_id={self.match_id})>"
 
 
+# --- Incremental CP parse checkpoint, one per uploaded file ---
+class ParseCheckpoint(Base):
+    __tablename__ = "parse_checkpoints"
+
+    championship_id = Column(Integer, ForeignKey("championships.id", ondelete="CASCADE"), primary_key=True)
+    file_name = Column(String(255), primary_key=True)
+    match_id = Column(Integer, ForeignKey("matches.id", ondelete="CASCADE"), index=True)
+    definitions = Column(JSONB, nullable=False)
+    actions_start_line = Column(Integer, nullable=False)
+    action_lines_count = Column(Integer, nullable=False)
+    prefix_hash = Column(String(64), nullable=False)
+    # Encoding the file was decoded with, reused for its deltas after a restart
+    encoding = Column(String(50))
+
+    match = relationship("Match", back_populates="parse_checkpoints")
+
+    def __repr__(self):
+        return f"<ParseCheckpoint(championship_id={self.championship_id}, file_name='{self.file_name}', action_lines_count={self.action_lines_count})>"
+
+
+# --- Championship standings, kept current by Champ as match scores change ---
+class TeamStanding(Base):
+    __tablename__ = "team_standings"
+
+    championship_id = Column(Integer, ForeignKey("championships.id", ondelete="CASCADE"), primary_key=True)
+    team_id = Column(Integer, ForeignKey("teams.id", ondelete="CASCADE"), primary_key=True)
+    played = Column(Integer, nullable=False, default=0)
+    won = Column(Integer, nullable=False, default=0)
+    drawn = Column(Integer, nullable=False, default=0)
+    lost = Column(Integer, nullable=False, default=0)
+    goals_for = Column(Integer, nullable=False, default=0)
+    goals_against = Column(Integer, nullable=False, default=0)
+    points = Column(Integer, nullable=False, default=0)
+
+    team = relationship("Team")
+
+    def __repr__(self):
+        return f"<TeamStanding(championship_id={self.championship_id}, team_id={self.team_id}, points={self.points})>"
+
+
+# --- Player totals per championship, kept current by Champ as player stats change ---
+class PlayerLeader(Base):
+    __tablename__ = "player_leaders"
+
+    championship_id = Column(Integer, ForeignKey("championships.id", ondelete="CASCADE"), primary_key=True)
+    player_id = Column(Integer, ForeignKey("players.id", ondelete="CASCADE"), primary_key=True)
+    team_id = Column(Integer, ForeignKey("teams.id", ondelete="SET NULL"))
+    matches = Column(Integer, nullable=False, default=0)
+    goals = Column(Integer, nullable=False, default=0)
+    # Sum and count of the known per-match shot efficiencies, their ratio is the player's efficiency
+    efficiency_sum = Column(Float, nullable=False, default=0)
+    efficiency_matches = Column(Integer, nullable=False, default=0)
+    suspensions = Column(Integer, nullable=False, default=0)
+
+    player = relationship("Player")
+
+    __table_args__ = (Index("ix_player_leaders_champ_goals", championship_id, goals),
+                      Index("ix_player_leaders_champ_suspensions", championship_id, suspensions))
+
+    def __repr__(self):
+        return f"<PlayerLeader(championship_id={self.championship_id}, player_id={self.player_id}, goals={self.goals})>"
+
+
+# --- Upgrade tables created by older versions of the models ---
+def upgrade_schema() -> None:
+    """create_all only creates missing tables, so columns and indexes added to existing tables are created here.
+
+    Run it once after an upgrade with `python cli.py upgrade-schema`, then fill the
+    summary tables with `python cli.py rebuild-summaries`. ALTER TABLE locks the whole
+    table even when nothing changes, so every step first checks the catalog and an
+    up-to-date schema is left untouched.
+    """
+    with engine.begin() as conn:
+        # Backfills may run longer than the per-statement timeout of the ingest engine
+        conn.execute(text("SET LOCAL statement_timeout = 0"))
+
+        def has_column(table_name: str, column_name: str) -> bool:
+            return conn.execute(text(
+                "SELECT EXISTS (SELECT 1 FROM information_schema.columns "
+                "WHERE table_schema = current_schema() AND table_name = :table_name AND column_name = :column_name)"
+            ), {"table_name": table_name, "column_name": column_name}).scalar()
+
+        # Typed action columns, backfilled from the data of rows stored before they existed
+        if not has_column("actions", "time_sec"):
+            conn.execute(text(
+                "ALTER TABLE actions ADD COLUMN IF NOT EXISTS time_sec INTEGER, ADD COLUMN IF NOT EXISTS pos INTEGER, "
+                "ADD COLUMN IF NOT EXISTS team_code VARCHAR(50), ADD COLUMN IF NOT EXISTS shirt_number VARCHAR(50), "
+                "ADD COLUMN IF NOT EXISTS action_type VARCHAR(50)"
+            ))
+            conn.execute(text(
+                "UPDATE actions SET "
+                "time_sec = CASE WHEN data->>'Time' ~ '^[0-9]+$' THEN (data->>'Time')::integer END, "
+                "pos = CASE WHEN data->>'Pos' ~ '^[0-9]+$' THEN (data->>'Pos')::integer END, "
+                "team_code = left(data->>'Team', 50), shirt_number = left(data->>'Nr', 50), action_type = left(data->>'NoAct', 50), "
+                "data = data - 'Time' - 'Pos' - 'Team' - 'Nr' - 'NoAct' "
+                "WHERE data ? 'Pos'"
+            ))
+        # The action columns were first created narrower, widening a VARCHAR does not rewrite the table
+        narrow_columns = conn.execute(text(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = 'actions' "
+            "AND column_name IN ('team_code', 'shirt_number', 'action_type') AND character_maximum_length < 50"
+        )).scalars().all()
+        if narrow_columns:
+            conn.execute(text("ALTER TABLE actions " + ", ".join(f"ALTER COLUMN {column} TYPE VARCHAR(50)" for column in narrow_columns)))
+        if not has_column("matches", "version"):
+            conn.execute(text("ALTER TABLE matches ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0"))
+        # Checkpoints stored before it have none, their deltas detect the encoding again
+        if not has_column("parse_checkpoints", "encoding"):
+            conn.execute(text("ALTER TABLE parse_checkpoints ADD COLUMN IF NOT EXISTS encoding VARCHAR(50)"))
+
+        # Stats stored as JSON before they were JSONB, which Postgres can index and aggregate on
+        json_columns = conn.execute(text(
+            "SELECT table_name, column_name FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND data_type = 'json' AND ("
+            "(table_name = 'matches' AND column_name IN ('team_a_stats', 'team_b_stats')) "
+            "OR (table_name = 'player_stats' AND column_name = 'stats'))"
+        )).all()
+        for table_name, column_name in json_columns:
+            conn.execute(text(f"ALTER TABLE {table_name} ALTER COLUMN {column_name} TYPE JSONB USING {column_name}::jsonb"))
+
+        if conn.execute(text("SELECT to_regclass('uq_actions_match_position')")).scalar() is None:
+            # Keep only the newest row per (match, Pos) so the unique index can be built
+            conn.execute(text(
+                "DELETE FROM actions a USING actions b "
+                "WHERE a.match_id = b.match_id AND a.pos = b.pos AND a.id < b.id"
+            ))
+
+        # Indexes on the data expressions, replaced by those on the typed columns
+        for index_name in ("ix_actions_data_time", "ix_actions_data_pos", "uq_actions_match_pos", "ix_actions_match_time_pos"):
+            if conn.execute(text("SELECT to_regclass(:index_name)"), {"index_name": index_name}).scalar() is not None:
+                conn.execute(text(f"DROP INDEX {index_name}"))
+
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
+# --- Recompute the summary tables ---
+def rebuild_summaries() -> None:
+    """Recompute the standings and leaders from the finished matches stored, in one transaction.
+
+    Ingests update both tables incrementally, run `python cli.py rebuild-summaries`
+    after upgrading a database and whenever FINISHED_MATCH_STATUSES changes.
+    """
+    with engine.begin() as conn:
+        conn.execute(text("SET LOCAL statement_timeout = 0"))
+        # Waits for the uploads writing to either table, later ones wait for the rebuild and apply their changes on top
+        conn.execute(text("TRUNCATE team_standings, player_leaders"))
+        finished = {"finished": list(FINISHED_MATCH_STATUSES)}
+        conn.execute(text(
+            "INSERT INTO team_standings (championship_id, team_id, played, won, drawn, lost, goals_for, goals_against, points) "
+            "SELECT championship_id, team_id, count(*), count(*) FILTER (WHERE gf > ga), count(*) FILTER (WHERE gf = ga), "
+            "count(*) FILTER (WHERE gf < ga), sum(gf), sum(ga), "
+            f"sum(CASE WHEN gf > ga THEN {POINTS_WIN} WHEN gf = ga THEN {POINTS_DRAW} ELSE 0 END) "
+            "FROM ("
+            "SELECT championship_id, team_a_id AS team_id, (team_a_score->>'total')::integer AS gf, (team_b_score->>'total')::integer AS ga FROM matches "
+            "WHERE status = ANY(:finished) "
+            "UNION ALL "
+            "SELECT championship_id, team_b_id, (team_b_score->>'total')::integer, (team_a_score->>'total')::integer FROM matches "
+            "WHERE status = ANY(:finished)"
+            ") results WHERE team_id IS NOT NULL AND gf >= 0 AND ga >= 0 "
+            "GROUP BY championship_id, team_id"
+        ), finished)
+        conn.execute(text(
+            "INSERT INTO player_leaders (championship_id, player_id, team_id, matches, goals, efficiency_sum, efficiency_matches, suspensions) "
+            "SELECT m.championship_id, ps.player_id, max(ps.team_id), count(*), "
+            "sum(greatest((ps.stats->>'all_goals')::integer, 0)), "
+            "coalesce(sum((ps.stats->>'shots_efficiency')::float) FILTER (WHERE (ps.stats->>'shots_efficiency')::float >= 0), 0), "
+            "count(*) FILTER (WHERE (ps.stats->>'shots_efficiency')::float >= 0), "
+            "sum(greatest((ps.stats->>'suspensions_2min')::integer, 0)) "
+            "FROM player_stats ps JOIN matches m ON m.id = ps.match_id "
+            "WHERE m.status = ANY(:finished) "
+            "GROUP BY m.championship_id, ps.player_id"
+        ), finished)
+
+
 # --- Create all tables ---
+# Tables of a new database, existing ones are upgraded by `python cli.py upgrade-schema`
 Base.metadata.create_all(bind=engine)
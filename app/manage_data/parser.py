@@ -1,31 +1,311 @@
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+from typing import Iterable, Iterator
+import codecs
+import hashlib
+import threading
+import time
 import chardet
+from .ingest_metrics import PARSER_SECONDS
+
+# Bytes given to chardet when the encoding has to be guessed
+DETECT_SAMPLE_SIZE = 64 * 1024
+
+# Checked in order, the UTF-32 LE mark starts with the UTF-16 LE one
+BYTE_ORDER_MARKS = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+class CpContinuityError(ValueError):
+    """A delta does not continue from the action line count stored for its feed."""
+
+    def __init__(self, expected: int | None):
+        self.expected = expected
+        super().__init__(f"Delta does not continue the stored checkpoint, expected since={expected}.")
+
+class CpIncompleteLineError(ValueError):
+    """A delta ends in the middle of an action line."""
 
-class CpFileParser:
     def __init__(self):
-        self.cached_file_name = None
-        self.cached_data = {}
-
-    def parse(self, file_content: bytes, file_name: str):
-
-        result = chardet.detect(file_content)
-        encoding = result['encoding']
-        lines = file_content.decode(encoding).splitlines()
-        if self.cached_file_name == file_name:
-            return self._update_data(lines)
-        else:
-            return self._full_parse(file_name, lines)
-
-    def _full_parse(self, file_name: str, lines: list[str]):
-        self.cached_file_name = file_name
-        definitions = {}
+        super().__init__("Delta does not end with a complete line, send the last line once it is fully written.")
+
+class CpFileParser:
+    def __init__(self, max_feeds: int = 64):
+        self.max_feeds = max_feeds
+        # Incremental parse state per (championship_id, file_name), least recently used first
+        self.feeds: OrderedDict[tuple[int | None, str], dict] = OrderedDict()
+        self._feeds_lock = threading.Lock()
+
+    def _get_feed(self, championship_id: int | None, file_name: str) -> dict:
+        """Return the state of a feed, creating it and evicting the least recently used feed when full."""
+        key = (championship_id, file_name)
+        with self._feeds_lock:
+            feed = self.feeds.get(key)
+            if feed is None:
+                feed = {"lock": threading.Lock(), "cached_data": None, "encoding": None}
+                self.feeds[key] = feed
+                while len(self.feeds) > self.max_feeds:
+                    self.feeds.popitem(last=False)
+            else:
+                self.feeds.move_to_end(key)
+            return feed
+
+    def forget(self, championship_id: int | None, file_name: str) -> None:
+        """Drop the incremental state of a feed, so its next upload is parsed in full."""
+        with self._feeds_lock:
+            self.feeds.pop((championship_id, file_name), None)
+
+    def parse(self, file_content: bytes, file_name: str, championship_id: int | None = None):
+        data_sections, _ = self.parse_with_checkpoint(file_content, file_name, championship_id)
+        return data_sections
+
+    def parse_with_checkpoint(self, file_content: bytes, file_name: str, championship_id: int | None = None, checkpoint: dict | None = None):
+        """Parse a CP file, resuming from the in-memory state or from a persisted checkpoint.
+
+        Whichever of the two is furthest along and still matches the file is used,
+        otherwise the file is parsed in full. Returns the parsed sections and the
+        checkpoint to persist after they are stored, or None if there is none.
+        """
+        start = time.perf_counter()
+        state = {}
         data_sections = defaultdict(list)
+        read_lines = lambda feed: self._decode(file_content, feed).splitlines()
+        for section, row in self._iter_feed(read_lines, file_name, championship_id, checkpoint, state):
+            data_sections[section].append(row)
+        PARSER_SECONDS.labels("parse").observe(time.perf_counter() - start)
+        return data_sections, state or None
+
+    def parse_stream(self, chunks: Iterable[bytes], file_name: str, championship_id: int | None = None, checkpoint: dict | None = None):
+        """Parse a CP file from an iterable of byte chunks without holding the whole file in memory.
+
+        Returns an iterator of (section, row) pairs in file order, so the caller can
+        store the header sections while the actions are still being read, and the
+        checkpoint dict, which is filled in once the iterator is exhausted.
+        """
+        state = {}
+        read_lines = lambda feed: self._iter_lines(chunks, feed)
+        return self._timed(self._iter_feed(read_lines, file_name, championship_id, checkpoint, state), "parse_stream"), state
+
+    def parse_delta(self, actions_content: bytes, file_name: str, championship_id: int | None, since: int, checkpoint: dict | None = None, header_content: bytes | None = None):
+        """Parse only the action lines appended to a feed after its first `since` action lines.
+
+        `since` must equal the action line count of the in-memory state or of the
+        persisted checkpoint, otherwise CpContinuityError is raised. The delta is
+        decoded with the encoding detected for the feed, or kept in the checkpoint
+        when the parser has not seen the feed yet. actions_content
+        must end with a line break, otherwise CpIncompleteLineError is raised and the
+        feed is left as it was. header_content, when given, is the file up to its
+        [Actions] line and replaces the header sections. Returns the parsed sections
+        and the checkpoint reached.
+        """
+        start = time.perf_counter()
+        feed = self._get_feed(championship_id, file_name)
+        with feed["lock"]:
+            states = [cached_data for cached_data in (checkpoint, feed["cached_data"]) if cached_data]
+            base = next((cached_data for cached_data in states if cached_data["action_lines_count"] == since), None)
+            if base is None:
+                raise CpContinuityError(max((cached_data["action_lines_count"] for cached_data in states), default=None))
+
+            # After a restart only the persisted checkpoint knows the encoding of the file
+            if not feed["encoding"]:
+                feed["encoding"] = base.get("encoding")
+            actions_text = self._decode(actions_content, feed)
+            # A partial last line would be counted as a whole one and its rest lost with the next delta
+            if actions_text and not actions_text.endswith(("\n", "\r")):
+                raise CpIncompleteLineError()
+
+            state = dict(base)
+            data_sections = defaultdict(list)
+
+            if header_content is not None:
+                header_lines = self._decode(header_content, feed).splitlines()
+                header_state = {}
+                for section, row in self._iter_rows(header_lines, [], header_state, state["definitions"]):
+                    if section != "actions":
+                        data_sections[section].append(row)
+                state["definitions"] = header_state["definitions"]
+                # The header may have grown, the actions now start right after it
+                header_actions_line = header_state["actions_start_line"]
+                state["actions_start_line"] = header_actions_line if header_actions_line >= 0 else len(header_lines)
+
+            new_actions = [line.strip() for line in actions_text.splitlines()]
+            data_sections["actions"].extend(row for _, row in self._action_rows(new_actions, state["definitions"]))
+            state["action_lines_count"] += len(new_actions)
+            state["prefix_hash"] = self._hash_lines(state["prefix_hash"], new_actions)
+            state["encoding"] = feed["encoding"]
+
+            feed["cached_data"] = state
+            PARSER_SECONDS.labels("parse_delta").observe(time.perf_counter() - start)
+            return data_sections, dict(state)
+
+    def _hash_lines(self, prefix_hash: str, lines: list[str]) -> str:
+        """Extend the chained hash of the consumed action lines from its last value."""
+        digest = bytes.fromhex(prefix_hash)
+        for line in lines:
+            digest = hashlib.sha256(digest + line.encode()).digest()
+        return digest.hex()
+
+    def _detect_encoding(self, sample: bytes, feed: dict) -> str:
+        """Return the encoding of a feed, detected once from the start of its first upload."""
+        if not feed["encoding"]:
+            feed["encoding"] = self._guess_encoding(sample[:DETECT_SAMPLE_SIZE])
+        return feed["encoding"]
+
+    def _guess_encoding(self, sample: bytes) -> str:
+        start = time.perf_counter()
+        try:
+            return self._guess_encoding_of(sample)
+        finally:
+            PARSER_SECONDS.labels("detect_encoding").observe(time.perf_counter() - start)
+
+    def _guess_encoding_of(self, sample: bytes) -> str:
+        for bom, encoding in BYTE_ORDER_MARKS:
+            if sample.startswith(bom):
+                return encoding
+
+        # Fast path, most files are plain UTF-8 or ASCII and strict decoding is cheap
+        try:
+            sample.decode("utf-8")
+            return "utf-8"
+        except UnicodeDecodeError as e:
+            # A character cut off by the end of the sample is still UTF-8
+            if e.reason == "unexpected end of data" and e.start >= len(sample) - 3:
+                return "utf-8"
+
+        start = time.perf_counter()
+        encoding = chardet.detect(sample)['encoding']
+        PARSER_SECONDS.labels("chardet").observe(time.perf_counter() - start)
+        # Not UTF-8 after all, CP files come from Windows scoring PCs
+        if not encoding or encoding.lower() in ("ascii", "utf-8"):
+            return "cp1252"
+        return encoding
+
+    def _decode(self, file_content: bytes, feed: dict) -> str:
+        encoding = self._detect_encoding(file_content, feed)
+        start = time.perf_counter()
+        try:
+            return file_content.decode(encoding)
+        except UnicodeDecodeError:
+            # The sample or the cached encoding does not hold for this file, detect on all of it
+            feed["encoding"] = self._guess_encoding(file_content)
+            return file_content.decode(feed["encoding"], errors="replace")
+        finally:
+            PARSER_SECONDS.labels("decode").observe(time.perf_counter() - start)
+
+    def _timed(self, rows: Iterator, phase: str) -> Iterator:
+        """Yield from rows, observing the time spent inside them, not in the caller, once they are done."""
+        elapsed = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    row = next(rows)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - start
+                yield row
+        finally:
+            rows.close()
+            PARSER_SECONDS.labels(phase).observe(elapsed)
+
+    def _iter_lines(self, chunks: Iterable[bytes], feed: dict) -> Iterator[str]:
+        """Decode byte chunks incrementally and yield complete lines."""
+        decoder = None
+        pending = ""
+        # Observed once per stream, like the decode of a whole file
+        decode_time = 0.0
+        try:
+            for chunk in self._sampled(chunks):
+                if decoder is None:
+                    decoder = codecs.getincrementaldecoder(self._detect_encoding(chunk, feed))()
+                start = time.perf_counter()
+                try:
+                    text = decoder.decode(chunk)
+                except UnicodeDecodeError:
+                    # The detected encoding does not hold, switch to a guess from the bytes that failed
+                    buffered, _ = decoder.getstate()
+                    feed["encoding"] = self._guess_encoding(buffered + chunk)
+                    decoder = codecs.getincrementaldecoder(feed["encoding"])(errors="replace")
+                    text = decoder.decode(buffered + chunk)
+                decode_time += time.perf_counter() - start
+
+                lines = (pending + text).splitlines(keepends=True)
+                # The last line may continue in the next chunk
+                pending = lines.pop() if lines and not lines[-1].endswith("\n") else ""
+                yield from lines
+
+            if decoder is not None:
+                yield from (pending + decoder.decode(b"", final=True)).splitlines()
+        finally:
+            if decoder is not None:
+                PARSER_SECONDS.labels("decode").observe(decode_time)
+
+    def _sampled(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Join the first chunks up to DETECT_SAMPLE_SIZE bytes, a small first chunk may not even hold the byte order mark."""
+        chunks = iter(chunks)
+        sample = b""
+        for chunk in chunks:
+            sample += chunk
+            if len(sample) >= DETECT_SAMPLE_SIZE:
+                break
+        if sample:
+            yield sample
+        yield from chunks
+
+    def _iter_feed(self, read_lines, file_name: str, championship_id: int | None, checkpoint: dict | None, state: dict):
+        """Parse the lines read_lines(feed) returns under the feed's lock, and remember the state reached."""
+        # Uploads of the same feed are parsed one at a time, other feeds run in parallel
+        feed = self._get_feed(championship_id, file_name)
+        with feed["lock"]:
+            resume_from = [cached_data for cached_data in (feed["cached_data"], checkpoint) if cached_data]
+            yield from self._iter_rows(read_lines(feed), resume_from, state)
+
+            # Without an [Actions] section there is nothing to resume from
+            if state["actions_start_line"] < 0:
+                state.clear()
+            else:
+                # Deltas carry no byte order mark and few bytes to guess from, they are decoded like the file
+                state["encoding"] = feed["encoding"]
+            feed["cached_data"] = dict(state) or None
+
+    def _iter_rows(self, lines: Iterable[str], resume_from: list[dict], state: dict, definitions: dict[str, list[str]] | None = None):
+        """Yield (section, row) for every data row of a CP file given line by line.
+
+        Action lines that one of the resume_from checkpoints already consumed are
+        held back until the chained hash of the consumed prefix is verified, and
+        then skipped. If no checkpoint matches they are yielded like any other row.
+        When the lines are exhausted, state holds the checkpoint reached.
+        Known definitions can be passed for lines without a [Definition] section.
+        """
+        definitions = dict(definitions or {})
         current_section = None
-        action_lines_count = 0
         actions_start_line = -1
+        digest = b""
+        # Consumed action line count -> expected prefix hash, for checkpoints that fit this file
+        resume_points = {}
+        held_back = None
+        verified = 0
+        i = -1
 
         for i, line in enumerate(lines):
             line = line.strip()
+
+            if current_section == "actions":
+                # Chained hash, so a checkpoint can be resumed from its last value alone
+                digest = hashlib.sha256(digest + line.encode()).digest()
+                if held_back is not None:
+                    held_back.append(line)
+                    if resume_points.get(len(held_back)) == digest.hex():
+                        verified = len(held_back)
+                    if len(held_back) == max(resume_points):
+                        yield from self._action_rows(held_back[verified:], definitions)
+                        held_back = None
+                    continue
+
             if not line:
                 continue
 
@@ -38,68 +318,44 @@ class CpFileParser:
                 current_section = section_name
                 if current_section == "actions":
                     actions_start_line = i
+                    resume_points = {
+                        cached_data["action_lines_count"]: cached_data["prefix_hash"]
+                        for cached_data in resume_from
+                        if cached_data["actions_start_line"] == i and cached_data["action_lines_count"] > 0
+                    }
+                    held_back = [] if resume_points else None
                 continue
 
             if current_section == "definition":
                 section, fields = line.split("=", 1)
                 section = section.strip().lower()
                 definitions[section] = fields.split(";")
-            else:
-                if current_section in definitions:
-                    if current_section == "actions":
-                        action_lines_count += 1
-                    fields = definitions[current_section]
-                    values = line.split(";")
-                    row_dict = dict(zip(fields, values))
-                    data_sections[current_section].append(row_dict)
-
-        self.cached_data = {
-            "definitions": definitions,
-            "actions_start_line": actions_start_line,
-            "action_lines_count": action_lines_count,
-        }
-        return data_sections
-
-    def _update_data(self, lines: list[str]):
-        definitions = self.cached_data["definitions"]
-        last_action_lines_count = self.cached_data["action_lines_count"]
-        actions_start_line = self.cached_data["actions_start_line"]
-
-        # Reset all sections except actions
-        new_data_sections = defaultdict(list)
-
-        current_section = None
-
-        # Re-parse the file up to the actions section
-        for line in lines[:actions_start_line]:
-            line = line.strip()
-            if not line:
-                continue
-            if line.startswith("[") and line.endswith("]"):
-                section_name = line[1:-1].lower()
-                if section_name != "definition":
-                    current_section = section_name
-                continue
-            if current_section and current_section != "actions" and current_section in definitions:
+            elif current_section in definitions:
                 fields = definitions[current_section]
                 values = line.split(";")
                 row_dict = dict(zip(fields, values))
-                new_data_sections[current_section].append(row_dict)
-
-        # Parse only new actions
-        new_actions = lines[actions_start_line +last_action_lines_count+ 1:]
-        
-        for line in new_actions:
-            line = line.strip()
-            if not line:
-                continue
-            fields = definitions["actions"]
-            values = line.split(";")
-            row_dict = dict(zip(fields, values))
-            new_data_sections["actions"].append(row_dict)
+                yield current_section, row_dict
 
-        self.cached_data["action_lines_count"] += len(new_actions)
+        # The file ended before the furthest checkpoint, release what no matching checkpoint covers
+        if held_back:
+            yield from self._action_rows(held_back[verified:], definitions)
 
-        return new_data_sections
+        state.update({
+            "definitions": definitions,
+            "actions_start_line": actions_start_line,
+            "action_lines_count": i - actions_start_line if actions_start_line >= 0 else 0,
+            "prefix_hash": digest.hex(),
+        })
 
+    def _action_rows(self, lines: list[str], definitions: dict[str, list[str]]):
+        if "actions" not in definitions:
+            return
+        fields = definitions["actions"]
+        for line in lines:
+            if line:
+                yield "actions", dict(zip(fields, line.split(";")))
 
+def parse_cp_file(file_content: bytes, file_name: str, championship_id: int | None = None, checkpoint: dict | None = None):
+    """Parse one CP file with a parser of its own, for worker processes that share no parse state."""
+    data_sections, state = CpFileParser(max_feeds=1).parse_with_checkpoint(file_content, file_name, championship_id, checkpoint)
+    return dict(data_sections), state
@@ -0,0 +1,72 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import time
+from sqlalchemy import event
+
+
+class QueryCounter:
+    """SQL statements run, and the time spent running them, during one request or ingest run."""
+
+    def __init__(self, parent: "QueryCounter | None" = None, record: bool = False):
+        self.parent = parent
+        self.count = 0
+        self.duration = 0.0
+        # The statements themselves, only kept for assert_max_queries
+        self.statements: list[str] | None = [] if record else None
+
+    def add(self, statement: str, duration: float) -> None:
+        counter = self
+        # A request counted inside a test's assert_max_queries counts for both
+        while counter:
+            counter.count += 1
+            counter.duration += duration
+            if counter.statements is not None:
+                counter.statements.append(statement)
+            counter = counter.parent
+
+    def summary(self) -> dict:
+        return {"count": self.count, "db_ms": round(self.duration * 1000, 3)}
+
+
+_current: ContextVar[QueryCounter | None] = ContextVar("query_counter", default=None)
+
+
+@contextmanager
+def count_queries(record: bool = False):
+    """Count the statements run by every tracked engine in this context, e.g. `with count_queries() as queries:`.
+
+    The context follows the request into the threadpool and into the greenlets of
+    the async engine, but not into threads started by the code being counted.
+    """
+    counter = QueryCounter(_current.get(), record)
+    token = _current.set(counter)
+    try:
+        yield counter
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def assert_max_queries(limit: int):
+    """Fail with the statements run when the block runs more than limit of them, for tests guarding against N+1 queries."""
+    with count_queries(record=True) as counter:
+        yield counter
+    if counter.count > limit:
+        statements = "\n".join(f"  {statement}" for statement in counter.statements)
+        raise AssertionError(f"{counter.count} queries run, at most {limit} expected:\n{statements}")
+
+
+def track_queries(engine) -> None:
+    """Count the statements of a synchronous engine, or the sync_engine of an async one, in the active QueryCounter."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _current.get():
+            conn.info["query_start"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        counter = _current.get()
+        start = conn.info.pop("query_start", None)
+        if counter and start is not None:
+            counter.add(statement, time.perf_counter() - start)
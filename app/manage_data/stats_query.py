@@ -0,0 +1,98 @@
+import operator
+import re
+from fastapi import HTTPException
+from sqlalchemy import Float, Integer, Select, case, cast, func, select, union_all
+from .orm import Championship, Match, Player, PlayerStats, Team
+from .data_orm import PLAYER_STAT_FIELDS, TEAM_STAT_FIELDS
+
+# Source -> stat keys that can be aggregated and filtered on
+STAT_SOURCES = {"player": PLAYER_STAT_FIELDS, "team": TEAM_STAT_FIELDS}
+AGGREGATES = {"sum": func.sum, "avg": func.avg, "max": func.max, "min": func.min}
+GROUPS = ("player", "team", "championship")
+
+STAT_FILTER = re.compile(r"^\s*(\w+)\s*(>=|<=|!=|=|>|<)\s*(-?\d+(?:\.\d+)?)\s*$")
+OPERATORS = {">=": operator.ge, "<=": operator.le, "!=": operator.ne, "=": operator.eq, ">": operator.gt, "<": operator.lt}
+
+
+def parse_stat_filter(expression: str, fields: dict[str, tuple[str, type]]) -> tuple[str, str, int | float]:
+    """Split a filter such as "all_goals>=5" into its stat key, operator and value."""
+    matched = STAT_FILTER.match(expression)
+    if not matched:
+        raise HTTPException(status_code=400, detail=f"Invalid filter '{expression}', expected e.g. 'all_goals>=5'.")
+    key, op, value = matched.groups()
+    if key not in fields:
+        raise HTTPException(status_code=400, detail=f"Unknown stat '{key}' in filter '{expression}'.")
+    return key, op, float(value) if "." in value else int(value)
+
+
+def _stat_rows(source: str):
+    """One row per stat line, a player's stats in a match or a team's, with its championship and team."""
+    if source == "player":
+        return (
+            select(Match.championship_id, PlayerStats.team_id, PlayerStats.player_id, PlayerStats.stats)
+            .join(Match, Match.id == PlayerStats.match_id)
+            .subquery("stat_rows")
+        )
+
+    return union_all(
+        select(Match.championship_id, Match.team_a_id.label("team_id"), Match.team_a_stats.label("stats")).where(Match.team_a_stats.is_not(None)),
+        select(Match.championship_id, Match.team_b_id, Match.team_b_stats).where(Match.team_b_stats.is_not(None)),
+    ).subquery("stat_rows")
+
+
+def aggregate_stats_query(source: str, stat: str, agg: str, group_by: str, filters: list[str] | None = None,
+                          championship_id: int | None = None, team_id: int | None = None, limit: int = 50) -> Select:
+    """Build the query aggregating a stat key over the stat lines of a source, grouped by player, team or championship.
+
+    Stats that were missing from the CP file are stored as -1 and left out of
+    the aggregate. Filters are applied to every stat line before grouping.
+    """
+    fields = STAT_SOURCES.get(source)
+    if fields is None:
+        raise HTTPException(status_code=400, detail=f"Unknown source '{source}', expected one of {', '.join(STAT_SOURCES)}.")
+    if stat not in fields:
+        raise HTTPException(status_code=400, detail=f"Unknown {source} stat '{stat}', expected one of {', '.join(fields)}.")
+    if agg not in AGGREGATES:
+        raise HTTPException(status_code=400, detail=f"Unknown aggregate '{agg}', expected one of {', '.join(AGGREGATES)}.")
+    if group_by not in GROUPS or (group_by == "player" and source != "player"):
+        raise HTTPException(status_code=400, detail=f"Cannot group {source} stats by '{group_by}'.")
+
+    rows = _stat_rows(source)
+
+    def stat_value(key: str):
+        return cast(rows.c.stats[key].astext, Integer if fields[key][1] is int else Float)
+
+    conditions = []
+    for key, op, value in (parse_stat_filter(expression, fields) for expression in filters or []):
+        if op == "=" and source == "player":
+            # Served by the GIN index of player_stats
+            conditions.append(rows.c.stats.contains({key: value}))
+        else:
+            conditions.append(OPERATORS[op](stat_value(key), value))
+    if championship_id is not None:
+        conditions.append(rows.c.championship_id == championship_id)
+    if team_id is not None:
+        conditions.append(rows.c.team_id == team_id)
+
+    value = stat_value(stat)
+    known = case((value >= 0, value))
+    aggregated = AGGREGATES[agg](known).label("value")
+    counted = func.count(known).label("matches")
+
+    if group_by == "player":
+        group = (Player.id.label("player_id"), Player.first_name, Player.last_name)
+        query = select(*group, aggregated, counted).join(rows, rows.c.player_id == Player.id)
+    elif group_by == "team":
+        group = (Team.id.label("team_id"), Team.name, Team.abbreviation)
+        query = select(*group, aggregated, counted).join(rows, rows.c.team_id == Team.id)
+    else:
+        group = (Championship.id.label("championship_id"), Championship.name)
+        query = select(*group, aggregated, counted).join(rows, rows.c.championship_id == Championship.id)
+
+    return (
+        query.where(*conditions)
+        .group_by(*group)
+        .having(counted > 0)
+        .order_by(aggregated.desc(), *group[:1])
+        .limit(limit)
+    )
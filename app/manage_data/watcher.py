@@ -0,0 +1,202 @@
+from pathlib import Path
+from typing import Callable
+import codecs
+import hashlib
+import logging
+import re
+import threading
+import time
+from sqlalchemy.orm import Session
+from .data_orm import Champ
+from .parser import CpFileParser, CpContinuityError
+
+logger = logging.getLogger(__name__)
+
+# The [Actions] line, the header sections before it are rewritten, the action lines after it only grow
+ACTIONS_LINE = re.compile(rb"^[ \t]*\[actions\][ \t]*\r?\n", re.IGNORECASE | re.MULTILINE)
+
+# Lines of these encodings do not end in a single b"\n", their files are always parsed in full
+WIDE_BYTE_ORDER_MARKS = (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE, codecs.BOM_UTF32_BE)
+
+
+class CpFolderWatcher:
+    """Polls a directory of growing CP files and applies their changes to one championship.
+
+    A file is picked up when its size or mtime changes and its content hash
+    differs from what was last applied. Once it has been quiet for `debounce`
+    seconds, or has kept changing for `max_delay` seconds, only the action
+    lines appended since the last apply are parsed, together with the header
+    sections when they changed, and stored through Champ. Files that were
+    rewritten before the last applied line are parsed in full instead.
+
+    A change is applied at most 2 * interval + max_delay seconds after it is
+    written, plus the time the apply takes: one interval until a poll sees it
+    and one until the poll that finds it due. The hub and cache are handed to
+    Champ, so a watcher running in the API process publishes to its live
+    streams and invalidates its cached responses.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], championship_id: int, directory: str | Path,
+                 parser: CpFileParser | None = None, interval: float = 0.1, debounce: float = 0.2, max_delay: float = 0.7,
+                 hub=None, cache=None):
+        self.session_factory = session_factory
+        self.championship_id = championship_id
+        self.directory = Path(directory)
+        self.parser = parser or CpFileParser()
+        self.interval = interval
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.hub = hub
+        self.cache = cache
+        # File name -> watch state, see _poll_file
+        self.files: dict[str, dict] = {}
+
+    def run(self, stop: threading.Event | None = None) -> None:
+        """Poll until interrupted, or until stop is set when running in a thread."""
+        logger.info("Watching %s for championship %s", self.directory, self.championship_id)
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            started = time.monotonic()
+            try:
+                self.poll()
+            except OSError as e:
+                # The share is unmounted or unreachable, keep polling until it is back
+                logger.warning("Could not list %s: %s", self.directory, e)
+            stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def poll(self) -> None:
+        """Check every CP file of the directory once and apply those that are due."""
+        now = time.monotonic()
+        seen = set()
+        for path in self.directory.iterdir():
+            if not path.suffix.lower() == ".cp" or not path.is_file():
+                continue
+            seen.add(path.name)
+            try:
+                self._poll_file(path, now)
+            except OSError as e:
+                # Deleted or still locked by the scoring PC, try again on the next poll
+                logger.warning("Could not read %s: %s", path.name, e)
+
+        for file_name in set(self.files) - seen:
+            del self.files[file_name]
+
+    def _poll_file(self, path: Path, now: float) -> None:
+        stat = path.stat()
+        watched = self.files.setdefault(path.name, {
+            "size": None,            # size and mtime of the last poll
+            "mtime_ns": None,
+            "changed_at": None,      # first and last poll that saw an unapplied change
+            "last_change": None,
+            "content_hash": None,    # hash of the content last applied
+            "header_hash": None,     # hash of the header up to and including [Actions]
+            "actions_hash": None,    # hash of the action bytes applied
+            "actions_size": 0,
+            "action_lines_count": None,
+        })
+
+        if (stat.st_size, stat.st_mtime_ns) != (watched["size"], watched["mtime_ns"]):
+            watched["size"], watched["mtime_ns"] = stat.st_size, stat.st_mtime_ns
+            watched["last_change"] = now
+            if watched["changed_at"] is None:
+                watched["changed_at"] = now
+
+        if watched["changed_at"] is None:
+            return
+        quiet = now - watched["last_change"] >= self.debounce
+        overdue = now - watched["changed_at"] >= self.max_delay
+        if not (quiet or overdue):
+            return
+
+        watched["changed_at"] = None
+        content = path.read_bytes()
+        content_hash = hashlib.sha256(content).hexdigest()
+        # Touched or rewritten with the same content
+        if content_hash == watched["content_hash"]:
+            return
+
+        start = time.perf_counter()
+        try:
+            actions_count = self._apply(path.name, content, watched)
+        except Exception as e:
+            # Start over from the persisted checkpoint on the next change
+            self.parser.forget(self.championship_id, path.name)
+            watched.update(content_hash=None, action_lines_count=None)
+            logger.error("Failed to apply %s: %s", path.name, getattr(e, "detail", e))
+            return
+
+        watched["content_hash"] = content_hash
+        logger.info("Applied %s: %s actions in %.1f ms", path.name, actions_count, (time.perf_counter() - start) * 1000)
+
+    def _apply(self, file_name: str, content: bytes, watched: dict) -> int:
+        """Apply the appended action lines of a file when possible, else the whole file."""
+        if content.startswith(WIDE_BYTE_ORDER_MARKS):
+            return self._apply_full(file_name, content, watched)
+
+        # A line still being written is left for the next poll
+        complete = content[:content.rfind(b"\n") + 1]
+        actions_line = ACTIONS_LINE.search(complete)
+        if not actions_line:
+            return self._apply_full(file_name, complete, watched)
+
+        header, actions = complete[:actions_line.end()], complete[actions_line.end():]
+        applied = watched["actions_size"]
+        appendable = (
+            watched["action_lines_count"] is not None
+            and len(actions) >= applied
+            and hashlib.sha256(actions[:applied]).hexdigest() == watched["actions_hash"]
+        )
+        if not appendable:
+            return self._apply_full(file_name, complete, watched)
+
+        header_hash = hashlib.sha256(header).hexdigest()
+        header_content = header if header_hash != watched["header_hash"] else None
+        new_actions = actions[applied:]
+        if header_content is None and not new_actions:
+            return 0
+
+        session = self.session_factory()
+        try:
+            champ = Champ(id=self.championship_id, session=session, hub=self.hub, cache=self.cache)
+            checkpoint = champ.load_checkpoint(file_name)
+            try:
+                parsed_data, checkpoint = self.parser.parse_delta(new_actions, file_name, self.championship_id,
+                                                                  watched["action_lines_count"], checkpoint, header_content)
+            except CpContinuityError:
+                # The file was also ingested elsewhere, resume from the stored checkpoint instead
+                return self._apply_full(file_name, complete, watched)
+            champ.process_data(parsed_data, file_name, checkpoint)
+        finally:
+            session.close()
+
+        watched.update(
+            header_hash=header_hash,
+            actions_hash=hashlib.sha256(actions).hexdigest(),
+            actions_size=len(actions),
+            action_lines_count=checkpoint["action_lines_count"],
+        )
+        return len(parsed_data.get("actions", []))
+
+    def _apply_full(self, file_name: str, complete: bytes, watched: dict) -> int:
+        """Parse a whole file, resuming from the stored checkpoint when it still matches, and note where it ended."""
+        session = self.session_factory()
+        try:
+            champ = Champ(id=self.championship_id, session=session, hub=self.hub, cache=self.cache)
+            checkpoint = champ.load_checkpoint(file_name)
+            parsed_data, checkpoint = self.parser.parse_with_checkpoint(complete, file_name, self.championship_id, checkpoint)
+            champ.process_data(parsed_data, file_name, checkpoint)
+        finally:
+            session.close()
+
+        actions_line = ACTIONS_LINE.search(complete)
+        if checkpoint and actions_line and not complete.startswith(WIDE_BYTE_ORDER_MARKS):
+            header, actions = complete[:actions_line.end()], complete[actions_line.end():]
+            watched.update(
+                header_hash=hashlib.sha256(header).hexdigest(),
+                actions_hash=hashlib.sha256(actions).hexdigest(),
+                actions_size=len(actions),
+                action_lines_count=checkpoint["action_lines_count"],
+            )
+        else:
+            watched["action_lines_count"] = None
+        return len(parsed_data.get("actions", []))
@@ -0,0 +1,99 @@
+import logging
+import time
+from prometheus_client import Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from manage_data.db_pool import pool_status
+from manage_data.query_counter import count_queries
+
+logger = logging.getLogger(__name__)
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to the response headers of each request, per route template.",
+    ["method", "route", "status"],
+)
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware observing the latency of every request in REQUEST_SECONDS.
+
+    Requests are labelled with their route template, e.g. /matches/{match_id}/full,
+    so the label set stays bounded. Streaming responses are timed to their headers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+
+        async def send_timed(message):
+            if message["type"] == "http.response.start":
+                # The router has set the matched route by the time the response starts
+                route = scope.get("route")
+                REQUEST_SECONDS.labels(scope["method"], route.path if route else "unmatched", message["status"]).observe(time.perf_counter() - start)
+            await send(message)
+
+        await self.app(scope, receive, send_timed)
+
+
+class QueryCountMiddleware:
+    """ASGI middleware counting the SQL statements of every request.
+
+    With headers on, responses carry X-DB-Queries and X-DB-Time-Ms. Requests running
+    more than budget statements are logged with their route, 0 disables the budget.
+    """
+
+    def __init__(self, app, headers: bool = False, budget: int = 0):
+        self.app = app
+        self.headers = headers
+        self.budget = budget
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        with count_queries() as queries:
+            async def send_counted(message):
+                if message["type"] == "http.response.start" and self.headers:
+                    # Statements run while a streaming body is sent are not in the headers
+                    message["headers"] = [
+                        *message.get("headers", []),
+                        (b"x-db-queries", str(queries.count).encode()),
+                        (b"x-db-time-ms", str(round(queries.duration * 1000, 3)).encode()),
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_counted)
+
+        if self.budget and queries.count > self.budget:
+            route = scope.get("route")
+            logger.warning("%s %s ran %d queries in %.1f ms, over the budget of %d",
+                           scope["method"], route.path if route else scope["path"], queries.count, queries.duration * 1000, self.budget)
+
+
+class PoolCollector:
+    """Exposes the occupancy and counters of the database pools, read from pool_status at scrape time."""
+
+    def __init__(self, engines: dict):
+        # Label -> synchronous engine built with an instrumented pool
+        self.engines = engines
+
+    def collect(self):
+        gauges = {
+            "checked_out": GaugeMetricFamily("db_pool_checked_out", "Connections in use.", labels=["pool"]),
+            "checked_in": GaugeMetricFamily("db_pool_checked_in", "Idle connections in the pool.", labels=["pool"]),
+            "overflow": GaugeMetricFamily("db_pool_overflow", "Connections open beyond pool_size.", labels=["pool"]),
+        }
+        counters = {
+            "checkouts": CounterMetricFamily("db_pool_checkouts", "Connections checked out of the pool.", labels=["pool"]),
+            "timeouts": CounterMetricFamily("db_pool_timeouts", "Checkouts that waited past pool_timeout.", labels=["pool"]),
+            "overflow_connects": CounterMetricFamily("db_pool_overflow_connects", "Connections opened beyond pool_size.", labels=["pool"]),
+        }
+        for label, engine in self.engines.items():
+            status = pool_status(engine)
+            for key, family in {**gauges, **counters}.items():
+                family.add_metric([label], status[key])
+        yield from gauges.values()
+        yield from counters.values()
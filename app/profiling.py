@@ -0,0 +1,125 @@
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ID = re.compile(r"^[0-9a-f]{32}$")
+# Only one cProfile profiler may be active per process on Python 3.12+, captures never wait for it
+_profiler_lock = threading.Lock()
+
+
+class ProfileStore:
+    """cProfile captures of ingests, kept on disk as a ring buffer of the last max_profiles.
+
+    Each capture is a pstats dump, <id>.prof, next to its metadata, <id>.json, so the
+    buffer survives restarts and the dumps open in pstats or snakeviz.
+    """
+
+    def __init__(self, directory: str, max_profiles: int = 20, sample_rate: float = 0.0):
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def should_profile(self, requested: bool = False) -> bool:
+        """Profile the ingests asked for explicitly, and a sample_rate fraction of the others."""
+        return requested or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    @contextmanager
+    def capture(self, enabled: bool, **meta):
+        """Profile the block when enabled, the yielded dict gets the "id" of the saved profile.
+
+        Captures run one at a time: while one is running, other blocks run unprofiled
+        rather than wait or fail. On Python 3.12+ the profile also holds the frames of
+        the other threads that ran meanwhile. A profile that cannot be written is
+        logged and dropped, "id" stays None.
+        """
+        result = {"id": None}
+        if not enabled or not _profiler_lock.acquire(blocking=False):
+            yield result
+            return
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiling tool, e.g. a debugger, is active
+            _profiler_lock.release()
+            yield result
+            return
+
+        start = time.perf_counter()
+        try:
+            yield result
+        except Exception as e:
+            # Failed ingests are often the slow ones, keep their profile too
+            meta["error"] = str(getattr(e, "detail", e))
+            raise
+        finally:
+            profiler.disable()
+            _profiler_lock.release()
+            try:
+                result["id"] = self._save(profiler, duration_ms=round((time.perf_counter() - start) * 1000, 3), **meta)
+            except OSError:
+                # The profiled block has already succeeded or failed on its own, a full disk must not change that
+                logger.exception("Could not save the profile of %s", meta)
+
+    def list(self) -> list[dict]:
+        """Metadata of the stored profiles, most recent first."""
+        profiles = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                try:
+                    with open(os.path.join(self.directory, name)) as meta_file:
+                        profiles.append(json.load(meta_file))
+                except (OSError, ValueError):
+                    # Trimmed by another worker while listing
+                    continue
+        return sorted(profiles, key=lambda profile: profile["created_at"], reverse=True)
+
+    def path(self, profile_id: str) -> str | None:
+        """Path of a stored pstats dump, None for an unknown or malformed id."""
+        if not PROFILE_ID.match(profile_id):
+            return None
+        path = os.path.join(self.directory, f"{profile_id}.prof")
+        return path if os.path.exists(path) else None
+
+    def summary(self, profile_id: str, limit: int = 50) -> str | None:
+        """The top functions of a profile by cumulative time, as printed by pstats."""
+        path = self.path(profile_id)
+        if not path:
+            return None
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+    def _save(self, profiler: cProfile.Profile, **meta) -> str:
+        profile_id = uuid.uuid4().hex
+        meta = {"id": profile_id, "created_at": datetime.now(timezone.utc).isoformat(), **meta}
+        with self._lock:
+            profiler.dump_stats(os.path.join(self.directory, f"{profile_id}.prof"))
+            with open(os.path.join(self.directory, f"{profile_id}.json"), "w") as meta_file:
+                json.dump(meta, meta_file)
+            self._trim()
+        return profile_id
+
+    def _trim(self) -> None:
+        """Delete the oldest profiles beyond max_profiles."""
+        for profile in self.list()[self.max_profiles:]:
+            for extension in (".prof", ".json"):
+                try:
+                    os.remove(os.path.join(self.directory, profile["id"] + extension))
+                except FileNotFoundError:
+                    pass
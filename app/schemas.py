@@ -1,6 +1,6 @@
-from pydantic import BaseModel
-from typing import List, Optional,Dict
-from datetime import date
+from pydantic import BaseModel, Field
+from typing import Generic, List, Optional, Dict, TypeVar
+from datetime import date, datetime
 
 
 # --- User Models ---
@@ -81,6 +81,42 @@ class championshipout_linked(ChampionshipOut):
     teams: List[TeamOut] = []  # Nested team data
 
     
+class StandingOut(BaseModel):
+    team: TeamOut
+    played: int
+    won: int
+    drawn: int
+    lost: int
+    goals_for: int
+    goals_against: int
+    goal_difference: int
+    points: int
+
+
+class LeaderOut(BaseModel):
+    player_id: int
+    first_name: str
+    last_name: str
+    team_id: Optional[int] = None
+    matches: int
+    goals: int
+    efficiency: Optional[float] = None
+    suspensions: int
+
+
+class StatAggregateOut(BaseModel):
+    # Set according to group_by
+    player_id: Optional[int] = None
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    team_id: Optional[int] = None
+    abbreviation: Optional[str] = None
+    championship_id: Optional[int] = None
+    name: Optional[str] = None
+    value: Optional[float] = None
+    matches: int
+
+
 class TeamIDs(BaseModel):
     team_ids: List[int]
 
@@ -140,4 +176,82 @@ class ActionOut(BaseModel):
     Name: str
     Nr: str
     Text: str
-    PLTime: str
\ No newline at end of file
+    PLTime: str
+    NoAct: Optional[str] = None
+    Pos: Optional[int] = None
+    Time: Optional[int] = None
+
+
+class ActionPageOut(BaseModel):
+    items: List[ActionOut]
+    next: Optional[str] = None
+
+
+# --- Match center output, the sections left out of include= are null ---
+class MatchFullOut(MatchBaseOut):
+    status: Optional[str] = None
+    version: int
+    team_a_score: Optional[Dict] = None
+    team_b_score: Optional[Dict] = None
+    team_a_stats: Optional[Dict] = None
+    team_b_stats: Optional[Dict] = None
+    referees: Optional[List[RefereeWithRoleOut]] = None
+    player_stats: Optional[List[PlayerStatsOut]] = None
+    actions: Optional[List[ActionOut]] = None
+
+
+# A page of a list endpoint and the cursor of the next one, the endpoints return the items and send the cursor in X-Next-Cursor
+ItemT = TypeVar("ItemT")
+
+class Page(BaseModel, Generic[ItemT]):
+    items: List[ItemT]
+    next: Optional[str] = None
+
+
+# --- Ingest Job Models ---
+
+class IngestJobOut(BaseModel):
+    id: str
+    state: str
+    championship_id: int
+    file_name: str
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    actions_count: Optional[int] = None
+    action_lines_count: Optional[int] = None
+    timings: Dict[str, float] = {}
+    skipped_stages: Dict[str, str] = {}
+    rows: Dict[str, int] = {}
+    # Statements run by the job and the time spent in them: {"count": ..., "db_ms": ...}
+    queries: Dict[str, float] = {}
+    # Set when the job was profiled, see GET /admin/profiles/{profile_id}
+    profile_id: Optional[str] = None
+    error: Optional[str] = None
+
+
+# --- Profiling Models ---
+
+class ProfilingSettings(BaseModel):
+    sample_rate: float = Field(ge=0, le=1)
+
+
+# --- Archive Ingest Models ---
+
+class ArchiveFileOut(BaseModel):
+    file_name: str
+    state: str
+    actions_count: Optional[int] = None
+    action_lines_count: Optional[int] = None
+    timings: Dict[str, float] = {}
+    skipped_stages: Dict[str, str] = {}
+    rows: Dict[str, int] = {}
+    error: Optional[str] = None
+
+
+class ArchiveIngestOut(BaseModel):
+    championship_id: int
+    succeeded: int
+    failed: int
+    elapsed_ms: float
+    files: List[ArchiveFileOut]
@@ -1,3 +1,5 @@
+import base64
+import json
 import bcrypt
 
 # Hash the password (for storing in DB)
@@ -7,3 +9,16 @@ def hash_password(password: str) -> str:
 # Verify input password against hashed password from DB
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+
+# Opaque pagination cursor holding the sort key of the last row of a page
+def encode_cursor(key: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(",", ":")).encode()).decode().rstrip("=")
+
+# Decode a cursor made by encode_cursor, None if it is not one
+def decode_cursor(cursor: str) -> list | None:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        return None
+    return key if isinstance(key, list) else None
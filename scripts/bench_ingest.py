@@ -0,0 +1,130 @@
+"""Time the ingest of a generated CP file, to compare the actions upsert with the per-action loop it replaced.
+
+Run from the repository root against a scratch database, configured like the app in .env:
+
+    python scripts/bench_ingest.py --actions 1000 --runs 5
+    python scripts/bench_ingest.py --actions 1000 --runs 5 --legacy
+
+Each run ingests the file as a new match, then uploads it again unchanged. The
+first upload inserts every action, the second finds them all unchanged. --legacy
+replaces Champ.add_or_update_actions with the original loop: one SELECT and one
+write per action. It is flushed rather than committed, the stages now run in a
+savepoint of the upload's transaction. The legacy rows have no pos, like the
+rows it used to write.
+Everything the benchmark created is deleted at the end.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from manage_data.data_orm import Champ  # noqa: E402
+from manage_data.orm import Action, Championship, SessionLocal, Team  # noqa: E402
+from manage_data.parser import CpFileParser  # noqa: E402
+from manage_data.query_counter import count_queries  # noqa: E402
+
+
+def make_cp_file(game_code: str, team_a: str, team_b: str, actions: int) -> bytes:
+    """A CP file with the sections Champ requires, 14 players per team and the given number of action lines."""
+    lines = [
+        "[Definition]",
+        "GameInfo=Game;TIDA;TIDB;TeamNameA;TeamNameB;GStatus;RA;RA1;RA2;RB;RB1;RB2",
+        "StatInd=Game;TID;FirstName;SurName;Nr;AllG;AllEff;YC;RC;EX;P2minT",
+        "StatTeam=Game;Team;AllG;AllShots;AllEff",
+        "Actions=Game;PLTime;Pos;Team;Nr;Name;NoAct;Text",
+        "[GameInfo]",
+        f"{game_code};{team_a};{team_b};Bench {team_a};Bench {team_b};1;30;15;15;28;14;14",
+        "[StatInd]",
+    ]
+    for team in (team_a, team_b):
+        lines += [f"{game_code};{team};Player{number};{team};{number};2;50;0;0;0;1" for number in range(1, 15)]
+    lines += ["[StatTeam]", f"{game_code};{team_a};30;50;60", f"{game_code};{team_b};28;52;54", "[Actions]"]
+    for pos in range(1, actions + 1):
+        team = team_a if pos % 2 else team_b
+        seconds = pos * 3600 // actions
+        lines.append(f"{game_code};{seconds // 60}:{seconds % 60:02d};{pos};{team};{pos % 14 + 1};Player{pos % 14 + 1};G;Goal")
+    return ("\r\n".join(lines) + "\r\n").encode()
+
+
+def legacy_add_or_update_actions(self, parsed_data, match_id):
+    """The original add_or_update_actions: one SELECT and one round trip per action line, a flush instead of its commit."""
+    fields_to_store = ['Game', 'Team', 'Name', 'Nr', 'Text', 'PLTime', 'NoAct', 'Pos', 'Time']
+    for action_data in parsed_data["actions"]:
+        action_data["Time"] = self._pltime_to_sec(action_data["PLTime"])
+        filtered_data = {key: action_data.get(key, '') for key in fields_to_store}
+        existing = self.session.query(Action).filter(
+            Action.match_id == match_id,
+            Action.data['Pos'].astext == filtered_data['Pos']
+        ).first()
+        if existing:
+            existing.data = filtered_data
+        else:
+            self.session.add(Action(match_id=match_id, data=filtered_data))
+        self.session.flush()
+
+
+def ingest(championship_id: int, file_name: str, content: bytes) -> tuple[float, float, int]:
+    """Parse and apply a file like the upload endpoints do, return (total ms, actions stage ms, queries)."""
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        with count_queries() as queries:
+            champ = Champ(id=championship_id, session=db)
+            parsed_data, checkpoint = CpFileParser().parse_with_checkpoint(content, file_name, championship_id, champ.load_checkpoint(file_name))
+            champ.process_data(parsed_data, file_name, checkpoint)
+        return (time.perf_counter() - start) * 1000, champ.stage_timings.get("actions", 0.0), queries.count
+    finally:
+        db.close()
+
+
+def report(label: str, results: list[tuple[float, float, int]]) -> None:
+    total, actions, queries = zip(*results)
+    print(f"{label:<10} total {statistics.median(total):9.1f} ms   actions stage {statistics.median(actions):9.1f} ms   "
+          f"queries {statistics.median(queries):7.0f}   (median of {len(results)})")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--actions", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--legacy", action="store_true", help="Time the per-action loop the upsert replaced.")
+    args = parser.parse_args()
+
+    if args.legacy:
+        Champ.add_or_update_actions = legacy_add_or_update_actions
+
+    suffix = uuid.uuid4().hex[:6].upper()
+    team_a, team_b = f"A{suffix}", f"B{suffix}"
+    db = SessionLocal()
+    championship = Championship(name=f"bench-{suffix}")
+    db.add(championship)
+    db.commit()
+    championship_id = championship.id
+
+    first, again = [], []
+    try:
+        for run in range(args.runs):
+            file_name = f"bench_{run}.CP"
+            content = make_cp_file(f"BENCH{run}", team_a, team_b, args.actions)
+            first.append(ingest(championship_id, file_name, content))
+            # Under another file name there is no checkpoint, so the whole file is parsed and applied to the existing match
+            again.append(ingest(championship_id, f"again_{file_name}", content))
+    finally:
+        db.delete(db.get(Championship, championship_id))
+        for team in db.query(Team).filter(Team.abbreviation.in_((team_a, team_b))):
+            db.delete(team)
+        db.commit()
+        db.close()
+
+    print(f"{args.actions} actions, {'per-action loop' if args.legacy else 'set-based upsert'}")
+    report("new match", first)
+    report("re-upload", again)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
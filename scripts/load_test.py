@@ -0,0 +1,132 @@
+"""Measure requests/sec and latency of the read endpoints under concurrent readers.
+
+Start the API, then run from the repository root, standard library only:
+
+    python scripts/load_test.py http://localhost:8000 --concurrency 200 --duration 30 --match-id 1
+
+Each reader holds one keep-alive connection and requests the paths in turn, for
+--duration seconds after --warmup. Without --path the readers cycle over the
+championship and team lists, plus the score, full and actions of --match-id.
+Compare the synchronous API, the parent of the commit "Serve the API from an
+asyncpg-backed AsyncSession", with the current one, on the same database and
+the same uvicorn --workers. Check the baseline out in a worktree:
+
+    git worktree add ../sync-api "$(git log -1 --format=%H --grep='asyncpg-backed AsyncSession')~1"
+"""
+import argparse
+import asyncio
+import collections
+import statistics
+import sys
+import time
+from urllib.parse import urlsplit
+
+
+async def read_response(reader: asyncio.StreamReader) -> tuple[int, bool]:
+    """Read one HTTP/1.1 response, return (status, keep-alive)."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("connection closed by the server")
+    status = int(status_line.split()[1])
+    headers = {}
+    while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while size := int((await reader.readline()).split(b";")[0], 16):
+            await reader.readexactly(size + 2)
+        # Trailers end on an empty line
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+    elif "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+    return status, headers.get("connection", "").lower() != "close"
+
+
+async def reader_task(host: str, port: int, paths: list[str], offset: int, warm_until: float, stop_at: float,
+                      latencies: list[float], statuses: collections.Counter) -> None:
+    """One reader: a keep-alive connection cycling over paths, recording what finishes after warm_until.
+
+    Latencies are kept for HTTP responses only, connection errors are counted by exception name.
+    """
+    connection = None
+    index = offset
+    while time.perf_counter() < stop_at:
+        path = paths[index % len(paths)]
+        index += 1
+        start = time.perf_counter()
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection(host, port)
+            stream_reader, writer = connection
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nAccept: application/json\r\n\r\n".encode())
+            await writer.drain()
+            status, keep_alive = await read_response(stream_reader)
+            end = time.perf_counter()
+            if not keep_alive:
+                writer.close()
+                connection = None
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError) as e:
+            if warm_until <= time.perf_counter() <= stop_at:
+                statuses[type(e).__name__] += 1
+            if connection is not None:
+                connection[1].close()
+                connection = None
+            # Do not spin on a server that is down or refusing connections
+            await asyncio.sleep(0.1)
+            continue
+        if warm_until <= end <= stop_at:
+            latencies.append(end - start)
+            statuses[status] += 1
+    if connection is not None:
+        connection[1].close()
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+async def run(args) -> int:
+    url = urlsplit(args.base_url)
+    host, port = url.hostname, url.port or 80
+    prefix = url.path.rstrip("/")
+    paths = args.path or ["/championships", "/teams"]
+    if not args.path and args.match_id:
+        paths += [f"/matches/{args.match_id}/score", f"/matches/{args.match_id}/full", f"/matches/{args.match_id}/actions"]
+    paths = [prefix + path for path in paths]
+
+    latencies, statuses = [], collections.Counter()
+    warm_until = time.perf_counter() + args.warmup
+    stop_at = warm_until + args.duration
+    await asyncio.gather(*(
+        reader_task(host, port, paths, offset, warm_until, stop_at, latencies, statuses)
+        for offset in range(args.concurrency)
+    ))
+
+    if not latencies:
+        print("no response received: " + ", ".join(f"{error}: {count}" for error, count in statuses.items()))
+        return 1
+    latencies.sort()
+    print(f"{args.concurrency} readers, {args.duration:.0f} s, {len(paths)} paths")
+    print(f"requests   {len(latencies)}   {len(latencies) / args.duration:.1f} req/s")
+    print("latency ms " + "   ".join(
+        f"p{int(fraction * 100)} {percentile(latencies, fraction) * 1000:.1f}" for fraction in (0.5, 0.9, 0.99)
+    ) + f"   mean {statistics.fmean(latencies) * 1000:.1f}   max {latencies[-1] * 1000:.1f}")
+    print("responses  " + "   ".join(f"{status}: {count}" for status, count in sorted(statuses.items(), key=str)))
+    return 0 if all(status == 200 for status in statuses) else 1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("base_url", nargs="?", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=30, help="Seconds measured after the warmup.")
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--match-id", type=int, help="Also read the score, full match and actions of this match.")
+    parser.add_argument("--path", action="append", help="Path to request, repeatable, replaces the default paths.")
+    return asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
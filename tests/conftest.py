@@ -0,0 +1,78 @@
+import asyncio
+import json
+import os
+import sys
+from urllib.parse import urlsplit
+import pytest
+
+# The app's modules import each other from the app directory, as when run with `cd app`
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+
+class AsgiClient:
+    """Calls an ASGI app in-process, on one event loop, which the async engine's pooled connections belong to."""
+
+    def __init__(self, app):
+        self.app = app
+        self.loop = asyncio.new_event_loop()
+
+    def run(self, awaitable):
+        return self.loop.run_until_complete(awaitable)
+
+    def get(self, url: str, headers: dict | None = None) -> tuple[int, dict, bytes]:
+        return self.run(self._request("GET", url, headers or {}))
+
+    def get_json(self, url: str):
+        status, _, body = self.get(url)
+        assert status == 200, body
+        return json.loads(body)
+
+    async def _request(self, method: str, url: str, headers: dict) -> tuple[int, dict, bytes]:
+        parts = urlsplit(url)
+        scope = {
+            "type": "http", "http_version": "1.1", "method": method, "scheme": "http",
+            "path": parts.path, "raw_path": parts.path.encode(), "query_string": parts.query.encode(), "root_path": "",
+            "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+            "server": ("testserver", 80), "client": ("testclient", 50000),
+        }
+        messages = []
+        request_sent = False
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            # The client never disconnects
+            await asyncio.Event().wait()
+
+        async def send(message):
+            messages.append(message)
+
+        await self.app(scope, receive, send)
+        start, body = messages[0], b"".join(message.get("body", b"") for message in messages[1:])
+        return start["status"], {name.decode(): value.decode() for name, value in start["headers"]}, body
+
+    def close(self) -> None:
+        self.loop.close()
+
+
+@pytest.fixture(scope="session")
+def api():
+    """An AsgiClient of the app, on the database the DB_* variables point at.
+
+    Tests using it are skipped when no database is configured or reachable. Use a
+    scratch database: the app creates its tables on import and the tests write to them.
+    """
+    from sqlalchemy.exc import OperationalError
+    try:
+        import main
+    except RuntimeError as e:
+        pytest.skip(f"No database configured: {e}")
+    except OperationalError as e:
+        pytest.skip(f"Database unreachable: {e.orig}")
+
+    client = AsgiClient(main.app)
+    yield client
+    client.run(main.async_engine.dispose())
+    client.close()
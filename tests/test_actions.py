@@ -0,0 +1,38 @@
+"""Storing action lines, against the database of the DB_* variables."""
+import logging
+import uuid
+from test_api_queries import cp_file
+
+
+def test_codes_longer_than_their_column_are_cut_instead_of_failing_the_upload(api, caplog):
+    from manage_data.data_orm import Champ
+    from manage_data.orm import Championship, Match, SessionLocal, Team
+    from manage_data.parser import CpFileParser
+
+    suffix = uuid.uuid4().hex[:6].upper()
+    team_codes = (f"A{suffix}", f"B{suffix}")
+    content = cp_file(f"G{suffix}", *team_codes, actions=3)
+    content = content.replace(b";1;Player1;G;Goal", b";" + b"7" * 60 + b";Player1;" + b"X" * 60 + b";Goal", 1)
+    db = SessionLocal()
+    championship = Championship(name=f"test-{suffix}")
+    db.add(championship)
+    db.commit()
+    try:
+        data_sections, checkpoint = CpFileParser().parse_with_checkpoint(content, "G.CP", championship.id)
+        with caplog.at_level(logging.WARNING, logger="manage_data.data_orm"):
+            Champ(id=championship.id, session=db).process_data(data_sections, "G.CP", checkpoint)
+        match = db.query(Match).filter(Match.championship_id == championship.id).one()
+
+        page = api.get_json(f"/matches/{match.id}/actions")
+    finally:
+        db.rollback()
+        db.delete(db.get(Championship, championship.id))
+        for team in db.query(Team).filter(Team.abbreviation.in_(team_codes)):
+            db.delete(team)
+        db.commit()
+        db.close()
+
+    first = page["items"][0]
+    assert (first["Nr"], first["NoAct"]) == ("7" * 50, "X" * 50)
+    assert [action["NoAct"] for action in page["items"][1:]] == ["G", "G"]
+    assert len([record for record in caplog.records if "cut to 50 characters" in record.getMessage()]) == 2
@@ -0,0 +1,107 @@
+"""Query budgets of the read endpoints, against the database of the DB_* variables.
+
+A change that makes one of these endpoints run more statements, e.g. an N+1 loop
+over the teams or players, fails here with the statements it ran.
+"""
+import uuid
+import pytest
+from manage_data.query_counter import assert_max_queries
+
+
+def cp_file(game_code: str, team_a: str, team_b: str, players: int = 3, actions: int = 10) -> bytes:
+    lines = [
+        "[Definition]",
+        "GameInfo=Game;TIDA;TIDB;TeamNameA;TeamNameB;GStatus;RA;RA1;RA2;RB;RB1;RB2",
+        "StatInd=Game;TID;FirstName;SurName;Nr;AllG;AllEff;YC;RC;EX;P2minT",
+        "StatTeam=Game;Team;AllG;AllShots;AllEff",
+        "Actions=Game;PLTime;Pos;Team;Nr;Name;NoAct;Text",
+        "[GameInfo]",
+        f"{game_code};{team_a};{team_b};Team {team_a};Team {team_b};1;20;10;10;18;9;9",
+        "[StatInd]",
+    ]
+    for team in (team_a, team_b):
+        lines += [f"{game_code};{team};Player{number};{team};{number};2;50;0;0;0;1" for number in range(1, players + 1)]
+    lines += ["[StatTeam]", f"{game_code};{team_a};20;40;50", f"{game_code};{team_b};18;40;45", "[Actions]"]
+    lines += [f"{game_code};{pos // 60}:{pos % 60:02d};{pos};{team_a};1;Player1;G;Goal" for pos in range(1, actions + 1)]
+    return ("\r\n".join(lines) + "\r\n").encode()
+
+
+@pytest.fixture(scope="module")
+def stored_match(api):
+    """A championship holding one ingested match with 3 players per team, deleted afterwards."""
+    from manage_data.data_orm import Champ
+    from manage_data.orm import Championship, Match, SessionLocal, Team
+    from manage_data.parser import CpFileParser
+
+    suffix = uuid.uuid4().hex[:6].upper()
+    team_codes = (f"A{suffix}", f"B{suffix}")
+    db = SessionLocal()
+    championship = Championship(name=f"test-{suffix}")
+    db.add(championship)
+    db.commit()
+    try:
+        data_sections, checkpoint = CpFileParser().parse_with_checkpoint(cp_file(f"G{suffix}", *team_codes), "G.CP", championship.id)
+        Champ(id=championship.id, session=db).process_data(data_sections, "G.CP", checkpoint)
+        match = db.query(Match).filter(Match.championship_id == championship.id).one()
+        yield {"championship_id": championship.id, "match_id": match.id, "team_id": match.team_a_id}
+    finally:
+        db.rollback()
+        db.delete(db.get(Championship, championship.id))
+        for team in db.query(Team).filter(Team.abbreviation.in_(team_codes)):
+            db.delete(team)
+        db.commit()
+        db.close()
+
+
+def test_matches_of_a_championship_load_their_teams_in_the_same_query(api, stored_match):
+    with assert_max_queries(2):
+        matches = api.get_json(f"/championships/{stored_match['championship_id']}/matches")
+
+    assert [match["id"] for match in matches] == [stored_match["match_id"]]
+
+
+def test_standings_read_the_summary_table(api, stored_match):
+    with assert_max_queries(2):
+        api.get_json(f"/championships/{stored_match['championship_id']}/standings")
+
+
+def test_match_score_runs_the_etag_lookup_and_one_load(api, stored_match):
+    with assert_max_queries(2):
+        score = api.get_json(f"/matches/{stored_match['match_id']}/score")
+
+    assert score["team_a_score"]["total"] == 20
+
+
+def test_player_stats_of_a_match_are_one_query(api, stored_match):
+    with assert_max_queries(2):
+        stats = api.get_json(f"/matches/{stored_match['match_id']}/players/stats")
+
+    assert len(stats) == 6
+
+
+def test_unchanged_match_is_answered_from_its_etag(api, stored_match):
+    status, headers, _ = api.get(f"/matches/{stored_match['match_id']}/score")
+
+    with assert_max_queries(1):
+        status, _, _ = api.get(f"/matches/{stored_match['match_id']}/score", {"If-None-Match": headers["etag"]})
+
+    assert status == 304
+
+
+def test_full_match_is_one_query_per_section(api, stored_match):
+    # The ETag lookup, the match with its teams, then the referees, player stats and actions
+    with assert_max_queries(5):
+        full = api.get_json(f"/matches/{stored_match['match_id']}/full")
+
+    assert (len(full["player_stats"]), len(full["actions"])) == (6, 10)
+
+
+def test_full_finished_match_is_served_from_the_cache(api, stored_match, monkeypatch):
+    import main
+    monkeypatch.setattr(main, "FINISHED_MATCH_STATUSES", {"1"})
+    api.get_json(f"/matches/{stored_match['match_id']}/full?include=score")
+
+    with assert_max_queries(1):
+        full = api.get_json(f"/matches/{stored_match['match_id']}/full?include=score")
+
+    assert full["team_a_score"]["total"] == 20
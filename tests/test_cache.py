@@ -0,0 +1,124 @@
+"""ResponseCache and LRUCacheBackend tests."""
+import asyncio
+import pytest
+import cache
+from cache import CacheBackend, LRUCacheBackend, ResponseCache
+
+
+class Loader:
+    """A load function counting its calls."""
+
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+def test_second_read_is_a_hit():
+    response_cache = ResponseCache()
+    load = Loader([{"id": 1}])
+
+    assert response_cache.get_or_load("teams", "list", load) == [{"id": 1}]
+    assert response_cache.get_or_load("teams", "list", load) == [{"id": 1}]
+
+    assert load.calls == 1
+    assert response_cache.stats()["namespaces"] == {"teams": {"hits": 1, "misses": 1}}
+
+
+def test_async_load_is_cached():
+    response_cache = ResponseCache()
+    load = Loader({"id": 1})
+
+    async def load_async():
+        return load()
+
+    for _ in range(2):
+        assert asyncio.run(response_cache.get_or_load_async("championships", "name:WCh", load_async)) == {"id": 1}
+    assert load.calls == 1
+
+
+def test_invalidate_drops_only_its_namespaces():
+    response_cache = ResponseCache()
+    teams, players = Loader(["EGY"]), Loader(["Player1"])
+    response_cache.get_or_load("teams", "list", teams)
+    response_cache.get_or_load("players", "team:1", players)
+
+    response_cache.invalidate("teams")
+    response_cache.get_or_load("teams", "list", teams)
+    response_cache.get_or_load("players", "team:1", players)
+
+    assert teams.calls == 2
+    assert players.calls == 1
+
+
+def test_failed_load_is_not_cached():
+    response_cache = ResponseCache()
+
+    def fail():
+        raise LookupError("Team not found")
+
+    with pytest.raises(LookupError):
+        response_cache.get_or_load("teams", "abbreviation:EGY", fail)
+    assert response_cache.get_or_load("teams", "abbreviation:EGY", Loader({"id": 1})) == {"id": 1}
+
+
+def test_load_racing_an_invalidation_is_not_cached():
+    response_cache = ResponseCache()
+
+    def load_then_invalidate():
+        # A write handler commits and invalidates while this stale value is being read
+        response_cache.invalidate("teams")
+        return ["stale"]
+
+    assert response_cache.get_or_load("teams", "list", load_then_invalidate) == ["stale"]
+    assert response_cache.get_or_load("teams", "list", Loader(["fresh"])) == ["fresh"]
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    response_cache = ResponseCache(ttl=300)
+    load = Loader(["EGY"])
+
+    response_cache.get_or_load("teams", "list", load)
+    now[0] += 299
+    response_cache.get_or_load("teams", "list", load)
+    now[0] += 2
+    response_cache.get_or_load("teams", "list", load)
+
+    assert load.calls == 2
+
+
+def test_lru_backend_evicts_the_least_recently_used_entry():
+    backend = LRUCacheBackend(max_entries=2)
+    backend.set("teams:a", 1, ttl=60)
+    backend.set("teams:b", 2, ttl=60)
+    backend.get("teams:a")
+
+    backend.set("teams:c", 3, ttl=60)
+
+    assert backend.get("teams:b") is None
+    assert (backend.get("teams:a"), backend.get("teams:c")) == (1, 3)
+    assert backend.size() == 2
+
+
+def test_lru_backend_deletes_by_prefix():
+    backend = LRUCacheBackend()
+    for key in ("teams:list", "teams:abbreviation:EGY", "players:team:1"):
+        backend.set(key, key, ttl=60)
+
+    backend.delete_prefix("teams:")
+
+    assert list(backend.entries) == ["players:team:1"]
+
+
+def test_backends_must_implement_get_set_and_delete_prefix():
+    class GetOnlyBackend(CacheBackend):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError, match="delete_prefix.*set"):
+        GetOnlyBackend()
@@ -0,0 +1,93 @@
+"""Pool instrumentation tests, on a SQLite file engine with an instrumented QueuePool."""
+import uuid
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from manage_data.db_pool import InstrumentedQueuePool, instrument, pool_options, pool_status, statement_timeout_args
+
+
+@pytest.fixture
+def make_engine(tmp_path):
+    engines = []
+
+    def make(pool_size: int = 1, max_overflow: int = 0, pool_timeout: float = 0.05):
+        name = f"test-{uuid.uuid4().hex[:8]}"
+        engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=InstrumentedQueuePool,
+                               pool_size=pool_size, max_overflow=max_overflow, pool_timeout=pool_timeout)
+        instrument(engine, max_overflow, name)
+        engines.append(engine)
+        return engine, name
+
+    yield make
+    for engine in engines:
+        engine.dispose()
+
+
+def histogram_count(name: str) -> float:
+    return REGISTRY.get_sample_value("db_pool_checkout_wait_seconds_count", {"pool": name}) or 0
+
+
+def test_checkouts_are_counted_and_timed(make_engine):
+    engine, name = make_engine()
+
+    for _ in range(3):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    status = pool_status(engine)
+    assert (status["checkouts"], status["timeouts"], status["connects"]) == (3, 0, 1)
+    assert 0 <= status["wait_ms"]["p50"] <= status["wait_ms"]["max"]
+    assert histogram_count(name) == 3
+
+
+def test_timed_out_checkout_is_counted_and_observed(make_engine):
+    engine, name = make_engine(pool_size=1, max_overflow=0, pool_timeout=0.05)
+
+    with engine.connect():
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+
+    status = pool_status(engine)
+    assert (status["checkouts"], status["timeouts"]) == (1, 1)
+    # The timed out wait is in the histogram too, in the bucket of pool_timeout
+    assert histogram_count(name) == 2
+    assert REGISTRY.get_sample_value("db_pool_checkout_wait_seconds_bucket", {"pool": name, "le": "0.025"}) == 1
+
+
+def test_connections_beyond_pool_size_are_overflow_connects(make_engine):
+    engine, _ = make_engine(pool_size=1, max_overflow=1)
+
+    with engine.connect(), engine.connect():
+        status = pool_status(engine)
+
+    assert (status["connects"], status["overflow_connects"]) == (2, 1)
+    assert (status["checked_out"], status["overflow"], status["max_overflow"]) == (2, 1, 1)
+
+
+def test_counters_survive_a_dispose(make_engine):
+    engine, _ = make_engine()
+    with engine.connect():
+        pass
+
+    engine.dispose()
+    with engine.connect():
+        pass
+
+    assert pool_status(engine)["checkouts"] == 2
+
+
+def test_pool_options_are_read_from_the_environment(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "20")
+    monkeypatch.setenv("DB_POOL_PRE_PING", "true")
+    monkeypatch.delenv("DB_MAX_OVERFLOW", raising=False)
+
+    options = pool_options()
+
+    assert (options["pool_size"], options["max_overflow"], options["pool_pre_ping"]) == (20, 10, True)
+
+
+def test_statement_timeout_is_passed_as_the_driver_expects():
+    assert statement_timeout_args(0) == {}
+    assert statement_timeout_args(5000) == {"options": "-c statement_timeout=5000"}
+    assert statement_timeout_args(5000, async_engine=True) == {"server_settings": {"statement_timeout": "5000"}}
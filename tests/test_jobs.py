@@ -0,0 +1,144 @@
+"""IngestJobQueue tests, the jobs are plain functions synchronized with events."""
+import contextvars
+import threading
+import time
+import pytest
+from fastapi import HTTPException
+from jobs import IngestJobQueue, QueueFullError
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+def wait_finished(queue: IngestJobQueue, *jobs: dict, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not all(queue.get(job["id"])["finished_at"] for job in jobs):
+        assert time.monotonic() < deadline, "jobs did not finish"
+        time.sleep(0.01)
+
+
+def test_jobs_of_the_same_key_run_in_submission_order():
+    queue = IngestJobQueue(max_workers=4)
+    release = threading.Event()
+    order = []
+
+    def ingest(job, number):
+        if number == 0:
+            release.wait(5)
+        order.append(number)
+
+    jobs = [queue.submit(("champ", "G1.CP"), ingest, number) for number in range(5)]
+    # The first job blocks the others of its key, even with idle workers
+    time.sleep(0.05)
+    assert [queue.get(job["id"])["state"] for job in jobs] == ["running"] + ["queued"] * 4
+
+    release.set()
+    wait_finished(queue, *jobs)
+    assert order == [0, 1, 2, 3, 4]
+
+
+def test_jobs_of_other_keys_run_in_parallel():
+    queue = IngestJobQueue(max_workers=2)
+    both_running = threading.Barrier(2, timeout=5)
+
+    def ingest(job):
+        # Breaks after the timeout unless both jobs reach it
+        both_running.wait()
+
+    jobs = [queue.submit(("champ", file_name), ingest) for file_name in ("G1.CP", "G2.CP")]
+
+    wait_finished(queue, *jobs)
+    assert [queue.get(job["id"])["state"] for job in jobs] == ["succeeded", "succeeded"]
+
+
+def test_job_result_is_merged_into_the_job():
+    queue = IngestJobQueue()
+
+    job = queue.submit(("champ", "G1.CP"), lambda job: {"actions_count": 12}, file_name="G1.CP")
+
+    wait_finished(queue, job)
+    assert job["state"] == "succeeded"
+    assert job["actions_count"] == 12
+    assert job["file_name"] == "G1.CP"
+    assert job["started_at"] <= job["finished_at"]
+
+
+def test_failed_job_keeps_the_error_and_releases_its_key():
+    queue = IngestJobQueue()
+
+    def fail(job):
+        raise HTTPException(status_code=404, detail="Team 'EGY' not found.")
+
+    failed = queue.submit(("champ", "G1.CP"), fail)
+    wait_finished(queue, failed)
+    following = queue.submit(("champ", "G1.CP"), lambda job: None)
+    wait_finished(queue, following)
+
+    assert failed["state"] == "failed"
+    assert failed["error"] == "Team 'EGY' not found."
+    assert following["state"] == "succeeded"
+
+
+def test_full_queue_rejects_new_jobs():
+    queue = IngestJobQueue(max_workers=1, max_pending=2)
+    release = threading.Event()
+
+    def ingest(job):
+        release.wait(5)
+
+    running = queue.submit(("champ", "G1.CP"), ingest)
+    time.sleep(0.05)
+    queued = [queue.submit(("champ", "G1.CP"), lambda job: None) for _ in range(2)]
+    with pytest.raises(QueueFullError):
+        queue.submit(("champ", "G2.CP"), lambda job: None)
+
+    release.set()
+    wait_finished(queue, running, *queued)
+
+
+def test_run_waits_for_the_result_in_the_callers_context():
+    queue = IngestJobQueue()
+    token = request_id.set("request-1")
+    try:
+        result = queue.run(("champ", "G1.CP"), lambda job, since: {"since": since, "request_id": request_id.get()}, 40)
+    finally:
+        request_id.reset(token)
+
+    assert result == {"since": 40, "request_id": "request-1"}
+
+
+def test_run_raises_the_exception_of_the_job():
+    queue = IngestJobQueue()
+
+    def fail(job):
+        raise ValueError("Delta does not continue the stored checkpoint")
+
+    with pytest.raises(ValueError, match="does not continue"):
+        queue.run(("champ", "G1.CP"), fail)
+
+
+def test_run_waits_for_the_jobs_queued_before_it():
+    queue = IngestJobQueue()
+    release = threading.Event()
+    order = []
+
+    def upload(job):
+        release.wait(5)
+        order.append("upload")
+
+    queue.submit(("champ", "G1.CP"), upload)
+    threading.Timer(0.05, release.set).start()
+    queue.run(("champ", "G1.CP"), lambda job: order.append("delta"))
+
+    assert order == ["upload", "delta"]
+
+
+def test_finished_jobs_beyond_max_finished_are_forgotten():
+    queue = IngestJobQueue(max_finished=2)
+
+    jobs = []
+    for number in range(4):
+        jobs.append(queue.submit(("champ", f"G{number}.CP"), lambda job: None))
+        wait_finished(queue, jobs[-1])
+
+    assert queue.get(jobs[0]["id"]) is None
+    assert queue.get(jobs[-1]["id"]) is jobs[-1]
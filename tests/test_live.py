@@ -0,0 +1,86 @@
+"""LiveHub tests, subscribers run on an asyncio loop and ingests publish from threads."""
+import asyncio
+import threading
+from live import LiveHub
+
+SCORE = {"match_id": 1, "team_a_score": {"total": 14}, "team_b_score": {"total": 12}, "status": "1"}
+
+
+def action(pos: int) -> dict:
+    return {"Pos": pos, "Team": "EGY", "NoAct": "G"}
+
+
+async def drain(queue: asyncio.Queue, count: int) -> list:
+    return [await asyncio.wait_for(queue.get(), timeout=5) for _ in range(count)]
+
+
+def test_subscriber_receives_events_published_from_another_thread():
+    hub = LiveHub()
+
+    async def main():
+        queue = hub.subscribe(1)
+        publisher = threading.Thread(target=hub.publish, args=(1, SCORE, [action(1), action(2)]))
+        publisher.start()
+        events = await drain(queue, 3)
+        publisher.join()
+        return events
+
+    assert asyncio.run(main()) == [("score", None, SCORE), ("action", 1, action(1)), ("action", 2, action(2))]
+
+
+def test_subscribers_only_receive_their_match():
+    hub = LiveHub()
+
+    async def main():
+        queue = hub.subscribe(1)
+        hub.publish(2, SCORE)
+        hub.publish(1, actions=[action(5)])
+        return await drain(queue, 1), queue.empty()
+
+    assert asyncio.run(main()) == ([("action", 5, action(5))], True)
+
+
+def test_unsubscribed_queue_receives_nothing():
+    hub = LiveHub()
+
+    async def main():
+        queue = hub.subscribe(1)
+        hub.unsubscribe(1, queue)
+        hub.publish(1, SCORE)
+        await asyncio.sleep(0)
+        return queue.empty()
+
+    assert asyncio.run(main())
+    assert hub.subscribers == {}
+
+
+def test_slow_subscriber_is_ended_instead_of_blocking_the_publisher():
+    hub = LiveHub(queue_size=2)
+
+    async def main():
+        queue = hub.subscribe(1)
+        hub.publish(1, actions=[action(pos) for pos in range(1, 6)])
+        await asyncio.sleep(0)
+        return await drain(queue, queue.qsize())
+
+    assert asyncio.run(main())[-1] is None
+
+
+def test_latest_score_and_buffered_actions_serve_late_subscribers():
+    hub = LiveHub(buffer_size=3)
+    hub.publish(1, SCORE, [action(pos) for pos in range(1, 6)])
+
+    assert hub.latest_score(1) == SCORE
+    assert hub.actions_after(1, 3) == [action(4), action(5)]
+    # The buffer holds Pos 3 to 5, earlier positions must be read from the database
+    assert hub.actions_after(1, 2) is None
+    assert hub.actions_after(2, 0) is None
+
+
+def test_least_recently_published_match_is_dropped_beyond_max_matches():
+    hub = LiveHub(max_matches=2)
+    for match_id in (1, 2, 1, 3):
+        hub.publish(match_id, SCORE)
+
+    assert list(hub.matches) == [1, 3]
+    assert hub.latest_score(2) is None
@@ -0,0 +1,171 @@
+"""CpFileParser tests, parsing only: none of them needs a database."""
+import pytest
+from manage_data.parser import CpContinuityError, CpFileParser, CpIncompleteLineError
+
+HEADER = (
+    "[Definition]\n"
+    "GameInfo=Game;TIDA;TIDB;GStatus\n"
+    "Actions=PLTime;Pos;Team;Nr;NoAct;Text\n"
+    "[GameInfo]\n"
+    "G1;EGY;DEN;1\n"
+    "[Actions]\n"
+)
+
+
+def action_line(pos: int, text: str = "Goal") -> str:
+    return f"{pos // 60:02d}:{pos % 60:02d};{pos};EGY;7;G;{text}\n"
+
+
+def cp_file(count: int, first: int = 1) -> str:
+    return HEADER + "".join(action_line(pos) for pos in range(first, first + count))
+
+
+def positions(data_sections) -> list[int]:
+    return [int(row["Pos"]) for row in data_sections["actions"]]
+
+
+def test_full_parse_returns_every_section_and_a_checkpoint():
+    data_sections, checkpoint = CpFileParser().parse_with_checkpoint(cp_file(5).encode(), "G1.CP", 1)
+
+    assert data_sections["gameinfo"] == [{"Game": "G1", "TIDA": "EGY", "TIDB": "DEN", "GStatus": "1"}]
+    assert positions(data_sections) == [1, 2, 3, 4, 5]
+    assert checkpoint["action_lines_count"] == 5
+    assert checkpoint["actions_start_line"] == HEADER.count("\n") - 1
+
+
+def test_append_only_upload_resumes_from_the_in_memory_state():
+    parser = CpFileParser()
+    parser.parse_with_checkpoint(cp_file(5).encode(), "G1.CP", 1)
+
+    data_sections, checkpoint = parser.parse_with_checkpoint(cp_file(8).encode(), "G1.CP", 1)
+
+    assert positions(data_sections) == [6, 7, 8]
+    assert data_sections["gameinfo"]
+    assert checkpoint["action_lines_count"] == 8
+
+
+def test_append_only_upload_resumes_from_a_persisted_checkpoint():
+    _, checkpoint = CpFileParser().parse_with_checkpoint(cp_file(5).encode(), "G1.CP", 1)
+
+    # Another worker, or the same one after a restart, only has the stored checkpoint
+    data_sections, checkpoint = CpFileParser().parse_with_checkpoint(cp_file(8).encode(), "G1.CP", 1, checkpoint)
+
+    assert positions(data_sections) == [6, 7, 8]
+    assert checkpoint["action_lines_count"] == 8
+
+
+def test_modified_prefix_falls_back_to_a_full_parse():
+    parser = CpFileParser()
+    _, checkpoint = parser.parse_with_checkpoint(cp_file(5).encode(), "G1.CP", 1)
+    changed = cp_file(8).replace(action_line(2), action_line(2, "Corrected"))
+
+    data_sections, new_checkpoint = parser.parse_with_checkpoint(changed.encode(), "G1.CP", 1, checkpoint)
+
+    assert positions(data_sections) == [1, 2, 3, 4, 5, 6, 7, 8]
+    assert data_sections["actions"][1]["Text"] == "Corrected"
+    assert new_checkpoint["prefix_hash"] != checkpoint["prefix_hash"]
+
+
+def test_file_shorter_than_its_checkpoint_is_parsed_in_full():
+    parser = CpFileParser()
+    parser.parse_with_checkpoint(cp_file(5).encode(), "G1.CP", 1)
+
+    data_sections, checkpoint = parser.parse_with_checkpoint(cp_file(3).encode(), "G1.CP", 1)
+
+    assert positions(data_sections) == [1, 2, 3]
+    assert checkpoint["action_lines_count"] == 3
+
+
+def test_delta_continues_the_checkpoint_and_matches_a_full_parse():
+    parser = CpFileParser()
+    _, checkpoint = parser.parse_with_checkpoint(cp_file(5).encode(), "G1.CP", 1)
+
+    data_sections, delta_checkpoint = parser.parse_delta(cp_file(3, first=6)[len(HEADER):].encode(), "G1.CP", 1, since=5, checkpoint=checkpoint)
+
+    assert positions(data_sections) == [6, 7, 8]
+    _, full_checkpoint = CpFileParser().parse_with_checkpoint(cp_file(8).encode(), "G1.CP", 1)
+    assert delta_checkpoint == full_checkpoint
+
+
+def test_delta_with_a_stale_since_is_rejected():
+    parser = CpFileParser()
+    _, checkpoint = parser.parse_with_checkpoint(cp_file(5).encode(), "G1.CP", 1)
+
+    with pytest.raises(CpContinuityError) as error:
+        parser.parse_delta(action_line(7).encode(), "G1.CP", 1, since=6, checkpoint=checkpoint)
+    assert error.value.expected == 5
+
+
+def test_delta_ending_mid_line_is_rejected_and_can_be_resent():
+    parser = CpFileParser()
+    _, checkpoint = parser.parse_with_checkpoint(cp_file(5).encode(), "G1.CP", 1)
+    line = action_line(6)
+
+    with pytest.raises(CpIncompleteLineError):
+        parser.parse_delta(line[:10].encode(), "G1.CP", 1, since=5, checkpoint=checkpoint)
+
+    # Nothing was consumed, the whole line goes with the same since
+    data_sections, checkpoint = parser.parse_delta(line.encode(), "G1.CP", 1, since=5, checkpoint=checkpoint)
+    assert positions(data_sections) == [6]
+    assert checkpoint["action_lines_count"] == 6
+
+
+def test_delta_after_a_restart_is_decoded_with_the_encoding_of_the_checkpoint():
+    texts = ["Gól Nováka", "Žlutá karta", "Střela mimo", "Úspěšná obrana", "Dvouminutový trest"]
+    content = HEADER + "".join(action_line(pos, text) for pos, text in enumerate(texts, 1))
+    _, checkpoint = CpFileParser().parse_with_checkpoint(content.encode("cp1250"), "G1.CP", 1)
+    assert checkpoint["encoding"].lower() == "windows-1250"
+
+    # Guessed from these bytes alone, the delta would be decoded as cp1006
+    data_sections, delta_checkpoint = CpFileParser().parse_delta(action_line(6, "Šťastný gól").encode("cp1250"), "G1.CP", 1, since=5, checkpoint=checkpoint)
+
+    assert [row["Text"] for row in data_sections["actions"]] == ["Šťastný gól"]
+    assert delta_checkpoint["encoding"] == checkpoint["encoding"]
+
+
+def chunked(content: bytes, size: int) -> list[bytes]:
+    return [content[i:i + size] for i in range(0, len(content), size)]
+
+
+def test_stream_yields_the_rows_of_a_full_parse_in_file_order():
+    content = cp_file(20).encode()
+    expected, expected_checkpoint = CpFileParser().parse_with_checkpoint(content, "G1.CP", 1)
+
+    rows, checkpoint = CpFileParser().parse_stream(chunked(content, 16), "G1.CP", 1)
+    rows = list(rows)
+
+    assert [section for section, _ in rows] == ["gameinfo"] + ["actions"] * 20
+    assert [row for section, row in rows if section == "actions"] == expected["actions"]
+    # Filled in once the rows are exhausted
+    assert checkpoint == expected_checkpoint
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 64])
+def test_stream_decodes_utf16_split_inside_characters(size):
+    # Odd chunk sizes split the two-byte code units, and the BOM, across chunks
+    text = cp_file(3).replace("Goal", "Γκολ Ø")
+    content = text.encode("utf-16")
+
+    rows, checkpoint = CpFileParser().parse_stream(chunked(content, size), "G1.CP", 1)
+    actions = [row for section, row in rows if section == "actions"]
+
+    assert [action["Text"] for action in actions] == ["Γκολ Ø"] * 3
+    assert checkpoint["action_lines_count"] == 3
+
+
+def test_stream_keeps_a_line_split_across_chunks_whole():
+    content = cp_file(2).encode()
+    # Split in the middle of the last action line
+    split = len(content) - 8
+
+    rows, _ = CpFileParser().parse_stream([content[:split], content[split:]], "G1.CP", 1)
+
+    assert [row["Text"] for section, row in rows if section == "actions"] == ["Goal", "Goal"]
+
+
+def test_stream_resumes_from_a_checkpoint_like_a_full_parse():
+    _, checkpoint = CpFileParser().parse_with_checkpoint(cp_file(5).encode(), "G1.CP", 1)
+
+    rows, _ = CpFileParser().parse_stream(chunked(cp_file(8).encode(), 10), "G1.CP", 1, checkpoint)
+
+    assert [int(row["Pos"]) for section, row in rows if section == "actions"] == [6, 7, 8]
@@ -0,0 +1,57 @@
+"""ProfileStore tests, profiles are written to a temporary directory."""
+import pytest
+from profiling import ProfileStore
+
+
+def fail_to_save(*args, **meta):
+    raise OSError("No space left on device")
+
+
+def test_capture_saves_a_profile(tmp_path):
+    store = ProfileStore(str(tmp_path))
+
+    with store.capture(True, file_name="G1.CP") as captured:
+        sum(range(1000))
+
+    assert captured["id"]
+    assert store.path(captured["id"])
+    assert [profile["file_name"] for profile in store.list()] == ["G1.CP"]
+
+
+def test_disabled_capture_saves_nothing(tmp_path):
+    store = ProfileStore(str(tmp_path))
+
+    with store.capture(False) as captured:
+        pass
+
+    assert captured["id"] is None
+    assert store.list() == []
+
+
+def test_trim_keeps_the_last_profiles(tmp_path):
+    store = ProfileStore(str(tmp_path), max_profiles=2)
+
+    for _ in range(3):
+        with store.capture(True):
+            pass
+
+    assert len(store.list()) == 2
+
+
+def test_failed_save_does_not_fail_the_profiled_block(tmp_path, monkeypatch):
+    store = ProfileStore(str(tmp_path))
+    monkeypatch.setattr(store, "_save", fail_to_save)
+
+    with store.capture(True) as captured:
+        pass
+
+    assert captured["id"] is None
+
+
+def test_failed_save_keeps_the_error_of_the_profiled_block(tmp_path, monkeypatch):
+    store = ProfileStore(str(tmp_path))
+    monkeypatch.setattr(store, "_save", fail_to_save)
+
+    with pytest.raises(KeyError):
+        with store.capture(True):
+            raise KeyError("G1")
@@ -0,0 +1,68 @@
+"""Query counting tests, on an in-memory SQLite engine."""
+import pytest
+from sqlalchemy import create_engine, text
+from manage_data.query_counter import assert_max_queries, count_queries, track_queries
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    track_queries(engine)
+    yield engine
+    engine.dispose()
+
+
+def run_queries(engine, count: int) -> None:
+    with engine.connect() as conn:
+        for i in range(count):
+            conn.execute(text("SELECT :i"), {"i": i})
+
+
+def test_count_queries_counts_the_statements_of_a_tracked_engine(engine):
+    with count_queries() as queries:
+        run_queries(engine, 3)
+
+    assert queries.count == 3
+    assert queries.duration > 0
+    assert queries.summary()["count"] == 3
+
+
+def test_statements_outside_count_queries_are_not_counted(engine):
+    run_queries(engine, 2)
+
+    with count_queries() as queries:
+        run_queries(engine, 1)
+
+    assert queries.count == 1
+
+
+def test_nested_counters_count_for_their_parents(engine):
+    with count_queries() as outer:
+        run_queries(engine, 1)
+        with count_queries() as inner:
+            run_queries(engine, 2)
+
+    assert inner.count == 2
+    assert outer.count == 3
+
+
+def test_untracked_engines_are_not_counted():
+    engine = create_engine("sqlite://")
+
+    with count_queries() as queries:
+        run_queries(engine, 2)
+
+    assert queries.count == 0
+
+
+def test_assert_max_queries_passes_within_the_limit(engine):
+    with assert_max_queries(2) as queries:
+        run_queries(engine, 2)
+
+    assert queries.statements == ["SELECT ?", "SELECT ?"]
+
+
+def test_assert_max_queries_fails_with_the_statements_over_the_limit(engine):
+    with pytest.raises(AssertionError, match=r"3 queries run, at most 2 expected:\n  SELECT \?"):
+        with assert_max_queries(2):
+            run_queries(engine, 3)
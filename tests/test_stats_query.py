@@ -0,0 +1,93 @@
+"""Stats aggregate tests: the filter parsing and the compiled query, then the endpoint on an ingested match.
+
+stats_query imports the ORM, so these tests are skipped when no database is configured.
+"""
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.dialects import postgresql
+from test_api_queries import stored_match  # noqa: F401, module fixture
+
+
+@pytest.fixture
+def stats_query():
+    from sqlalchemy.exc import OperationalError
+    try:
+        from manage_data import stats_query
+    except RuntimeError as e:
+        pytest.skip(f"No database configured: {e}")
+    except OperationalError as e:
+        pytest.skip(f"Database unreachable: {e.orig}")
+    return stats_query
+
+
+def compiled(query):
+    return query.compile(dialect=postgresql.dialect())
+
+
+@pytest.mark.parametrize("expression, parsed", [
+    ("all_goals>=5", ("all_goals", ">=", 5)),
+    (" all_goals != 0 ", ("all_goals", "!=", 0)),
+    ("shots_efficiency<-0.5", ("shots_efficiency", "<", -0.5)),
+])
+def test_filter_is_split_into_key_operator_and_value(stats_query, expression, parsed):
+    assert stats_query.parse_stat_filter(expression, stats_query.STAT_SOURCES["player"]) == parsed
+
+
+@pytest.mark.parametrize("expression, detail", [
+    ("all_goals", "Invalid filter"),
+    ("all_goals=>5", "Invalid filter"),
+    ("all_goals>=five", "Invalid filter"),
+    ("all_goals>=5; DROP TABLE players", "Invalid filter"),
+    ("stats->>'x'>=1", "Invalid filter"),
+    ("goals_7m>=1", "Unknown stat 'goals_7m'"),
+])
+def test_invalid_filter_is_rejected(stats_query, expression, detail):
+    with pytest.raises(HTTPException) as raised:
+        stats_query.parse_stat_filter(expression, stats_query.STAT_SOURCES["player"])
+
+    assert raised.value.status_code == 400
+    assert detail in raised.value.detail
+
+
+@pytest.mark.parametrize("arguments, detail", [
+    (("coach", "all_goals", "sum", "team"), "Unknown source"),
+    (("player", "goals_7m", "sum", "player"), "Unknown player stat"),
+    (("player", "all_goals", "median", "player"), "Unknown aggregate"),
+    (("team", "all_goals", "sum", "player"), "Cannot group team stats by 'player'"),
+])
+def test_invalid_query_is_rejected(stats_query, arguments, detail):
+    with pytest.raises(HTTPException) as raised:
+        stats_query.aggregate_stats_query(*arguments)
+
+    assert detail in raised.value.detail
+
+
+def test_equality_filter_on_player_stats_uses_the_gin_index(stats_query):
+    query = compiled(stats_query.aggregate_stats_query("player", "all_goals", "sum", "team", ["red_cards=0", "all_goals>=2"], championship_id=1))
+    sql = str(query)
+
+    assert "stat_rows.stats @> %(" in sql
+    assert {"red_cards": 0} in query.params.values()
+    # The other operators compare the stat cast to its type
+    assert "AS INTEGER) >= %(" in sql
+    assert "GROUP BY teams.id" in sql
+
+
+def test_team_stats_union_both_sides_of_a_match(stats_query):
+    sql = str(compiled(stats_query.aggregate_stats_query("team", "all_efficiency", "avg", "championship")))
+
+    assert "UNION ALL" in sql
+    assert "AS FLOAT" in sql
+    assert "GROUP BY championships.id" in sql
+
+
+def test_aggregate_endpoint_groups_the_stored_stats(api, stored_match):
+    championship = stored_match["championship_id"]
+
+    by_team = api.get_json(f"/stats/aggregate?stat=all_goals&group_by=team&championship_id={championship}")
+    filtered = api.get_json(f"/stats/aggregate?stat=all_goals&group_by=team&championship_id={championship}&filter=all_goals%3E%3D3")
+    status, _, _ = api.get(f"/stats/aggregate?stat=all_goals&filter=all_goals%3E%3Dfive&championship_id={championship}")
+
+    assert sorted((row["value"], row["matches"]) for row in by_team) == [(6, 3), (6, 3)]
+    assert filtered == []
+    assert status == 400
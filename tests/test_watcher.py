@@ -0,0 +1,169 @@
+"""CpFolderWatcher tests, with Champ replaced by a recorder and the clock set by the tests.
+
+The watcher module imports the ORM, so these tests are skipped when no database is configured.
+"""
+import pytest
+from test_api_queries import cp_file
+
+
+class RecordingChamp:
+    """Stands in for Champ, keeping the sections it was asked to store."""
+
+    applied = []
+
+    def __init__(self, id, session, hub=None, cache=None):
+        self.hub, self.cache = hub, cache
+
+    def load_checkpoint(self, file_name):
+        return None
+
+    def process_data(self, parsed_data, file_name, checkpoint):
+        self.applied.append({"file_name": file_name, "actions": parsed_data.get("actions", []), "game_info": parsed_data.get("game_info"),
+                             "hub": self.hub, "cache": self.cache})
+
+
+class FakeSession:
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def watcher_module(monkeypatch):
+    from sqlalchemy.exc import OperationalError
+    try:
+        from manage_data import watcher
+    except RuntimeError as e:
+        pytest.skip(f"No database configured: {e}")
+    except OperationalError as e:
+        pytest.skip(f"Database unreachable: {e.orig}")
+    RecordingChamp.applied = []
+    monkeypatch.setattr(watcher, "Champ", RecordingChamp)
+    return watcher
+
+
+@pytest.fixture
+def clock(watcher_module, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(watcher_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def make_watcher(watcher_module, directory, **options):
+    return watcher_module.CpFolderWatcher(FakeSession, 1, directory, interval=0.1, debounce=0.2, max_delay=0.7, **options)
+
+
+def test_file_is_applied_once_it_stays_unchanged_for_the_debounce(watcher_module, clock, tmp_path):
+    watcher = make_watcher(watcher_module, tmp_path)
+    (tmp_path / "G1.CP").write_bytes(cp_file("G1", "EGY", "FRA", actions=5))
+
+    watcher.poll()
+    clock[0] += 0.1
+    watcher.poll()
+    assert RecordingChamp.applied == []
+
+    clock[0] += 0.1
+    watcher.poll()
+    assert [len(applied["actions"]) for applied in RecordingChamp.applied] == [5]
+
+
+def test_file_that_keeps_changing_is_applied_after_the_max_delay(watcher_module, clock, tmp_path):
+    watcher = make_watcher(watcher_module, tmp_path)
+    path = tmp_path / "G1.CP"
+
+    for actions in range(1, 8):
+        path.write_bytes(cp_file("G1", "EGY", "FRA", actions=actions))
+        watcher.poll()
+        assert RecordingChamp.applied == []
+        clock[0] += 0.1
+
+    path.write_bytes(cp_file("G1", "EGY", "FRA", actions=8))
+    watcher.poll()
+    assert [len(applied["actions"]) for applied in RecordingChamp.applied] == [8]
+
+
+def test_appended_actions_are_applied_as_a_delta(watcher_module, clock, tmp_path):
+    watcher = make_watcher(watcher_module, tmp_path)
+    path = tmp_path / "G1.CP"
+    path.write_bytes(cp_file("G1", "EGY", "FRA", actions=5))
+    watcher.poll()
+    clock[0] += 0.2
+    watcher.poll()
+
+    path.write_bytes(cp_file("G1", "EGY", "FRA", actions=8))
+    watcher.poll()
+    clock[0] += 0.2
+    watcher.poll()
+
+    delta = RecordingChamp.applied[-1]
+    assert [action["Pos"] for action in delta["actions"]] == ["6", "7", "8"]
+    # The header did not change, so it is not parsed again
+    assert not delta["game_info"]
+
+
+def test_line_still_being_written_is_left_for_the_next_poll(watcher_module, clock, tmp_path):
+    watcher = make_watcher(watcher_module, tmp_path)
+    path = tmp_path / "G1.CP"
+    path.write_bytes(cp_file("G1", "EGY", "FRA", actions=5))
+    watcher.poll()
+    clock[0] += 0.2
+    watcher.poll()
+
+    complete = cp_file("G1", "EGY", "FRA", actions=6)
+    path.write_bytes(complete[:-10])
+    watcher.poll()
+    clock[0] += 0.2
+    watcher.poll()
+    assert len(RecordingChamp.applied) == 1
+
+    path.write_bytes(complete)
+    watcher.poll()
+    clock[0] += 0.2
+    watcher.poll()
+    assert [action["Pos"] for action in RecordingChamp.applied[-1]["actions"]] == ["6"]
+
+
+def test_rewritten_file_is_parsed_in_full(watcher_module, clock, tmp_path):
+    watcher = make_watcher(watcher_module, tmp_path)
+    path = tmp_path / "G1.CP"
+    path.write_bytes(cp_file("G1", "EGY", "FRA", actions=5))
+    watcher.poll()
+    clock[0] += 0.2
+    watcher.poll()
+
+    # The scoring software corrected an earlier action line
+    path.write_bytes(cp_file("G1", "EGY", "FRA", actions=5).replace(b";G;Goal", b";M;Miss"))
+    watcher.poll()
+    clock[0] += 0.2
+    watcher.poll()
+
+    assert [action["NoAct"] for action in RecordingChamp.applied[-1]["actions"]] == ["M"] * 5
+
+
+def test_touched_file_with_the_same_content_is_not_applied_again(watcher_module, clock, tmp_path):
+    watcher = make_watcher(watcher_module, tmp_path)
+    path = tmp_path / "G1.CP"
+    content = cp_file("G1", "EGY", "FRA", actions=5)
+    path.write_bytes(content)
+    watcher.poll()
+    clock[0] += 0.2
+    watcher.poll()
+
+    path.write_bytes(content)
+    watcher.files["G1.CP"]["mtime_ns"] = None
+    watcher.poll()
+    clock[0] += 0.2
+    watcher.poll()
+
+    assert len(RecordingChamp.applied) == 1
+
+
+def test_hub_and_cache_are_handed_to_champ(watcher_module, clock, tmp_path):
+    hub, cache = object(), object()
+    watcher = make_watcher(watcher_module, tmp_path, hub=hub, cache=cache)
+    (tmp_path / "G1.CP").write_bytes(cp_file("G1", "EGY", "FRA", actions=5))
+
+    watcher.poll()
+    clock[0] += 0.2
+    watcher.poll()
+
+    assert (RecordingChamp.applied[0]["hub"], RecordingChamp.applied[0]["cache"]) == (hub, cache)